@@ -32,3 +32,80 @@ class Vote:
 
     def __repr__(self):
         return f"<Vote: {self.candidates}>"
+
+
+class Ballots:
+    """Votes collapsed into their distinct rankings, each paired with the number
+    of votes that cast it. Iterating yields (ranking, count) tuples in the order
+    the rankings were first seen.
+    """
+
+    # Marks stores of (ranking, count) pairs, which as_ballots passes through
+    is_ballot_store = True
+
+    def __init__(self, votes: typing.Iterable[Vote] = ()):
+        self.counts: typing.Dict[typing.Tuple[str, ...], int] = {}
+        self.num_votes = 0
+        for vote in votes:
+            self.add(vote.candidates)
+
+    def add(self, candidates: typing.Sequence[str], count=1):
+        ranking = tuple(candidates)
+        if ranking not in self.counts:
+            Vote(ranking)  # Validate each distinct ranking once
+            self.counts[ranking] = 0
+        self.counts[ranking] += count
+        self.num_votes += count
+
+    def update(
+        self, ballots: typing.Iterable[typing.Tuple[typing.Sequence[str], int]]
+    ):
+        """Add the votes of another ballot store, e.g. to merge the ballots of
+        several precincts. Merging gives the same counts in any order.
+        """
+
+        for ranking, count in ballots:
+            self.add(ranking, count)
+
+    @property
+    def num_rankings(self):
+        return len(self.counts)
+
+    def shards(self, num_shards, min_size=1) -> typing.List["Ballots"]:
+        """Split the rankings, in order, into up to num_shards Ballots of at
+        least min_size rankings each. Too few rankings give just this Ballots.
+        """
+
+        num_shards = min(num_shards, len(self.counts) // min_size)
+        if num_shards <= 1:
+            return [self]
+        rankings = list(self.counts.items())
+        shards = []
+        for i in range(num_shards):
+            start = len(rankings) * i // num_shards
+            end = len(rankings) * (i + 1) // num_shards
+            shard = Ballots()
+            shard.counts = dict(rankings[start:end])  # Already validated
+            shard.num_votes = sum(shard.counts.values())
+            shards.append(shard)
+        return shards
+
+    def __iter__(self) -> typing.Iterator[typing.Tuple[typing.Tuple[str, ...], int]]:
+        return iter(self.counts.items())
+
+    def __len__(self):
+        return self.num_votes
+
+    def __repr__(self):
+        return f"<Ballots: {len(self.counts)} rankings, {self.num_votes} votes>"
+
+
+def as_ballots(votes: typing.Union[Ballots, typing.Iterable[Vote]]) -> Ballots:
+    """Collapse Vote objects, from a list or any other iterable, into Ballots.
+    Ballot stores, such as Ballots or votecount.arrays.RankMatrix, are returned
+    as they are.
+    """
+
+    if getattr(votes, "is_ballot_store", False):
+        return votes
+    return Ballots(votes)
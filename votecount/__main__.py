@@ -1,92 +1,612 @@
+"""Command line interface. The modules of the subcommands, and of the counting
+systems, are imported only when used, so that starting the program stays fast.
+"""
+
 import argparse
-import re
+import json
+import sys
 
-from . import Candidate, Vote, explain
-from .borda import borda
-from .borda_even import borda_even
-from .borda_exp import borda_exp
-from .condorcet import condorcet
-from .dowdall import dowdall
-from .stv import stv, stv_repeat
+from . import explain
+from .batch import count_systems, results_table
+from .blt import (
+    BLTElection,
+    BLTError,
+    is_blt_file,
+    read_blt,
+    read_blt_header,
+    write_blt,
+)
+from .cache import (
+    SUFFIX,
+    file_hash,
+    load_election,
+    merge_elections,
+    read_input_file,
+    write_ballot_file,
+)
+from .profiling import Profile, phase
+from .systems import SYSTEMS, invalid_options
+from .trace import PrintTrace
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        prog="votecount",
-        description="Calculate the results of a ranked voting election.",
+def _positive_int(value) -> int:
+    """argparse type of options such as --jobs, which must be at least 1."""
+
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {number}")
+    return number
+
+
+def _options_parser() -> argparse.ArgumentParser:
+    """Parent parser of the counting options that every subcommand counting
+    elections takes.
+    """
+
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--max-per-vote",
+        type=int,
+        help="Limit the number of listed candidates per vote. Ignored for some "
+        "voting systems.",
     )
     parser.add_argument(
-        "system",
-        type=str,
+        "--weight",
+        type=float,
         help=(
-            "Vote counting system. One of stv, stv_repeat, borda, borda_exp, "
-            "borda_even, condorcet, dowdall."
+            "Custom weighting factor for voting systems such as borda_exp. "
+            "Intended to be <1."
         ),
     )
+    return parser
+
+
+def _election_parser(system, **kwargs) -> argparse.ArgumentParser:
+    """Parent parser of the system argument, named and described by system and
+    kwargs, the seats and input file of a subcommand counting one election, and
+    the counting options.
+    """
+
+    parser = argparse.ArgumentParser(add_help=False, parents=[_options_parser()])
+    parser.add_argument(system, **kwargs)
     parser.add_argument(
         "num_seats",
         type=int,
+        nargs="?",
         help=(
             "Number of seats to fill / winners to pick. Ignored for some "
-            "voting systems"
+            "voting systems. Defaults to the seats in the header of a BLT file."
         ),
     )
     parser.add_argument(
         "input_file", help="path to input file with candidates and votes"
     )
+    return parser
+
+
+def _check_options(parser, systems, args):
+    """Check the systems and options of a subcommand counting one election,
+    taking the seats from the header of a BLT input file if not given.
+    """
+
+    if args.num_seats is None:
+        if not is_blt_file(args.input_file):
+            parser.error("num_seats is required unless input_file is a BLT file")
+        try:
+            args.num_seats = read_blt_header(args.input_file)[1]
+        except (OSError, BLTError) as e:
+            parser.error(str(e))
+    error = invalid_options(systems, args.num_seats, args.weight)
+    if error:
+        parser.error(error)
+
+
+def convert(argv):
+    parser = argparse.ArgumentParser(
+        prog="votecount convert",
+        description=(
+            "Convert an election file to a binary ballot file, which loads much "
+            "faster. Ballot files can be given wherever an input file is expected. "
+            "An output file ending in .blt is written in the BLT format instead."
+        ),
+    )
     parser.add_argument(
-        "--explain", action="store_true", help="explain how the result was arrived at"
+        "input_file", help="path to input file with candidates and votes"
     )
     parser.add_argument(
-        "--max-per-vote",
+        "output_file",
+        nargs="?",
+        help=f"path to the ballot file to write. Defaults to input_file + {SUFFIX}",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=_positive_int,
+        default=1,
+        metavar="N",
+        help="Number of worker processes to use for reading the input file.",
+    )
+    parser.add_argument(
+        "--num-seats",
         type=int,
-        help="Limit the number of listed candidates per vote. Ignored for some "
-        "voting systems.",
+        metavar="N",
+        help=(
+            "Number of seats written to a BLT file. Default: those of a BLT input "
+            "file, or 1."
+        ),
     )
     parser.add_argument(
-        "--weight",
+        "--title",
+        help="Title written to a BLT file. Default: that of a BLT input file.",
+    )
+    args = parser.parse_args(argv)
+
+    if args.output_file and is_blt_file(args.output_file):
+        if is_blt_file(args.input_file):
+            # Keep the seats, title and withdrawn candidates of the source
+            election = read_blt(args.input_file)
+        else:
+            election = BLTElection(
+                *load_election(args.input_file, jobs=args.jobs, use_cache=False),
+                num_seats=1,
+                title="",
+                withdrawn=[],
+            )
+        write_blt(
+            args.output_file,
+            election.candidates,
+            election.ballots,
+            election.num_seats if args.num_seats is None else args.num_seats,
+            election.title if args.title is None else args.title,
+            election.withdrawn,
+        )
+        return
+
+    candidates, votes = read_input_file(args.input_file, jobs=args.jobs)
+    write_ballot_file(
+        args.output_file or args.input_file + SUFFIX,
+        candidates,
+        votes,
+        file_hash(args.input_file),
+    )
+
+
+def merge(argv):
+    parser = argparse.ArgumentParser(
+        prog="votecount merge",
+        description=(
+            "Merge the votes of several elections, e.g. per-precinct input or "
+            "ballot files, into one ballot file, which can then be counted."
+        ),
+    )
+    parser.add_argument("output_file", help="path to the ballot file to write")
+    parser.add_argument(
+        "input_files",
+        nargs="+",
+        metavar="input_file",
+        help="path to input or ballot file with candidates and votes",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory to cache parsed input files in, as when counting.",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Neither use nor write the cache."
+    )
+    args = parser.parse_args(argv)
+
+    candidates, votes = merge_elections(
+        args.input_files, use_cache=not args.no_cache, cache_dir=args.cache_dir
+    )
+    write_ballot_file(args.output_file, candidates, votes)
+
+
+def live(argv):
+    parser = argparse.ArgumentParser(
+        prog="votecount live",
+        description=(
+            "Count an election while votes are appended to its input file, "
+            "printing updated results after each batch. Invalid votes are skipped "
+            "and reported on standard error. Stop with Ctrl-C."
+        ),
+        parents=[
+            _election_parser(
+                "systems", help="Comma-separated vote counting systems, or all."
+            )
+        ],
+    )
+    parser.add_argument(
+        "--interval",
         type=float,
-        help=(
-            "Custom weighting factor for voting systems such as borda_exp. "
-            "Intended to be <1."
+        default=1.0,
+        metavar="SECONDS",
+        help="How often to check the input file for new votes. Default: 1.",
+    )
+    args = parser.parse_args(argv)
+
+    systems = list(SYSTEMS) if args.systems == "all" else args.systems.split(",")
+    _check_options(parser, systems, args)
+
+    from .live import live_count
+
+    def skipped(line_nr, line, error):
+        print(f"Skipped line {line_nr}: {error}", file=sys.stderr, flush=True)
+
+    try:
+        for num_votes, results in live_count(
+            args.input_file,
+            systems,
+            args.num_seats,
+            interval=args.interval,
+            on_error=skipped,
+            max_per_vote=args.max_per_vote,
+            weight=args.weight,
+        ):
+            print(f"======== {num_votes} votes ========")
+            print(results_table(results), flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+def serve(argv):
+    parser = argparse.ArgumentParser(
+        prog="votecount serve",
+        description=(
+            "Keep elections loaded and count them on request, reading one JSON "
+            'request per line, such as {"path": "election.txt", "system": "stv", '
+            '"num_seats": 5}, and answering each with one JSON line. Stop with '
+            "Ctrl-C."
         ),
     )
-    args = parser.parse_args()
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument("--socket", metavar="PATH", help="Listen on a Unix socket.")
+    where.add_argument(
+        "--port", type=int, help="Listen on a TCP port on localhost (127.0.0.1)."
+    )
+    parser.add_argument(
+        "--max-elections",
+        type=int,
+        default=8,
+        metavar="N",
+        help="Keep at most N elections loaded. Default: 8.",
+    )
+    parser.add_argument(
+        "--max-rankings",
+        type=int,
+        metavar="N",
+        help="Keep at most N distinct rankings loaded, across all elections.",
+    )
+    args = parser.parse_args(argv)
 
-    with open(args.input_file) as input_file:
-        input_rows = input_file.readlines()
+    import asyncio
 
-    candidates_row = input_rows.pop(0).split()
-    votes_rows = []
-    for row in input_rows:
-        row = re.sub(r"^.*:\s*", "", row)  # Remove voter label
-        votes_rows.append(row.split())
+    from . import server
 
-    candidates = [Candidate(id) for id in candidates_row]
-    votes = [Vote(candidates) for candidates in votes_rows]
+    try:
+        asyncio.run(
+            server.serve(args.socket, args.port, args.max_elections, args.max_rankings)
+        )
+    except KeyboardInterrupt:
+        pass
 
-    system_func = {
-        "stv": stv,
-        "stv_repeat": stv_repeat,
-        "borda": borda,
-        "dowdall": dowdall,
-        "borda_exp": borda_exp,
-        "borda_even": borda_even,
-        "condorcet": condorcet,
-    }[args.system]
 
-    winners = system_func(
+def resample(argv):
+    parser = argparse.ArgumentParser(
+        prog="votecount resample",
+        description=(
+            "Count bootstrap samples of an election, drawn with replacement from "
+            "its votes, and print how often each candidate won, with a confidence "
+            "interval, to tell how robust the result is."
+        ),
+        parents=[_election_parser("system", help="Vote counting system.")],
+    )
+    parser.add_argument(
+        "--samples",
+        type=int,
+        default=1000,
+        metavar="N",
+        help="Number of samples to count. Default: 1000.",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the samples. Default: 0."
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        default=0.95,
+        help="Confidence level of the intervals, between 0 and 1. Default: 0.95.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=_positive_int,
+        default=1,
+        metavar="N",
+        help="Number of worker processes to count the samples in.",
+    )
+    parser.add_argument(
+        "--numpy",
+        action="store_true",
+        help="Hold the ballots in NumPy arrays, which also draws samples faster.",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Neither use nor write the cache."
+    )
+    args = parser.parse_args(argv)
+
+    _check_options(parser, [args.system], args)
+    if args.samples < 1:
+        parser.error("--samples must be at least 1")
+    if not 0 < args.confidence < 1:
+        parser.error("--confidence must be between 0 and 1")
+
+    from .bootstrap import bootstrap, frequency_table
+
+    candidates, votes = load_election(
+        args.input_file, use_numpy=args.numpy, use_cache=not args.no_cache
+    )
+    frequencies = bootstrap(
+        args.system,
         args.num_seats,
         candidates,
         votes,
-        do_explain=args.explain,
+        num_samples=args.samples,
+        seed=args.seed,
+        confidence=args.confidence,
+        jobs=args.jobs,
+        max_per_vote=args.max_per_vote,
+        weight=args.weight,
+    )
+    print(frequency_table(frequencies))
+
+
+def batch(argv):
+    parser = argparse.ArgumentParser(
+        prog="votecount batch",
+        description=(
+            "Count many elections in a pool of worker processes, printing one JSON "
+            "line with the winners, or the error, of each as soon as it is counted. "
+            "Exits with status 1 if any election could not be counted."
+        ),
+        parents=[_options_parser()],
+    )
+    parser.add_argument(
+        "sources",
+        nargs="+",
+        metavar="SOURCE",
+        help=(
+            "Directory of input files, glob pattern, or manifest (.jsonl) with one "
+            'election per line, such as {"path": "board.txt", "system": "stv", '
+            '"num_seats": 3}, overriding the options below.'
+        ),
+    )
+    parser.add_argument("--system", help="Vote counting system of each election.")
+    parser.add_argument(
+        "--num-seats",
+        type=int,
+        metavar="N",
+        help="Number of seats to fill / winners to pick in each election.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=_positive_int,
+        metavar="N",
+        help="Number of worker processes. Default: the number of CPUs.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help=(
+            "Directory to cache parsed input files in. By default, they are cached "
+            f"next to the input file, with the suffix {SUFFIX}."
+        ),
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Neither use nor write the cache."
+    )
+    args = parser.parse_args(argv)
+
+    from . import runner
+
+    try:
+        jobs = runner.find_jobs(
+            args.sources, args.system, args.num_seats, args.max_per_vote, args.weight
+        )
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    failed = False
+    for record in runner.run_jobs(
+        jobs, args.jobs, use_cache=not args.no_cache, cache_dir=args.cache_dir
+    ):
+        failed = failed or "error" in record
+        print(json.dumps(record), flush=True)
+    if failed:
+        sys.exit(1)
+
+
+class _ListSystems(argparse.Action):
+    """Print the available systems and exit, like --version."""
+
+    def __init__(self, option_strings, dest, **kwargs):
+        super().__init__(
+            option_strings, dest, nargs=0, default=argparse.SUPPRESS, **kwargs
+        )
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        for system in SYSTEMS:
+            print(f"{system}\t{SYSTEMS.declared(system)}")
+        parser.exit()
+
+
+def count(argv):
+    parser = argparse.ArgumentParser(
+        prog="votecount",
+        description="Calculate the results of a ranked voting election.",
+        parents=[
+            _election_parser(
+                "system",
+                type=str,
+                nargs="?",
+                help=(
+                    "Vote counting system, such as stv, borda or schulze. See "
+                    "--list-systems."
+                ),
+            )
+        ],
+    )
+    parser.add_argument(
+        "--list-systems",
+        action=_ListSystems,
+        help="List the available vote counting systems, with their modules, and exit.",
+    )
+    parser.add_argument(
+        "--systems",
+        metavar="SYSTEMS",
+        help=(
+            "Instead of a single system, count with each of these comma-separated "
+            "systems, or all of them, and print a table of their results."
+        ),
+    )
+    parser.add_argument(
+        "--explain", action="store_true", help="explain how the result was arrived at"
+    )
+    parser.add_argument(
+        "--explain-every",
+        type=int,
+        default=1,
+        metavar="N",
+        help="With --explain, only show running standings every N votes.",
+    )
+    parser.add_argument(
+        "--tiebreaker",
+        choices=["condorcet", "schulze", "ranked_pairs"],
+        default="condorcet",
+        help=(
+            "Primary STV tiebreaker: the number of head-to-head wins (default), or "
+            "of candidates beaten by the Schulze or Ranked Pairs method."
+        ),
+    )
+    parser.add_argument(
+        "--bulk-exclusion",
+        action="store_true",
+        help=(
+            "In STV, eliminate at once all the lowest candidates whose combined "
+            "votes cannot overtake the next candidate up, instead of one per round."
+        ),
+    )
+    parser.add_argument(
+        "--numpy",
+        action="store_true",
+        help="Hold the ballots in NumPy arrays and count with vectorized operations.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=_positive_int,
+        default=1,
+        metavar="N",
+        help=(
+            "Number of worker processes to use for reading large input files and "
+            "computing the pairwise and average index statistics of large elections."
+        ),
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help=(
+            "Directory to cache parsed input files in. By default, they are cached "
+            f"next to the input file, with the suffix {SUFFIX}."
+        ),
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Neither use nor write the cache."
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help=(
+            "Write the time, CPU time and memory growth of each phase of the count, "
+            "and of each STV round, to FILE as JSON. - writes to standard error."
+        ),
+    )
+    args = parser.parse_args(argv)
+    if args.systems and args.system and args.num_seats is None:
+        # "--systems SYSTEMS N input_file" fills the optional system first
+        try:
+            args.system, args.num_seats = None, int(args.system)
+        except ValueError:
+            pass
+
+    if args.systems == "all":
+        systems = list(SYSTEMS)
+    elif args.systems:
+        systems = args.systems.split(",")
+    elif args.system:
+        systems = [args.system]
+    else:
+        parser.error("either system or --systems is required")
+    if args.system and args.systems:
+        parser.error("system and --systems are mutually exclusive")
+    _check_options(parser, systems, args)
+
+    profile = Profile() if args.profile else None
+    with phase(profile, "load", path=args.input_file) as record:
+        candidates, votes = load_election(
+            args.input_file,
+            jobs=args.jobs,
+            use_numpy=args.numpy,
+            use_cache=not args.no_cache,
+            cache_dir=args.cache_dir,
+        )
+        record.update(
+            candidates=len(candidates), rankings=votes.num_rankings, votes=len(votes)
+        )
+
+    options = dict(
+        trace=PrintTrace(sample_every=args.explain_every) if args.explain else None,
+        profile=profile,
         max_per_vote=args.max_per_vote,
         weight=args.weight,
+        jobs=args.jobs,
+        bulk_exclusion=args.bulk_exclusion,
+        tiebreaker=args.tiebreaker,
     )
+    if args.systems:
+        results = count_systems(systems, args.num_seats, candidates, votes, **options)
+    else:
+        winners = SYSTEMS[args.system](args.num_seats, candidates, votes, **options)
+
+    if profile:
+        if args.profile == "-":
+            print(profile.to_json(), file=sys.stderr)
+        else:
+            with open(args.profile, "w") as f:
+                f.write(profile.to_json() + "\n")
+
     explain("                 \n======== RESULTS ========", args.explain)
+    if args.systems:
+        print(results_table(results))
+        return
     for winner in winners:
         print(winner if args.explain else winner.id)
 
 
+COMMANDS = {
+    "convert": convert,
+    "merge": merge,
+    "live": live,
+    "serve": serve,
+    "resample": resample,
+    "batch": batch,
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMMANDS:
+        COMMANDS[argv[0]](argv[1:])
+    else:
+        count(argv)
+
+
 if __name__ == "__main__":
     main()
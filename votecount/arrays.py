@@ -0,0 +1,324 @@
+"""Optional NumPy-backed ballot store with vectorized counting kernels.
+
+NumPy is not a requirement of votecount, so it is only imported once a
+RankMatrix is actually built.
+"""
+
+import typing
+from collections import Counter
+from copy import copy
+
+from . import Ballots, Candidate
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("The array-backed ballot store requires NumPy") from None
+    return numpy
+
+
+class RankMatrix:
+    """Distinct rankings held as a padded 2-D matrix of interned candidate
+    indexes (-1 past the end of each ranking), alongside a vector of ranking
+    lengths and a vector of how many votes cast each ranking. Iterates like
+    Ballots, so it can be passed to any counting system.
+    """
+
+    is_ballot_store = True
+
+    def __init__(self, ballots: Ballots, candidates: typing.Iterable[Candidate]):
+        np = _numpy()
+        rankings = list(ballots)
+
+        self.candidate_ids: typing.List[str] = []
+        self.index: typing.Dict[str, int] = {}
+        for candidate_id in [c.id for c in candidates] + [
+            candidate_id for ranking, _ in rankings for candidate_id in ranking
+        ]:
+            if candidate_id not in self.index:
+                self.index[candidate_id] = len(self.candidate_ids)
+                self.candidate_ids.append(candidate_id)
+
+        dtype = np.int16 if len(self.candidate_ids) < 2 ** 15 else np.int32
+        width = max((len(ranking) for ranking, _ in rankings), default=0)
+        self.ranks = np.full((len(rankings), width), -1, dtype=dtype)
+        self.lengths = np.zeros(len(rankings), dtype=dtype)
+        self.counts = np.zeros(len(rankings), dtype=np.int64)
+        for row, (ranking, count) in enumerate(rankings):
+            self.ranks[row, : len(ranking)] = [self.index[c] for c in ranking]
+            self.lengths[row] = len(ranking)
+            self.counts[row] = count
+        self.num_votes = int(self.counts.sum())
+
+    @classmethod
+    def from_arrays(
+        cls, candidate_ids: typing.List[str], ranks, lengths, counts
+    ) -> "RankMatrix":
+        """Wrap existing arrays, e.g. ones mapped from a ballot file, without
+        copying them.
+        """
+
+        matrix = cls.__new__(cls)
+        matrix.candidate_ids = candidate_ids
+        matrix.index = {c: i for i, c in enumerate(candidate_ids)}
+        matrix.ranks = ranks
+        matrix.lengths = lengths
+        matrix.counts = counts
+        matrix.num_votes = int(counts.sum())
+        return matrix
+
+    def indexes(self, candidates: typing.Iterable[Candidate]):
+        """Interned indexes of the given candidates, as an array."""
+        return _numpy().array(
+            [self.index.get(c.id, -1) for c in candidates], dtype=self.ranks.dtype
+        )
+
+    def positions(self, candidates: typing.List[Candidate], unlisted):
+        """Matrix of the position of each candidate (columns) in each ranking
+        (rows), with `unlisted` wherever the candidate is not in the ranking.
+        """
+
+        np = _numpy()
+        positions = np.full((len(self.ranks), len(candidates)), unlisted)
+        # Column of each interned candidate. Candidates missing from the matrix
+        # are given index -1, i.e. the extra last slot, which no rank refers to.
+        column = np.full(len(self.candidate_ids) + 1, -1)
+        column[self.indexes(candidates)] = np.arange(len(candidates))
+        rows, ranked_at = np.nonzero(self.ranks >= 0)
+        columns = column[self.ranks[rows, ranked_at]]
+        listed = columns >= 0
+        positions[rows[listed], columns[listed]] = ranked_at[listed]
+        return positions
+
+    @property
+    def num_rankings(self):
+        return len(self.ranks)
+
+    def shards(self, num_shards, min_size=1) -> typing.List["RankMatrix"]:
+        """Split the rows, in order, into up to num_shards matrices of at least
+        min_size rows each. Too few rows give just this matrix.
+        """
+
+        num_shards = min(num_shards, len(self.ranks) // min_size)
+        if num_shards <= 1:
+            return [self]
+        shards = []
+        for i in range(num_shards):
+            start = len(self.ranks) * i // num_shards
+            end = len(self.ranks) * (i + 1) // num_shards
+            shard = copy(self)
+            shard.ranks = self.ranks[start:end]
+            shard.lengths = self.lengths[start:end]
+            shard.counts = self.counts[start:end]
+            shard.num_votes = int(shard.counts.sum())
+            shards.append(shard)
+        return shards
+
+    def __iter__(self) -> typing.Iterator[typing.Tuple[typing.Tuple[str, ...], int]]:
+        for ranks, length, count in zip(self.ranks, self.lengths, self.counts):
+            yield tuple(self.candidate_ids[i] for i in ranks[:length]), int(count)
+
+    def __len__(self):
+        return self.num_votes
+
+    def __repr__(self):
+        return f"<RankMatrix: {len(self.ranks)} rankings, {self.num_votes} votes>"
+
+
+def pairwise_matrix(
+    candidates: typing.List[Candidate], matrix: RankMatrix
+) -> typing.Dict[typing.Tuple[str, str], int]:
+    """Vectorized counterpart of votecount.pairwise.pairwise_matrix."""
+
+    np = _numpy()
+    # Unlisted candidates share a position after every listed one, so that
+    # neither of two unlisted candidates is preferred over the other
+    positions = matrix.positions(candidates, matrix.ranks.shape[1])
+    preferred = np.zeros((len(candidates), len(candidates)), dtype=np.int64)
+    for i in range(len(candidates)):
+        preferred[i] = matrix.counts @ (positions[:, i, None] < positions)
+    return {
+        (c1.id, c2.id): int(preferred[i, j])
+        for i, c1 in enumerate(candidates)
+        for j, c2 in enumerate(candidates)
+        if i != j
+    }
+
+
+def index_sums(
+    candidates: typing.List[Candidate], matrix: RankMatrix
+) -> typing.Tuple[typing.Dict[str, int], typing.Dict[str, int]]:
+    """Vectorized counterpart of votecount.stv._index_sums."""
+
+    np = _numpy()
+    positions = matrix.positions(candidates, -1)
+    listed = positions >= 0
+    # Unlisted candidates take the midpoint of the unlisted positions
+    double_unlisted = matrix.lengths.astype(np.int64) + len(candidates) - 1
+    double_indexes = np.where(listed, 2 * positions, double_unlisted[:, None])
+    double_index_sums = matrix.counts @ double_indexes
+    num_listed = matrix.counts @ listed
+    return (
+        {c.id: int(s) for c, s in zip(candidates, double_index_sums)},
+        {c.id: int(n) for c, n in zip(candidates, num_listed)},
+    )
+
+
+def position_counts(
+    candidates: typing.List[Candidate], matrix: RankMatrix
+) -> typing.Tuple[
+    typing.Dict[str, typing.List[int]],
+    typing.Dict[int, int],
+    typing.Dict[str, typing.Dict[int, int]],
+]:
+    """Vectorized counterpart of votecount.positional.PositionalTally."""
+
+    np = _numpy()
+    num_candidates = len(candidates)
+    width = matrix.ranks.shape[1]
+    column = np.full(len(matrix.candidate_ids) + 1, -1)
+    column[matrix.indexes(candidates)] = np.arange(num_candidates)
+    # Candidates missing from the matrix are given index -1, i.e. the last
+    # slot, which the padding refers to too, so the padding is masked out
+    columns = np.where(matrix.ranks >= 0, column[matrix.ranks], -1)
+    listed = columns >= 0
+    rows, positions = np.nonzero(listed)
+    columns = columns[listed]
+    counts = matrix.counts[rows]
+    lengths = listed.sum(axis=1)
+
+    at_position = np.bincount(
+        columns * width + positions,
+        weights=counts,
+        minlength=num_candidates * width,
+    ).reshape(num_candidates, width)
+    num_votes_by_length = np.bincount(
+        lengths, weights=matrix.counts, minlength=num_candidates + 1
+    )
+    listed_by_length = np.bincount(
+        columns * (num_candidates + 1) + lengths[rows],
+        weights=counts,
+        minlength=num_candidates * (num_candidates + 1),
+    ).reshape(num_candidates, num_candidates + 1)
+
+    def counter(values):
+        return Counter({length: int(n) for length, n in enumerate(values) if n})
+
+    return (
+        {c.id: [int(n) for n in at_position[i]] for i, c in enumerate(candidates)},
+        counter(num_votes_by_length),
+        {c.id: counter(listed_by_length[i]) for i, c in enumerate(candidates)},
+    )
+
+
+class ArrayPiles:
+    """Vectorized counterpart of the STV ballot piles in votecount.stv. Tracks
+    the current position of every non-empty ranking and moves only the rows
+    whose current preference has been transferred away from. Like those piles,
+    it leaves the matrix as it is and skips removed candidates instead.
+    """
+
+    def __init__(
+        self,
+        matrix: RankMatrix,
+        candidates: typing.Dict[str, Candidate],
+        excluded: typing.Iterable[str] = (),
+    ):
+        np = _numpy()
+        self.matrix = matrix
+        self.candidates = candidates
+        self.removed = np.zeros(len(matrix.candidate_ids), dtype=bool)
+        self.removed[[matrix.index[c] for c in excluded if c in matrix.index]] = True
+        self.continuing = np.zeros(len(matrix.candidate_ids), dtype=bool)
+        self.continuing[
+            [matrix.index[c] for c in candidates if c in matrix.index]
+        ] = True
+        # Candidates given votes since last taken with pop_changed
+        self.changed: typing.Set[str] = set()
+
+        rows = np.nonzero(matrix.lengths > 0)[0]
+        self.num_votes = 0
+        self.rows, self.position = self._place_from(
+            rows, np.zeros(len(rows), dtype=np.int64)
+        )
+
+    def _current(self, rows, position):
+        return self.matrix.ranks[rows, position]
+
+    def _place(self, rows, position):
+        np = _numpy()
+        current = self._current(rows, position)
+        unknown = ~self.continuing[current]
+        if unknown.any():
+            raise KeyError(self.matrix.candidate_ids[current[unknown][0]])
+        counts = self.matrix.counts[rows]
+        tallies = np.bincount(
+            current, weights=counts, minlength=len(self.matrix.candidate_ids)
+        )
+        for candidate_index in np.unique(current):
+            candidate_id = self.matrix.candidate_ids[candidate_index]
+            self.candidates[candidate_id].num_votes += int(tallies[candidate_index])
+            self.changed.add(candidate_id)
+        self.num_votes += int(counts.sum())
+
+    def pop_changed(self) -> typing.Set[str]:
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def _place_from(self, rows, position):
+        # Place the rows on their first preference from position on that is
+        # not removed, and return the rows that have one, with its position
+        lengths = self.matrix.lengths[rows]
+        while True:
+            skip = position < lengths
+            skip[skip] = self.removed[self._current(rows[skip], position[skip])]
+            if not skip.any():
+                break
+            position[skip] += 1
+        left = position < lengths
+        rows, position = rows[left], position[left]
+        self._place(rows, position)
+        return rows, position
+
+    def transfer(self, candidate_ids: typing.Iterable[str]) -> typing.Tuple[int, int]:
+        """Move the rows of the given candidates to the next preference of each
+        ranking that has not been transferred away from. Exhausted rows are
+        dropped. Return the number of rows and of votes moved.
+        """
+
+        np = _numpy()
+        # Candidates ranked by no vote may not be interned
+        index = self.matrix.index
+        indexes = [index[c] for c in candidate_ids if c in index]
+        self.removed[indexes] = True
+        self.continuing[indexes] = False
+
+        moving = self.removed[self._current(self.rows, self.position)]
+        rows, position = self.rows[moving], self.position[moving] + 1
+        num_rows, num_votes = len(rows), int(self.matrix.counts[rows].sum())
+        self.num_votes -= num_votes
+        rows, position = self._place_from(rows, position)
+
+        self.rows = np.concatenate([self.rows[~moving], rows])
+        self.position = np.concatenate([self.position[~moving], position])
+        return num_rows, num_votes
+
+
+def resample(matrix: RankMatrix, seed) -> RankMatrix:
+    """Vectorized counterpart of votecount.bootstrap.resample, drawing the number
+    of votes for each ranking at once from a multinomial distribution.
+    """
+
+    np = _numpy()
+    counts = np.random.default_rng(seed).multinomial(
+        matrix.num_votes, matrix.counts / matrix.num_votes
+    )
+    drawn = counts > 0
+    sample = copy(matrix)
+    sample.ranks = matrix.ranks[drawn]
+    sample.lengths = matrix.lengths[drawn]
+    sample.counts = counts[drawn]
+    sample.num_votes = matrix.num_votes
+    return sample
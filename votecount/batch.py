@@ -0,0 +1,58 @@
+"""Counting one election with several systems at once."""
+
+import typing
+
+from . import Ballots, Candidate, Vote
+from .profiling import phase
+from .shared import SharedData
+from .systems import SYSTEMS
+
+
+def _render_system(system):
+    return f"                 \n######## {system.upper()} ########"
+
+
+def count_systems(
+    systems: typing.Iterable[str],
+    num_seats,
+    candidates: typing.List[Candidate],
+    votes: typing.Union[Ballots, typing.List[Vote]],
+    shared: typing.Optional[SharedData] = None,
+    **kwargs,
+) -> typing.Dict[str, typing.List[Candidate]]:
+    """Count the election with each of the given systems, by name, and return
+    their results by name. Data that several systems use, such as the ballots,
+    the pairwise matrix and the positional tally, is derived only once, or taken
+    from shared if given. Other keyword arguments, such as trace, profile or
+    weight, are passed to every system.
+    """
+
+    shared = SharedData() if shared is None else shared
+    trace = kwargs.get("trace")
+    results = {}
+    for system in systems:
+        if trace:
+            trace.record("system", _render_system, system=system)
+        with phase(kwargs.get("profile"), "system", system=system):
+            results[system] = SYSTEMS[system](
+                num_seats, candidates, votes, shared=shared, **kwargs
+            )
+    return results
+
+
+def results_table(results: typing.Dict[str, typing.List[Candidate]]) -> str:
+    """Tab-separated table of the results of count_systems, with a column of the
+    candidate IDs each system ranked at each place.
+    """
+
+    num_places = max((len(winners) for winners in results.values()), default=0)
+    rows = [["place"] + list(results)]
+    for place in range(num_places):
+        rows.append(
+            [str(place + 1)]
+            + [
+                winners[place].id if place < len(winners) else ""
+                for winners in results.values()
+            ]
+        )
+    return "\n".join("\t".join(row) for row in rows)
@@ -0,0 +1,442 @@
+"""Reproducible synthetic elections and a benchmark timing parsing and every
+counting system over a grid of voter and candidate counts.
+
+    python -m votecount.benchmark --voters 1000,100000 --candidates 3,50,500
+
+writes one JSON object per timing and line, e.g. to compare against the results
+of an earlier commit.
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import typing
+
+from . import Ballots, Candidate, arrays
+from .parse import read_election
+from .systems import SYSTEMS
+
+MODELS = ["impartial", "mallows", "spatial"]
+
+
+def _geometric(u, size, dispersion) -> int:
+    # Inverse CDF, at u in [0, 1), of k in [0, size) with probability
+    # proportional to dispersion**k
+    if dispersion == 0:
+        return 0
+    if dispersion == 1:
+        return int(u * size)
+    k = math.log(1 - u * (1 - dispersion**size)) / math.log(dispersion)
+    return min(int(k), size - 1)
+
+
+def _mallows(
+    rng: random.Random, num_candidates, dispersion, length
+) -> typing.List[int]:
+    # Each place is taken by the k-th candidate of the reference ranking not
+    # placed yet, with probability proportional to dispersion**k, which gives
+    # the Mallows distribution. The candidates left are counted in a Fenwick
+    # tree, so that finding and removing the k-th takes O(log C)
+    tree = [i & -i for i in range(num_candidates + 1)]
+    top = 1 << (num_candidates.bit_length() - 1)
+    ranking = []
+    for place in range(length):
+        k = _geometric(rng.random(), num_candidates - place, dispersion)
+        i, step = 0, top
+        while step:
+            if i + step <= num_candidates and tree[i + step] <= k:
+                i += step
+                k -= tree[i]
+            step >>= 1
+        ranking.append(i)
+        i += 1
+        while i <= num_candidates:
+            tree[i] -= 1
+            i += i & -i
+    return ranking
+
+
+def _mallows_arrays(rng, num_voters, num_candidates, dispersion, length):
+    """Vectorized counterpart of _mallows, drawing num_voters rankings at once."""
+
+    np = arrays._numpy()
+    # One Fenwick tree per voter, flattened, with an extra last slot that
+    # absorbs the updates of voters whose update is done
+    width = num_candidates + 2
+    lowest_bits = np.arange(width)
+    lowest_bits[-1] = 0
+    tree = np.tile(lowest_bits & -lowest_bits, num_voters)
+    offsets = np.arange(num_voters) * width
+    top = 1 << (num_candidates.bit_length() - 1)
+    rankings = np.empty((num_voters, length), dtype=np.int64)
+    for place in range(length):
+        size = num_candidates - place
+        u = rng.random(num_voters)
+        if dispersion == 0:
+            k = np.zeros(num_voters, dtype=np.int64)
+        elif dispersion == 1:
+            k = (u * size).astype(np.int64)
+        else:
+            k = np.log(1 - u * (1 - dispersion**size)) / np.log(dispersion)
+            k = np.minimum(k.astype(np.int64), size - 1)
+        i = np.zeros(num_voters, dtype=np.int64)
+        step = top
+        while step:
+            ahead = i + step
+            counted = tree[offsets + np.minimum(ahead, width - 1)]
+            move = (ahead <= num_candidates) & (counted <= k)
+            i = np.where(move, ahead, i)
+            k = np.where(move, k - counted, k)
+            step >>= 1
+        rankings[:, place] = i
+        i += 1
+        for _ in range(num_candidates.bit_length()):
+            tree[offsets + i] -= 1
+            i = np.minimum(i + (i & -i), width - 1)
+    return rankings
+
+
+def _distinct(np, rows, first, counts):
+    # Distinct rows, with the index they first appear at and how many there are
+    distinct, inverse = np.unique(rows, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    first_at = np.full(len(distinct), len(rows), dtype=np.int64)
+    np.minimum.at(first_at, inverse, first)
+    return distinct, first_at, np.bincount(inverse, weights=counts).astype(np.int64)
+
+
+def _generate_arrays(
+    ballots: Ballots,
+    candidate_ids: typing.List[str],
+    num_voters,
+    model,
+    length,
+    dispersion,
+    seed,
+):
+    # Votes are drawn in chunks of many voters at a time. The distinct rankings
+    # of each chunk are kept with their counts, as single numbers if they fit
+    np = arrays._numpy()
+    rng = np.random.default_rng(seed)
+    num_candidates = len(candidate_ids)
+    positions = rng.random(num_candidates)
+    max_width = num_candidates if length in (None, "uniform") else length
+    encode = (num_candidates + 1) ** max_width < 2**62
+    chunk_size = max(1, (1 << 22) // num_candidates)
+    parts = []
+    for start in range(0, num_voters, chunk_size):
+        size = min(chunk_size, num_voters - start)
+        if length == "uniform":
+            lengths = rng.integers(1, num_candidates, size, endpoint=True)
+        else:
+            lengths = np.full(size, max_width)
+        if model == "impartial":
+            rankings = np.argsort(rng.random((size, num_candidates)), axis=1)
+        elif model == "mallows":
+            rankings = _mallows_arrays(rng, size, num_candidates, dispersion, max_width)
+        else:
+            distances = np.abs(positions - rng.random(size)[:, None])
+            rankings = np.argsort(distances, axis=1, kind="stable")
+        rankings = rankings[:, :max_width] + 1  # 0 past the end of each ranking
+        rankings[np.arange(max_width) >= lengths[:, None]] = 0
+        if encode:
+            rankings = rankings @ (num_candidates + 1) ** np.arange(max_width)
+        first = np.arange(start, start + size)
+        parts.append(_distinct(np, rankings, first, np.ones(size)))
+
+    if not parts:
+        return
+    distinct, first, counts = _distinct(
+        np, *(np.concatenate(part) for part in zip(*parts))
+    )
+    if encode:
+        distinct = distinct[:, None] // (num_candidates + 1) ** np.arange(max_width)
+        distinct %= num_candidates + 1
+    for row in np.argsort(first):
+        ranking = tuple(candidate_ids[i - 1] for i in distinct[row] if i > 0)
+        ballots.add(ranking, int(counts[row]))
+
+
+def generate(
+    num_voters,
+    num_candidates,
+    model="impartial",
+    length: typing.Union[None, int, str] = None,
+    dispersion=0.8,
+    seed=0,
+    use_numpy=False,
+) -> typing.Tuple[typing.List[Candidate], Ballots]:
+    """Generate an election of num_voters votes over num_candidates candidates,
+    "c0", "c1" and so on. The same arguments always give the same election.
+
+    Rankings follow the preference model:
+
+    impartial  every ranking is equally likely
+    mallows    rankings are close to c0, c1, ... The smaller the dispersion, the
+               closer; 0 gives only that ranking, 1 is impartial
+    spatial    candidates and voters are placed on a line at random, and voters
+               rank candidates by distance
+
+    Votes list every candidate if length is None, their first length
+    candidates if it is an int, and a uniformly random number of them if it is
+    "uniform".
+
+    With use_numpy, votes are drawn with NumPy, many at a time, which is much
+    faster for large elections but gives a different election for the same
+    seed.
+    """
+
+    if model not in MODELS:
+        raise ValueError(f"Unknown preference model: {model}")
+    candidate_ids = [f"c{i}" for i in range(num_candidates)]
+    if isinstance(length, int):
+        length = min(length, num_candidates)
+    ballots = Ballots()
+    if use_numpy:
+        _generate_arrays(
+            ballots, candidate_ids, num_voters, model, length, dispersion, seed
+        )
+        return [Candidate(id) for id in candidate_ids], ballots
+
+    rng = random.Random(seed)
+    positions = [rng.random() for _ in candidate_ids]
+    for _ in range(num_voters):
+        if length == "uniform":
+            num_listed = rng.randint(1, num_candidates)
+        else:
+            num_listed = num_candidates if length is None else length
+        if model == "impartial":
+            ranking = rng.sample(range(num_candidates), num_listed)
+        elif model == "mallows":
+            ranking = _mallows(rng, num_candidates, dispersion, num_listed)
+        else:
+            voter = rng.random()
+            ranking = sorted(
+                range(num_candidates), key=lambda i: abs(positions[i] - voter)
+            )[:num_listed]
+        ballots.add(tuple(candidate_ids[i] for i in ranking))
+    return [Candidate(id) for id in candidate_ids], ballots
+
+
+def write_election(path, candidates: typing.List[Candidate], ballots: Ballots):
+    """Write an election in the plain text input format."""
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(" ".join(c.id for c in candidates) + "\n")
+        for ranking, count in ballots:
+            # Without building a string of every vote of the ranking
+            f.writelines(itertools.repeat(" ".join(ranking) + "\n", count))
+
+
+def _time(func, repeat) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def run(
+    voters: typing.List[int],
+    candidates: typing.List[int],
+    systems: typing.List[str],
+    num_seats=3,
+    model="impartial",
+    length: typing.Union[None, int, str] = None,
+    seed=0,
+    repeat=1,
+    budget: typing.Optional[float] = None,
+    use_numpy=False,
+) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    """Time generating, writing and parsing a generated election, and counting
+    it with each of the given systems, for every combination of voter and
+    candidate count, yielding one record per timing. Parsing and counting are
+    timed as the best of repeat runs. With use_numpy, the election is generated
+    and counted with NumPy.
+
+    Once a step takes longer than budget seconds, it is skipped for every larger
+    election, so that a step that blows up does not stall the whole grid.
+    """
+
+    over_budget: typing.Dict[str, typing.Tuple[int, int]] = {}
+
+    def skip(step, num_voters, num_candidates):
+        if step not in over_budget:
+            return False
+        min_voters, min_candidates = over_budget[step]
+        return num_voters >= min_voters and num_candidates >= min_candidates
+
+    for num_candidates in candidates:
+        for num_voters in voters:
+            record = {
+                "model": model,
+                "length": length,
+                "voters": num_voters,
+                "candidates": num_candidates,
+                "rankings": None,
+                "seats": num_seats,
+                "numpy": use_numpy,
+            }
+
+            def skipped(step):
+                return dict(record, step=step, seconds=None, skipped=True)
+
+            def timed(step, seconds):
+                if budget is not None and seconds > budget:
+                    over_budget[step] = (num_voters, num_candidates)
+                return dict(record, step=step, seconds=seconds, skipped=False)
+
+            # Generating and writing larger elections is skipped as well once
+            # either takes too long, as are the steps that need them
+            if skip("generate", num_voters, num_candidates):
+                for step in ["generate", "write", "parse"] + systems:
+                    yield skipped(step)
+                continue
+            start = time.perf_counter()
+            election, ballots = generate(
+                num_voters,
+                num_candidates,
+                model,
+                length,
+                seed=seed,
+                use_numpy=use_numpy,
+            )
+            record["rankings"] = len(ballots.counts)
+            yield timed("generate", time.perf_counter() - start)
+
+            with tempfile.TemporaryDirectory() as temp_dir:
+                path = os.path.join(temp_dir, "election.txt")
+                if skip("write", num_voters, num_candidates) or skip(
+                    "parse", num_voters, num_candidates
+                ):
+                    yield skipped("write")
+                    yield skipped("parse")
+                else:
+                    start = time.perf_counter()
+                    write_election(path, election, ballots)
+                    yield timed("write", time.perf_counter() - start)
+                    yield timed("parse", _time(lambda: read_election(path), repeat))
+
+            votes = arrays.RankMatrix(ballots, election) if use_numpy else ballots
+            for system in systems:
+                if skip(system, num_voters, num_candidates):
+                    yield skipped(system)
+                    continue
+                count = SYSTEMS[system]
+                yield timed(
+                    system,
+                    _time(
+                        lambda: count(num_seats, election, votes, weight=0.5), repeat
+                    ),
+                )
+
+
+def _ints(value) -> typing.List[int]:
+    return [int(float(v)) for v in value.split(",")]
+
+
+def _length(value) -> typing.Union[None, int, str]:
+    if value in ("full", "uniform"):
+        return None if value == "full" else value
+    return int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="votecount.benchmark",
+        description=(
+            "Time parsing and counting of synthetic elections over a grid of voter "
+            "and candidate counts, writing one JSON object per timing."
+        ),
+    )
+    parser.add_argument(
+        "--voters",
+        type=_ints,
+        default=[1000, 10000, 100000],
+        help="Comma-separated voter counts, e.g. 1e3,1e5. Default: 1e3,1e4,1e5.",
+    )
+    parser.add_argument(
+        "--candidates",
+        type=_ints,
+        default=[3, 10, 50],
+        help="Comma-separated candidate counts. Default: 3,10,50.",
+    )
+    parser.add_argument(
+        "--systems",
+        default="all",
+        help="Comma-separated systems to time, or all. Default: all.",
+    )
+    parser.add_argument("--seats", type=int, default=3, help="Default: 3.")
+    parser.add_argument(
+        "--model", choices=MODELS, default="impartial", help="Default: impartial."
+    )
+    parser.add_argument(
+        "--length",
+        type=_length,
+        default=None,
+        help=(
+            "Number of candidates listed per vote: full, uniform (random) or a "
+            "number. Default: full."
+        ),
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Default: 0.")
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="Time each step this many times and keep the best. Default: 1.",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        metavar="SECONDS",
+        help="Skip a step for larger elections once it takes longer than this.",
+    )
+    parser.add_argument(
+        "--numpy",
+        action="store_true",
+        help="Generate elections with NumPy, and count from NumPy-backed ballots.",
+    )
+    parser.add_argument(
+        "--output", help="File to append the results to. Default: standard output."
+    )
+    args = parser.parse_args(argv)
+
+    systems = list(SYSTEMS) if args.systems == "all" else args.systems.split(",")
+    for system in systems:
+        if system not in SYSTEMS:
+            parser.error(f"unknown system: {system}")
+
+    environment = {"python": platform.python_version(), "machine": platform.machine()}
+    out = open(args.output, "a") if args.output else sys.stdout
+    try:
+        for record in run(
+            args.voters,
+            args.candidates,
+            systems,
+            num_seats=args.seats,
+            model=args.model,
+            length=args.length,
+            seed=args.seed,
+            repeat=args.repeat,
+            budget=args.budget,
+            use_numpy=args.numpy,
+        ):
+            out.write(json.dumps(dict(record, **environment)) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Reading and writing elections in the BLT format used by most STV counting
+software, e.g.
+
+    4 2
+    -3
+    12000 1 2 4 0
+    3 4 1 0
+    0
+    "Adams"
+    "Baker"
+    "Clark"
+    "Davis"
+    "Committee election"
+
+The first line holds the number of candidates and of seats, and the optional
+second line the withdrawn candidates, by negated number. Each ballot line holds
+its weight, the number of votes that cast it, followed by its ranking of
+candidate numbers and 0. A line with just 0 ends the ballots, and is followed by
+the names of the candidates, in quotes, and the title of the election.
+
+The names of the candidates are their IDs. Withdrawn candidates are left out of
+the candidates and of every ranking, as if they had not stood.
+"""
+
+import os
+import re
+import threading
+import typing
+
+from . import Ballots, Candidate
+
+SUFFIX = ".blt"
+
+_QUOTED = re.compile(r'"([^"]*)"')
+# The start of a line up to any comment, a # that isn't within quotes
+_UNCOMMENTED = re.compile(r'(?:[^"#]|"[^"]*"?)*')
+
+
+class BLTError(RuntimeError):
+    pass
+
+
+class BLTElection(typing.NamedTuple):
+    candidates: typing.List[Candidate]
+    ballots: Ballots
+    num_seats: int
+    title: str
+    # IDs of the withdrawn candidates
+    withdrawn: typing.List[str]
+
+
+def is_blt_file(path) -> bool:
+    return str(path).lower().endswith(SUFFIX)
+
+
+def _ints(path, line_nr, line) -> typing.List[int]:
+    try:
+        return [int(token) for token in line.split()]
+    except ValueError:
+        if "=" in line:
+            raise BLTError(f"{path}, line {line_nr}: equal rankings are not supported")
+        raise BLTError(f"{path}, line {line_nr}: expected whole numbers: {line}")
+
+
+def _header(path, lines) -> typing.Tuple[int, int]:
+    for line_nr, line in lines:
+        numbers = _ints(path, line_nr, line)
+        if len(numbers) != 2 or min(numbers) < 1:
+            raise BLTError(f"{path}, line {line_nr}: expected candidates and seats")
+        return numbers[0], numbers[1]
+    raise BLTError(f"{path} is empty")
+
+
+def _lines(f) -> typing.Iterator[typing.Tuple[int, str]]:
+    """The non-blank lines of f, with their line numbers, without comments.
+    A # within quotes, as in a name, doesn't start a comment.
+    """
+
+    for line_nr, line in enumerate(f, 1):
+        line = _UNCOMMENTED.match(line).group().strip()
+        if line:
+            yield line_nr, line
+
+
+def read_blt_header(path) -> typing.Tuple[int, int]:
+    """The number of candidates and of seats of a BLT file."""
+
+    with open(path, encoding="utf-8") as f:
+        return _header(path, _lines(f))
+
+
+def read_blt(path) -> BLTElection:
+    """Read a BLT file. Ballot lines are added to the Ballots with their weight
+    as count, so that a ranking cast by many votes is held once however large
+    its weight.
+    """
+
+    # Rankings by candidate number, until the names are known
+    counts: typing.Dict[typing.Tuple[int, ...], int] = {}
+    withdrawn: typing.Set[int] = set()
+    with open(path, encoding="utf-8") as f:
+        lines = _lines(f)
+        num_candidates, num_seats = _header(path, lines)
+        for line_nr, line in lines:
+            if line.startswith('"'):
+                raise BLTError(f"{path}, line {line_nr}: missing end of ballots (0)")
+            if line.startswith("-"):
+                withdrawn.update(-n for n in _ints(path, line_nr, line))
+                continue
+            numbers = _ints(path, line_nr, line)
+            if numbers == [0]:
+                break
+            weight, *ranking = numbers
+            if not ranking or ranking.pop() != 0:
+                raise BLTError(f"{path}, line {line_nr}: ballot must end with 0")
+            if weight < 0 or not all(1 <= c <= num_candidates for c in ranking):
+                raise BLTError(f"{path}, line {line_nr}: invalid ballot: {line}")
+            if weight:
+                key = tuple(c for c in ranking if c not in withdrawn)
+                counts[key] = counts.get(key, 0) + weight
+        else:
+            raise BLTError(f"{path}: missing end of ballots (0)")
+        strings = _QUOTED.findall(" ".join(line for _, line in lines))
+
+    if len(strings) < num_candidates:
+        raise BLTError(f"{path}: expected {num_candidates} candidate names")
+    names = strings[:num_candidates]
+    if len(set(names)) < len(names):
+        raise BLTError(f"{path}: candidate names must be distinct")
+    if not withdrawn <= set(range(1, num_candidates + 1)):
+        raise BLTError(f"{path}: invalid withdrawn candidates")
+
+    ballots = Ballots()
+    for ranking, count in counts.items():
+        if ranking:
+            ballots.add([names[c - 1] for c in ranking], count)
+    return BLTElection(
+        [Candidate(name) for i, name in enumerate(names, 1) if i not in withdrawn],
+        ballots,
+        num_seats,
+        strings[num_candidates] if len(strings) > num_candidates else "",
+        [names[i - 1] for i in sorted(withdrawn)],
+    )
+
+
+def write_blt(
+    path,
+    candidates: typing.List[Candidate],
+    ballots: typing.Iterable[typing.Tuple[typing.Sequence[str], int]],
+    num_seats,
+    title="",
+    withdrawn: typing.Iterable[str] = (),
+):
+    """Write an election to a BLT file, one line per distinct ranking with its
+    count as weight, atomically replacing any existing file. The withdrawn
+    candidates are listed after the others.
+    """
+
+    withdrawn = [c for c in withdrawn if c not in {c.id for c in candidates}]
+    names = [c.id for c in candidates] + withdrawn
+    if any('"' in name for name in names + [title]):
+        raise BLTError('names and title cannot contain "')
+    numbers = {name: i for i, name in enumerate(names, 1)}
+
+    # Unique to the writing thread, so concurrent writers don't collide
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(f"{len(names)} {num_seats}\n")
+            if withdrawn:
+                f.write(" ".join(f"-{numbers[c]}" for c in withdrawn) + "\n")
+            for ranking, count in ballots:
+                try:
+                    ranks = " ".join(str(numbers[c]) for c in ranking)
+                except KeyError as e:
+                    raise BLTError(f"ranking of unknown candidate {e}")
+                f.write(f"{count} {ranks} 0\n")
+            f.write("0\n")
+            for name in names + [title]:
+                f.write(f'"{name}"\n')
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
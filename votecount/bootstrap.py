@@ -0,0 +1,164 @@
+"""Bootstrap resampling of an election, to tell how robust its result is.
+
+Each sample draws as many votes as the election has, with replacement, from its
+distinct rankings weighted by how many votes cast each, and is counted with the
+chosen system. How often each candidate wins across the samples, with a
+confidence interval, tells how likely an election among similar voters is to
+give the same result.
+"""
+
+import random
+import typing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from statistics import NormalDist
+
+from . import Ballots, Candidate, Vote, as_ballots
+from .systems import SYSTEMS
+
+
+class WinFrequency(typing.NamedTuple):
+    candidate: str
+    wins: int
+    frequency: float
+    # Bounds of the confidence interval of the frequency
+    low: float
+    high: float
+
+
+def resample(votes: Ballots, seed) -> Ballots:
+    """Bootstrap sample of the ballots: as many votes as they hold, drawn with
+    replacement from their rankings. A RankMatrix is sampled by
+    votecount.arrays.resample instead.
+    """
+
+    if not isinstance(votes, Ballots):
+        from .arrays import resample as resample_matrix
+
+        return resample_matrix(votes, seed)
+
+    rankings = list(votes.counts)
+    drawn = Counter(
+        random.Random(seed).choices(
+            range(len(rankings)),
+            cum_weights=list(accumulate(votes.counts.values())),
+            k=len(votes),
+        )
+    )
+    sample = Ballots()
+    # Already validated, and in the order of the original rankings
+    sample.counts = {rankings[i]: drawn[i] for i in sorted(drawn)}
+    sample.num_votes = len(votes)
+    return sample
+
+
+def _wilson(successes, trials, z) -> typing.Tuple[float, float]:
+    # Wilson score interval, which unlike the normal approximation stays
+    # within [0, 1] for frequencies close to 0 or 1
+    p = successes / trials
+    centre = p + z * z / (2 * trials)
+    spread = z * (p * (1 - p) / trials + z * z / (4 * trials * trials)) ** 0.5
+    denominator = 1 + z * z / trials
+    return (
+        max(0.0, (centre - spread) / denominator),
+        min(1.0, (centre + spread) / denominator),
+    )
+
+
+# Election counted by worker processes, sent to each of them once
+_election: typing.Dict[str, typing.Any] = {}
+
+
+def _init_worker(election: typing.Dict[str, typing.Any]):
+    _election.update(election)
+
+
+def _count(election: typing.Dict[str, typing.Any], seeds) -> typing.Counter[str]:
+    num_seats = election["num_seats"]
+    wins: typing.Counter[str] = Counter()
+    for seed in seeds:
+        winners = SYSTEMS[election["system"]](
+            num_seats,
+            election["candidates"],
+            resample(election["votes"], seed),
+            **election["kwargs"],
+        )
+        wins.update(winner.id for winner in winners[:num_seats])
+    return wins
+
+
+def _count_in_worker(seeds) -> typing.Counter[str]:
+    return _count(_election, seeds)
+
+
+def bootstrap(
+    system,
+    num_seats,
+    candidates: typing.List[Candidate],
+    votes: typing.Union[Ballots, typing.List[Vote]],
+    num_samples=1000,
+    seed=0,
+    confidence=0.95,
+    jobs=1,
+    **kwargs,
+) -> typing.List[WinFrequency]:
+    """Count num_samples bootstrap samples of the election with the given
+    system, by name, in up to jobs worker processes, and return how often each
+    candidate was among the first num_seats winners, most often first. Other
+    keyword arguments, such as weight, are passed to the system.
+
+    The result only depends on seed, not on jobs.
+    """
+
+    if not 0 < confidence < 1:
+        raise ValueError(f"confidence must be between 0 and 1, not {confidence}")
+
+    # Seeds are drawn up front, so that each sample is the same however the
+    # samples are split between workers
+    rng = random.Random(seed)
+    seeds = [rng.getrandbits(64) for _ in range(num_samples)]
+    election = dict(
+        system=system,
+        num_seats=num_seats,
+        candidates=candidates,
+        votes=as_ballots(votes),
+        kwargs=kwargs,
+    )
+
+    if jobs > 1 and num_samples > 1:
+        # A few chunks per worker even out samples that take longer to count
+        num_chunks = min(num_samples, jobs * 4)
+        chunks = [seeds[i::num_chunks] for i in range(num_chunks)]
+        wins: typing.Counter[str] = Counter()
+        with ProcessPoolExecutor(
+            jobs, initializer=_init_worker, initargs=(election,)
+        ) as executor:
+            for chunk_wins in executor.map(_count_in_worker, chunks):
+                wins.update(chunk_wins)
+    else:
+        wins = _count(election, seeds)
+
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    frequencies = [
+        WinFrequency(
+            c.id,
+            wins[c.id],
+            wins[c.id] / num_samples,
+            *_wilson(wins[c.id], num_samples, z),
+        )
+        for c in candidates
+    ]
+    return sorted(frequencies, key=lambda f: f.wins, reverse=True)
+
+
+def frequency_table(frequencies: typing.List[WinFrequency]) -> str:
+    """Tab-separated table of the results of bootstrap."""
+
+    rows = [["candidate", "wins", "frequency", "low", "high"]]
+    for f in frequencies:
+        rows.append(
+            [f.candidate, str(f.wins)]
+            + [f"{x:.4f}" for x in (f.frequency, f.low, f.high)]
+        )
+    return "\n".join("\t".join(row) for row in rows)
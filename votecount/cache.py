@@ -0,0 +1,310 @@
+"""Compact binary ballot files, used both as an explicit conversion target and
+as an automatic cache of parsed election files.
+
+Layout, all little-endian:
+
+    header   magic, format version, SHA-256 of the source file, number of
+             interned candidate IDs, header candidates, rows, row width and
+             rank item size
+    table    each interned candidate ID as a length-prefixed UTF-8 string
+    header candidates   their indexes into the table, as uint32
+    counts   how many votes cast each row's ranking, as int64
+    lengths  length of each row's ranking
+    ranks    rows x width matrix of candidate indexes, -1 past each ranking
+
+The arrays are 8-byte aligned, so they can be mapped straight into a
+RankMatrix without copying.
+"""
+
+import array
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import threading
+import typing
+
+from . import Ballots, Candidate, arrays
+from .blt import is_blt_file, read_blt
+from .parse import read_election
+
+MAGIC = b"\x89VCNT\r\n\x1a"  # Never valid UTF-8 text
+VERSION = 1
+SUFFIX = ".votecount"
+
+_HEADER = struct.Struct("<8sI32sIIQIB")
+
+
+class BallotFileError(RuntimeError):
+    pass
+
+
+def file_hash(path) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+def is_ballot_file(path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _align(f):
+    f.write(b"\0" * (-f.tell() % 8))
+
+
+def _write_array(f, typecode, values):
+    values = array.array(typecode, values)
+    if sys.byteorder == "big":
+        values.byteswap()
+    values.tofile(f)
+
+
+def write_ballot_file(
+    path,
+    candidates: typing.List[Candidate],
+    ballots: typing.Iterable[typing.Tuple[typing.Tuple[str, ...], int]],
+    source_hash: bytes = b"\0" * 32,
+):
+    """Write candidates and ballots to path, atomically replacing any existing
+    file.
+    """
+
+    rankings = list(ballots)
+    candidate_ids: typing.List[str] = []
+    index: typing.Dict[str, int] = {}
+    for candidate_id in [c.id for c in candidates] + [
+        candidate_id for ranking, _ in rankings for candidate_id in ranking
+    ]:
+        if candidate_id not in index:
+            index[candidate_id] = len(candidate_ids)
+            candidate_ids.append(candidate_id)
+    itemsize = 2 if len(candidate_ids) < 2**15 else 4
+    typecode = "h" if itemsize == 2 else "i"
+    width = max((len(ranking) for ranking, _ in rankings), default=0)
+
+    # Unique to the writing thread, so concurrent writers don't collide
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(
+                _HEADER.pack(
+                    MAGIC,
+                    VERSION,
+                    source_hash,
+                    len(candidate_ids),
+                    len(candidates),
+                    len(rankings),
+                    width,
+                    itemsize,
+                )
+            )
+            for candidate_id in candidate_ids:
+                encoded = candidate_id.encode("utf-8")
+                f.write(struct.pack("<I", len(encoded)) + encoded)
+            _write_array(f, "I", [index[c.id] for c in candidates])
+            _align(f)
+            _write_array(f, "q", [count for _, count in rankings])
+            _align(f)
+            _write_array(f, typecode, [len(ranking) for ranking, _ in rankings])
+            _align(f)
+            for ranking, _ in rankings:
+                row = [index[c] for c in ranking]
+                _write_array(f, typecode, row + [-1] * (width - len(row)))
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _read_array(m, offset, typecode, length):
+    values = array.array(typecode)
+    end = offset + length * values.itemsize
+    values.frombytes(m[offset:end])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values, end
+
+
+def _read_ballot_file(
+    path, m: mmap.mmap, source_hash: typing.Optional[bytes], use_numpy
+) -> typing.Tuple[typing.List[Candidate], typing.Union[Ballots, "arrays.RankMatrix"]]:
+    (
+        magic,
+        version,
+        file_source_hash,
+        num_ids,
+        num_candidates,
+        num_rows,
+        width,
+        itemsize,
+    ) = _HEADER.unpack_from(m)
+    if magic != MAGIC:
+        raise BallotFileError(f"{path} is not a ballot file")
+    if version != VERSION:
+        raise BallotFileError(f"{path} has unsupported format version {version}")
+    if source_hash is not None and file_source_hash != source_hash:
+        raise BallotFileError(f"{path} was not made from the given source")
+    if itemsize not in (2, 4):
+        raise BallotFileError(f"{path} is corrupt: rank item size {itemsize}")
+
+    offset = _HEADER.size
+    candidate_ids = []
+    for _ in range(num_ids):
+        (length,) = struct.unpack_from("<I", m, offset)
+        offset += 4
+        end = offset + length
+        if end > len(m):
+            raise BallotFileError(f"{path} is truncated")
+        candidate_ids.append(m[offset:end].decode("utf-8"))
+        offset = end
+    if offset + 4 * num_candidates > len(m):
+        raise BallotFileError(f"{path} is truncated")
+    header, offset = _read_array(m, offset, "I", num_candidates)
+    candidates = [Candidate(candidate_ids[i]) for i in header]
+    offset += -offset % 8
+    # The arrays must take up the rest of the file exactly
+    counts_size = 8 * num_rows
+    lengths_size = itemsize * num_rows
+    if (
+        offset
+        + counts_size
+        + lengths_size
+        + -lengths_size % 8
+        + itemsize * num_rows * width
+        != len(m)
+    ):
+        raise BallotFileError(f"{path} is truncated or corrupt")
+    typecode = "h" if itemsize == 2 else "i"
+
+    if use_numpy:
+        np = arrays._numpy()
+        rank_dtype = np.dtype(f"<i{itemsize}")
+        counts = np.frombuffer(m, "<i8", num_rows, offset)
+        offset += counts.nbytes
+        offset += -offset % 8
+        lengths = np.frombuffer(m, rank_dtype, num_rows, offset)
+        offset += lengths.nbytes
+        offset += -offset % 8
+        ranks = np.frombuffer(m, rank_dtype, num_rows * width, offset)
+        return candidates, arrays.RankMatrix.from_arrays(
+            candidate_ids, ranks.reshape(num_rows, width), lengths, counts
+        )
+
+    counts, offset = _read_array(m, offset, "q", num_rows)
+    offset += -offset % 8
+    lengths, offset = _read_array(m, offset, typecode, num_rows)
+    offset += -offset % 8
+    ranks, offset = _read_array(m, offset, typecode, num_rows * width)
+    m.close()
+    rankings = {}
+    for row, (count, length) in enumerate(zip(counts, lengths)):
+        start = row * width
+        row_ranks = ranks[start:start + length]
+        rankings[tuple(candidate_ids[i] for i in row_ranks)] = count
+    ballots = Ballots()
+    ballots.counts = rankings  # Validated when the file was written
+    ballots.num_votes = sum(rankings.values())
+    return candidates, ballots
+
+
+def read_ballot_file(
+    path, source_hash: typing.Optional[bytes] = None, use_numpy=False
+) -> typing.Tuple[typing.List[Candidate], typing.Union[Ballots, "arrays.RankMatrix"]]:
+    """Read a ballot file, into a RankMatrix mapping the file's arrays if
+    use_numpy, and into Ballots otherwise. If source_hash is given, raise
+    BallotFileError unless the file was made from a source with that hash.
+    A truncated or otherwise corrupt file raises BallotFileError too.
+    """
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            raise BallotFileError(f"{path} is not a ballot file")
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return _read_ballot_file(path, m, source_hash, use_numpy)
+    except (BallotFileError, ValueError, IndexError, struct.error) as e:
+        try:
+            m.close()
+        except BufferError:
+            pass  # Still mapped by arrays that are about to be dropped
+        if isinstance(e, BallotFileError):
+            raise
+        raise BallotFileError(f"{path} is corrupt: {e}") from e
+
+
+def read_input_file(path, jobs=1) -> typing.Tuple[typing.List[Candidate], Ballots]:
+    """Parse a BLT file, by its suffix, or a text input file."""
+
+    if is_blt_file(path):
+        election = read_blt(path)
+        return election.candidates, election.ballots
+    return read_election(path, jobs=jobs)
+
+
+def cache_path(path, source_hash: bytes, cache_dir=None) -> str:
+    """Where the cached ballot file of the given election file goes: next to
+    it, or in cache_dir, named by the hash of its content.
+    """
+
+    if cache_dir is None:
+        return path + SUFFIX
+    return os.path.join(cache_dir, source_hash.hex() + SUFFIX)
+
+
+def merge_elections(
+    paths: typing.Iterable, use_cache=True, cache_dir=None
+) -> typing.Tuple[typing.List[Candidate], Ballots]:
+    """Load several elections, e.g. the ballot files of separately converted
+    precincts, as one. Candidates are listed in the order they first appear.
+    """
+
+    candidates: typing.Dict[str, Candidate] = {}
+    ballots = Ballots()
+    for path in paths:
+        part_candidates, part_ballots = load_election(
+            path, use_cache=use_cache, cache_dir=cache_dir
+        )
+        for candidate in part_candidates:
+            candidates.setdefault(candidate.id, candidate)
+        ballots.update(part_ballots)
+    return list(candidates.values()), ballots
+
+
+def load_election(
+    path, jobs=1, use_numpy=False, use_cache=True, cache_dir=None
+) -> typing.Tuple[typing.List[Candidate], typing.Union[Ballots, "arrays.RankMatrix"]]:
+    """Load an election from a text file, a BLT file or a ballot file.
+
+    A text or BLT file's parsed ballots are cached in a ballot file, which is used
+    instead of parsing the text file again for as long as the text file's
+    content is unchanged. Failing to write the cache is not an error.
+    """
+
+    if is_ballot_file(path):
+        return read_ballot_file(path, use_numpy=use_numpy)
+
+    if use_cache:
+        source_hash = file_hash(path)
+        cached = cache_path(path, source_hash, cache_dir)
+        if os.path.exists(cached):
+            try:
+                return read_ballot_file(cached, source_hash, use_numpy)
+            except BallotFileError:
+                pass  # Stale or foreign; parse and overwrite it below
+
+    candidates, ballots = read_input_file(path, jobs=jobs)
+    if use_cache:
+        try:
+            if cache_dir is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+            write_ballot_file(cached, candidates, ballots, source_hash)
+        except OSError:
+            pass
+    if use_numpy:
+        return candidates, arrays.RankMatrix(ballots, candidates)
+    return candidates, ballots
@@ -0,0 +1,175 @@
+"""Counting an election while its votes are still coming in.
+
+A LiveCount keeps the counts of each distinct ranking, the pairwise matrix, the
+index sums behind the average index tiebreaker and the positional tally, and
+updates them with each new batch of votes only. Condorcet and the positional
+systems are then recounted from those, and STV from the ranking counts, without
+going over earlier votes again.
+"""
+
+import time
+import typing
+
+from . import Ballots, Candidate, Vote
+from .batch import count_systems
+from .pairwise import pairwise_matrix
+from .parallel import _add
+from .parse import _parse_ranking
+from .positional import PositionalTally
+from .shared import SharedData
+from .stv import _index_sums
+
+_BLOCK_SIZE = 1 << 20
+
+
+class LiveCount:
+    """Counts of an election with the given candidates that votes can be added
+    to in batches, counted with the given systems.
+    """
+
+    def __init__(
+        self,
+        candidates: typing.List[Candidate],
+        systems: typing.Iterable[str] = ("stv",),
+        num_seats=1,
+        **kwargs,
+    ):
+        self.candidates = list(candidates)
+        self.candidate_ids = {c.id for c in self.candidates}
+        self.systems = list(systems)
+        self.num_seats = num_seats
+        self.kwargs = kwargs
+
+        self.ballots = Ballots()
+        self.pairwise_matrix = pairwise_matrix(self.candidates, self.ballots)
+        self.index_sums = _index_sums(self.candidates, self.ballots)
+        self.positional_tally = PositionalTally(self.candidates, self.ballots)
+
+    def check(self, ranking: typing.Sequence[str]):
+        """Raise ValueError if the ranking lists a candidate not standing."""
+
+        for candidate_id in ranking:
+            if candidate_id not in self.candidate_ids:
+                raise ValueError(f'Found vote with unknown candidate "{candidate_id}"')
+
+    def add(self, votes: typing.Union[Ballots, typing.Iterable[Vote]]):
+        """Count a batch of votes, in time proportional to the size of the
+        batch. A batch with an invalid vote raises an error, and is not counted
+        at all.
+        """
+
+        batch = votes if isinstance(votes, Ballots) else Ballots(votes)
+        for ranking, _ in batch:
+            self.check(ranking)
+        self.ballots.update(batch)
+        _add(self.pairwise_matrix, pairwise_matrix(self.candidates, batch))
+        for total, part in zip(self.index_sums, _index_sums(self.candidates, batch)):
+            _add(total, part)
+        self.positional_tally.add(batch)
+
+    def results(self) -> typing.Dict[str, typing.List[Candidate]]:
+        """Results of each system for the votes added so far."""
+
+        shared = SharedData()
+        shared.data.update(
+            ballots=self.ballots,
+            pairwise_matrix=self.pairwise_matrix,
+            index_sums=self.index_sums,
+            positional_tally=self.positional_tally,
+        )
+        return count_systems(
+            self.systems,
+            self.num_seats,
+            self.candidates,
+            self.ballots,
+            shared=shared,
+            **self.kwargs,
+        )
+
+    def __len__(self):
+        return len(self.ballots)
+
+
+def follow(path, interval=1.0, start=0) -> typing.Iterator[typing.List[str]]:
+    """Yield the lines of a file from byte offset start on in batches: first
+    those already there, a block of the file at a time, then, as lines are
+    appended, those appended since the last batch, checking every interval
+    seconds. A last line is only yielded once it is complete.
+    """
+
+    with open(path, "rb") as f:
+        f.seek(start)
+        partial_line = b""
+        while True:
+            appended = f.read(_BLOCK_SIZE)
+            if not appended:
+                time.sleep(interval)
+                continue
+            lines = (partial_line + appended).split(b"\n")
+            partial_line = lines.pop()
+            if lines:
+                yield [line.rstrip(b"\r").decode("utf-8") for line in lines]
+
+
+def _complete_lines(f) -> typing.Iterator[str]:
+    # Stream the complete lines of f from its position on, leaving it right
+    # after the last one
+    while True:
+        start = f.tell()
+        line = f.readline()
+        if not line.endswith(b"\n"):
+            f.seek(start)
+            return
+        yield line.rstrip(b"\r\n").decode("utf-8")
+
+
+def live_count(
+    path,
+    systems: typing.Iterable[str],
+    num_seats,
+    interval=1.0,
+    on_error: typing.Optional[typing.Callable[[int, str, Exception], None]] = None,
+    **kwargs,
+) -> typing.Iterator[typing.Tuple[int, typing.Dict[str, typing.List[Candidate]]]]:
+    """Follow an election file as votes are appended to it, yielding the number
+    of votes and the results of each system after the votes already in the
+    file, and then after each batch of appended votes.
+
+    The votes already in the file are streamed, as when reading an election.
+    Invalid votes, e.g. listing a candidate not standing, are skipped, calling
+    on_error, if given, with the line number, the line and the error.
+    """
+
+    with open(path, "rb") as f:
+        header = next(_complete_lines(f), None)
+        while header is None:
+            time.sleep(interval)
+            header = next(_complete_lines(f), None)
+        count = LiveCount(
+            [Candidate(id) for id in header.split()], systems, num_seats, **kwargs
+        )
+        line_nr = 1
+
+        def add(lines: typing.Iterable[str]):
+            nonlocal line_nr
+            batch = Ballots()
+            for line in lines:
+                line_nr += 1
+                ranking = _parse_ranking(line)
+                try:
+                    count.check(ranking)
+                    batch.add(ranking)
+                except (RuntimeError, ValueError) as e:
+                    if on_error:
+                        on_error(line_nr, line, e)
+            count.add(batch)
+
+        add(_complete_lines(f))
+        start = f.tell()
+
+    if len(count):
+        yield len(count), count.results()
+    for lines in follow(path, interval, start):
+        add(lines)
+        if len(count):
+            yield len(count), count.results()
@@ -0,0 +1,241 @@
+import typing
+from collections import Counter
+
+from . import Ballots, Candidate, Vote, arrays, as_ballots, parallel
+from .trace import Trace
+
+
+def pairwise_matrix(
+    candidates: typing.List[Candidate],
+    votes: typing.Union[Ballots, typing.List[Vote]],
+    jobs=1,
+) -> typing.Dict[typing.Tuple[str, str], int]:
+    """Count, for every ordered pair of candidates (a, b), the number of votes
+    preferring a over b. Candidates not listed in a vote rank below all listed
+    ones, and a vote listing neither candidate prefers neither.
+
+    Built in a single pass over the votes: a is preferred over b by every vote
+    listing a, except those also listing b before a. With jobs > 1, large
+    elections are split over that many worker processes.
+    """
+
+    votes = as_ballots(votes)
+    if jobs > 1:
+        return parallel.sum_over_shards(pairwise_matrix, candidates, votes, jobs)
+    if isinstance(votes, arrays.RankMatrix):
+        return arrays.pairwise_matrix(candidates, votes)
+
+    num_listed = Counter()
+    listed_before = Counter()
+    for ranking, count in votes:
+        for i, candidate_id in enumerate(ranking):
+            num_listed[candidate_id] += count
+            for earlier_id in ranking[:i]:
+                listed_before[(earlier_id, candidate_id)] += count
+
+    return {
+        (c1.id, c2.id): num_listed[c1.id] - listed_before[(c2.id, c1.id)]
+        for c1 in candidates
+        for c2 in candidates
+        if c1 is not c2
+    }
+
+
+def _render_pairing(id1, num_votes1, id2, num_votes2):
+    if num_votes1 > num_votes2:
+        return f"\t{id1} ({num_votes1}, WIN)\tvs\t{id2} ({num_votes2})"
+    elif num_votes2 > num_votes1:
+        return f"\t{id1} ({num_votes1})\tvs\t{id2} ({num_votes2}, WIN)"
+    return f"\t{id1} ({num_votes1})\tvs\t{id2} ({num_votes2})\tTIED"
+
+
+def _render_pairings(pairings):
+    return "\n".join(
+        ["Condorcet pairings:"] + [_render_pairing(*pairing) for pairing in pairings]
+    )
+
+
+def condorcet_pairings(
+    candidates: typing.List[Candidate],
+    matrix: typing.Dict[typing.Tuple[str, str], int],
+    trace: typing.Optional[Trace] = None,
+):
+    """Add one to the condorcet_score of the winner of each head-to-head
+    pairing between the given candidates.
+    """
+
+    pairings = []
+    for i, candidate1 in enumerate(candidates):
+        for j in range(i + 1, len(candidates)):
+            candidate2 = candidates[j]
+            num_votes1 = matrix[(candidate1.id, candidate2.id)]
+            num_votes2 = matrix[(candidate2.id, candidate1.id)]
+            if num_votes1 > num_votes2:
+                candidate1.condorcet_score += 1
+            elif num_votes2 > num_votes1:
+                candidate2.condorcet_score += 1
+            if trace:
+                pairings.append((candidate1.id, num_votes1, candidate2.id, num_votes2))
+    if trace:
+        trace.record("pairings", _render_pairings, pairings=pairings)
+
+
+class _Reachability:
+    """Which of n candidates reach which others through the directed edges
+    added so far, kept as bit sets both ways, so that checking whether one
+    reaches another is a single lookup.
+    """
+
+    def __init__(self, n):
+        self.reaches = [0] * n
+        self.reached_by = [0] * n
+
+    def __contains__(self, edge: typing.Tuple[int, int]):
+        i, j = edge
+        return bool(self.reaches[i] >> j & 1)
+
+    def add(self, i, j) -> typing.List[typing.Tuple[int, int]]:
+        """Add the edge from i to j and return, for each candidate reaching more
+        of them now, the bit set of those it newly reaches.
+        """
+
+        # Whoever reaches i now also reaches j and whoever j reaches. Those that
+        # already reached j already reached whoever j reaches, and likewise the
+        # other way round, so each newly reachable pair is only visited once.
+        sources = self.reached_by[i] | 1 << i
+        targets = self.reaches[j] | 1 << j
+        new_sources = sources & ~self.reached_by[j]
+        new_targets = targets & ~self.reaches[i]
+        newly_reached = []
+        for k in _bits(new_sources):
+            newly_reached.append((k, targets & ~self.reaches[k]))
+            self.reaches[k] |= targets
+        for k in _bits(new_targets):
+            self.reached_by[k] |= sources
+        return newly_reached
+
+
+def _bits(bit_set: int) -> typing.Iterator[int]:
+    while bit_set:
+        lowest = bit_set & -bit_set
+        yield lowest.bit_length() - 1
+        bit_set ^= lowest
+
+
+def _wins(
+    ids: typing.List[str], matrix: typing.Dict[typing.Tuple[str, str], int]
+) -> typing.List[typing.Tuple[int, int]]:
+    # Head-to-head wins as pairs of indexes of the winner and loser, from the
+    # one with the most votes, then the one with the fewest opposed. The sort is
+    # stable, so equally strong wins are in the order of the candidates.
+    wins = [
+        (i, j)
+        for i in range(len(ids))
+        for j in range(len(ids))
+        if i != j and matrix[(ids[i], ids[j])] > matrix[(ids[j], ids[i])]
+    ]
+    wins.sort(
+        key=lambda w: (-matrix[(ids[w[0]], ids[w[1]])], matrix[(ids[w[1]], ids[w[0]])])
+    )
+    return wins
+
+
+def _render_paths(paths):
+    return "\n".join(
+        ["Schulze strongest paths:"] + [_render_pairing(*path) for path in paths]
+    )
+
+
+def schulze_scores(
+    candidates: typing.List[Candidate],
+    matrix: typing.Dict[typing.Tuple[str, str], int],
+    trace: typing.Optional[Trace] = None,
+) -> typing.Dict[str, int]:
+    """For each of the given candidates, count the others it beats by the
+    Schulze method: its strongest path to them, where a path is as strong as the
+    number of votes of its weakest head-to-head win, is stronger than theirs to
+    it. Unlike head-to-head wins, beating is transitive, so cycles are resolved.
+
+    Rather than updating all strongest paths through each candidate in turn,
+    wins are added from the strongest, and a candidate's strongest path to
+    another is as strong as the win that first connects them.
+    """
+
+    ids = [c.id for c in candidates]
+    paths = [[0] * len(ids) for _ in ids]
+    reachability = _Reachability(len(ids))
+    for i, j in _wins(ids, matrix):
+        if (i, j) not in reachability:
+            strength = matrix[(ids[i], ids[j])]
+            for k, newly_reached in reachability.add(i, j):
+                for t in _bits(newly_reached):
+                    paths[k][t] = strength
+
+    if trace:
+        trace.record(
+            "paths",
+            _render_paths,
+            paths=[
+                (ids[i], paths[i][j], ids[j], paths[j][i])
+                for i in range(len(ids))
+                for j in range(i + 1, len(ids))
+            ],
+        )
+    return {
+        i: sum(1 for j in range(len(ids)) if j != k and paths[k][j] > paths[j][k])
+        for k, i in enumerate(ids)
+    }
+
+
+def _render_locked_pairs(pairs):
+    return "\n".join(
+        ["Ranked pairs, strongest first:"]
+        + [
+            f"\t{winner} ({num_votes}) over {loser} ({num_opposed})\t"
+            + ("LOCKED" if locked else "SKIPPED, would create a cycle")
+            for winner, num_votes, loser, num_opposed, locked in pairs
+        ]
+    )
+
+
+def ranked_pairs_scores(
+    candidates: typing.List[Candidate],
+    matrix: typing.Dict[typing.Tuple[str, str], int],
+    trace: typing.Optional[Trace] = None,
+) -> typing.Dict[str, int]:
+    """For each of the given candidates, count the others it ranks above by the
+    Ranked Pairs method: head-to-head wins are locked in from the one with the
+    most votes, then the one with the fewest opposed, unless locking one would
+    create a cycle with those already locked. A candidate ranks above those it
+    reaches through locked wins.
+    """
+
+    ids = [c.id for c in candidates]
+    reachability = _Reachability(len(ids))
+    pairs = []
+    for i, j in _wins(ids, matrix):
+        locked = (j, i) not in reachability
+        if locked and (i, j) not in reachability:
+            reachability.add(i, j)
+        if trace:
+            pairs.append(
+                (
+                    ids[i],
+                    matrix[(ids[i], ids[j])],
+                    ids[j],
+                    matrix[(ids[j], ids[i])],
+                    locked,
+                )
+            )
+
+    if trace:
+        trace.record("locked_pairs", _render_locked_pairs, pairs=pairs)
+    return {i: bin(reachability.reaches[k]).count("1") for k, i in enumerate(ids)}
+
+
+# Scores of candidates from the pairwise matrix that the STV tiebreaker can use
+# instead of the number of head-to-head wins
+PAIRWISE_SCORES: typing.Dict[str, typing.Callable[..., typing.Dict[str, int]]] = {
+    "schulze": schulze_scores,
+    "ranked_pairs": ranked_pairs_scores,
+}
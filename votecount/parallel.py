@@ -0,0 +1,49 @@
+"""Counting statistics that are sums over votes, such as the pairwise matrix and
+the index sums behind the average index tiebreaker, split over shards of the
+ballots that are counted in worker processes.
+
+Since the statistics are integer sums, adding up the per-shard results gives
+exactly what counting all ballots at once does.
+"""
+
+import typing
+
+# Fewer rankings than this per shard are counted faster than they are shipped
+# to a worker process
+_MIN_SHARD_SIZE = 1 << 12
+
+
+def _add(total: dict, part: dict):
+    for key, value in part.items():
+        total[key] = total.get(key, 0) + value
+
+
+def sum_over_shards(func: typing.Callable, candidates, votes, jobs=1):
+    """Return func(candidates, votes), computed as the sum of func(candidates,
+    shard) over shards of votes in up to jobs worker processes. func must be a
+    module-level function returning a dict, or a tuple of dicts, of integer sums
+    over the votes.
+    """
+
+    shards = votes.shards(jobs, _MIN_SHARD_SIZE) if jobs > 1 else [votes]
+    if len(shards) == 1:
+        return func(candidates, votes)
+
+    # Only imported when needed, as it takes a while
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(len(shards)) as executor:
+        futures = [executor.submit(func, candidates, shard) for shard in shards]
+        # Merge in shard order, so that the result is the same on every run
+        results = [future.result() for future in futures]
+
+    if isinstance(results[0], dict):
+        total = {}
+        for result in results:
+            _add(total, result)
+        return total
+    totals = tuple({} for _ in results[0])
+    for result in results:
+        for total, part in zip(totals, result):
+            _add(total, part)
+    return totals
@@ -0,0 +1,89 @@
+"""Reading elections from the plain text input format: a first line listing all
+candidates, followed by one vote per line, optionally labeled with "<label>:".
+"""
+
+import mmap
+import os
+import re
+import typing
+
+from . import Ballots, Candidate
+
+_VOTER_LABEL = re.compile(r"^.*:\s*")
+_LINE_BREAK = re.compile(rb"\r\n|\r|\n")
+_MIN_CHUNK_SIZE = 1 << 20
+
+
+def _parse_ranking(line: str) -> typing.List[str]:
+    if ":" in line:
+        line = _VOTER_LABEL.sub("", line)  # Remove voter label
+    return line.split()
+
+
+def _parse_lines(lines: typing.Iterable[str], ballots: Ballots):
+    for line in lines:
+        ballots.add(_parse_ranking(line))
+
+
+def _count_chunk(path, start, end) -> typing.Dict[typing.Tuple[str, ...], int]:
+    """Count the distinct rankings on the lines between the given byte offsets.
+    Rankings are validated once merged into Ballots.
+    """
+
+    counts = {}
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        for line in m[start:end].splitlines():
+            ranking = tuple(_parse_ranking(line.decode("utf-8")))
+            counts[ranking] = counts.get(ranking, 0) + 1
+    return counts
+
+
+def _chunks(m: mmap.mmap, start, num_chunks) -> typing.List[typing.Tuple[int, int]]:
+    """Split the bytes from start to the end into about num_chunks ranges, each
+    ending right after a line break.
+    """
+
+    chunk_size = max((len(m) - start) // num_chunks, _MIN_CHUNK_SIZE)
+    chunks = []
+    while start < len(m):
+        end = m.find(b"\n", start + chunk_size)
+        end = len(m) if end == -1 else end + 1
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+
+def read_election(path, jobs=1) -> typing.Tuple[typing.List[Candidate], Ballots]:
+    """Read the candidates and votes of an election file into Ballots.
+
+    The file is streamed line by line, so that only its distinct rankings are
+    held in memory. With jobs > 1, the file is memory-mapped and split into
+    chunks that are parsed in that many worker processes.
+    """
+
+    ballots = Ballots()
+    if jobs <= 1 or os.path.getsize(path) < 2 * _MIN_CHUNK_SIZE:
+        with open(path, encoding="utf-8") as f:
+            candidates = [Candidate(id) for id in f.readline().split()]
+            _parse_lines(f, ballots)
+        return candidates, ballots
+
+    # Only imported when needed, as it takes a while
+    from concurrent.futures import ProcessPoolExecutor
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        line_break = _LINE_BREAK.search(m)
+        header_end = line_break.end() if line_break else len(m)
+        candidates = [Candidate(id) for id in m[:header_end].decode("utf-8").split()]
+        chunks = _chunks(m, header_end, jobs * 4)
+
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = [
+            executor.submit(_count_chunk, path, start, end) for start, end in chunks
+        ]
+        # Merge in file order, so that rankings keep the order they were first
+        # seen in
+        for future in futures:
+            for ranking, count in future.result().items():
+                ballots.add(ranking, count)
+    return candidates, ballots
@@ -0,0 +1,206 @@
+import math
+import typing
+from collections import Counter
+
+from . import Ballots, Candidate, Vote, arrays, as_ballots
+from .profiling import Profile, phase
+from .shared import SharedData, derive
+from .trace import Trace, get_trace, snapshot
+
+
+class PositionalCandidate(Candidate):
+    def __init__(self, id):
+        self.id = id
+        self.points = 0
+        self.last_add = None
+
+    def __str__(self):
+        return f"{self.id}" f"\tpoints={self.points}\tlast_add={self.last_add}"
+
+
+class PositionalTally:
+    """Number of votes ranking each candidate at each position, which is all
+    that positional systems such as Borda and Dowdall need. For spreading points
+    among the candidates a vote omits, it also counts the votes by how many of
+    the candidates they list.
+    """
+
+    def __init__(
+        self,
+        candidates: typing.List[Candidate],
+        votes: typing.Union[Ballots, typing.List[Vote]],
+    ):
+        self.num_candidates = len(candidates)
+        votes = as_ballots(votes)
+        if isinstance(votes, arrays.RankMatrix):
+            (
+                self.at_position,
+                self.num_votes_by_length,
+                self.listed_by_length,
+            ) = arrays.position_counts(candidates, votes)
+            return
+
+        self.at_position: typing.Dict[str, typing.List[int]] = {
+            c.id: [] for c in candidates
+        }
+        self.num_votes_by_length = Counter()
+        self.listed_by_length: typing.Dict[str, Counter] = {
+            c.id: Counter() for c in candidates
+        }
+        self.add(votes)
+
+    def add(self, votes: typing.Iterable[typing.Tuple[typing.Sequence[str], int]]):
+        """Count further (ranking, count) votes into the tally."""
+
+        for ranking, count in votes:
+            length = sum(1 for c in ranking if c in self.at_position)
+            self.num_votes_by_length[length] += count
+            for position, candidate_id in enumerate(ranking):
+                at_position = self.at_position[candidate_id]
+                if len(at_position) <= position:
+                    at_position.extend([0] * (position + 1 - len(at_position)))
+                at_position[position] += count
+                self.listed_by_length[candidate_id][length] += count
+
+    def scores(self, weight: typing.Callable[[int], float]) -> typing.Dict[str, float]:
+        """Total points of each candidate when a vote gives weight(i) points to
+        the candidate listed at position i. Float points are summed exactly
+        (correctly rounded), so they don't depend on the order of the votes, and
+        candidates whose points are equal tie exactly.
+        """
+
+        scores = {}
+        for candidate_id, at_position in self.at_position.items():
+            points = [n * weight(i) for i, n in enumerate(at_position) if n]
+            if any(isinstance(p, float) for p in points):
+                scores[candidate_id] = math.fsum(points)
+            else:
+                scores[candidate_id] = sum(points)
+        return scores
+
+    def omitted_scores(self) -> typing.Dict[str, float]:
+        """Total points of each candidate when a vote gives (1 + number of
+        omitted candidates) / 2 points to each candidate it omits.
+        """
+
+        scores = {}
+        for candidate_id, listed_by_length in self.listed_by_length.items():
+            # Twice the points, so that the sum stays an integer
+            double_points = sum(
+                (n - listed_by_length[length]) * (1 + self.num_candidates - length)
+                for length, n in self.num_votes_by_length.items()
+            )
+            scores[candidate_id] = double_points / 2 if double_points else 0
+        return scores
+
+    def points(
+        self, weight: typing.Callable[[int], float], share_omitted=False
+    ) -> typing.Dict[str, float]:
+        """Total points of each candidate as counted by positional_count."""
+
+        scores = self.scores(weight)
+        if share_omitted:
+            for candidate_id, points in self.omitted_scores().items():
+                scores[candidate_id] += points
+        return scores
+
+
+def _render_standings(ranking_nr, vote_nr, count, total_points, candidates):
+    votes = "vote" if vote_nr == 1 else "votes"
+    header = (
+        f"                 \n======== Standings after ranking {ranking_nr} "
+        f"({vote_nr} {votes}) ========\nVotes casting the ranking: {count}"
+    )
+    if total_points is not None:
+        header += f"\nTotal points assigned in each of its votes: {total_points}"
+    return "\n".join([header] + [str(c) for c in candidates])
+
+
+def positional_count(
+    candidates: typing.List[Candidate],
+    votes: typing.Union[Ballots, typing.List[Vote]],
+    weight: typing.Callable[[int], float],
+    share_omitted=False,
+    do_explain=False,
+    trace: typing.Optional[Trace] = None,
+    shared: typing.Optional[SharedData] = None,
+    profile: typing.Optional[Profile] = None,
+) -> typing.List[PositionalCandidate]:
+    """Count votes by giving weight(i) points to the candidate listed at position
+    i of each vote and, if share_omitted, (1 + number of omitted candidates) / 2
+    points to each candidate the vote omits. Return the candidates by descending
+    points, and candidates with equal points in the order given.
+    """
+
+    with phase(profile, "ballots"):
+        votes = derive(shared, "ballots", lambda: as_ballots(votes))
+    trace = get_trace(do_explain, trace)
+    if trace:
+        with phase(profile, "standings"):
+            _trace_standings(candidates, votes, weight, share_omitted, trace)
+
+    candidates = {c.id: PositionalCandidate(c.id) for c in candidates}
+    with phase(profile, "tally", rankings=votes.num_rankings, votes=len(votes)):
+        tally = derive(
+            shared,
+            "positional_tally",
+            lambda: PositionalTally(list(candidates.values()), votes),
+        )
+    with phase(profile, "scores", candidates=len(candidates)):
+        points = tally.points(weight, share_omitted)
+        for candidate in candidates.values():
+            candidate.points = points[candidate.id]
+
+    return list(sorted(candidates.values(), key=lambda c: c.points, reverse=True))
+
+
+def _trace_standings(
+    candidates: typing.List[Candidate],
+    votes: typing.Union[Ballots, typing.List[Vote]],
+    weight: typing.Callable[[int], float],
+    share_omitted,
+    trace: Trace,
+):
+    """Record the running standings after each distinct ranking is counted, or
+    as sampled by the trace. A ranking is counted for all the votes that cast it
+    at once, so last_add is the points it gave across all of them. The points
+    are summed as positional_count sums them, so the last standings match the
+    result.
+    """
+
+    candidates = {c.id: PositionalCandidate(c.id) for c in candidates}
+    tally = PositionalTally(list(candidates.values()), Ballots())
+    votes = as_ballots(votes)
+    vote_nr = 0
+    for ranking_nr, (ranking, count) in enumerate(votes, 1):
+        vote_nr_before = vote_nr
+        vote_nr += count
+        vote_total_points = 0
+        for c in candidates.values():
+            c.last_add = 0
+        for i, v_candidate in enumerate(ranking):
+            points = weight(i)
+            candidates[v_candidate].last_add = points * count
+            vote_total_points += points
+        if share_omitted:
+            remaining = [c for c in candidates.values() if c.id not in ranking]
+            each = (1 + len(remaining)) / 2
+            for candidate in remaining:
+                candidate.last_add = each * count
+                vote_total_points += each
+        tally.add([(ranking, count)])
+        if trace.sample(vote_nr_before, vote_nr) or vote_nr == len(votes):
+            points = tally.points(weight, share_omitted)
+            for candidate in candidates.values():
+                candidate.points = points[candidate.id]
+            trace.record(
+                "standings",
+                _render_standings,
+                ranking_nr=ranking_nr,
+                vote_nr=vote_nr,
+                count=count,
+                total_points=vote_total_points if share_omitted else None,
+                candidates=snapshot(
+                    sorted(candidates.values(), key=lambda c: c.points, reverse=True)
+                ),
+            )
@@ -0,0 +1,76 @@
+"""Where a count spends its time and memory.
+
+Like traces, profiles are optional, and counting without one only costs a check
+per phase. Each phase records its wall and CPU time, counts such as the number
+of rankings it went over, and memory: the peak memory of the process so far when
+the phase ended, and how much the phase raised that peak. The process's peak
+can't go down, so only phases that need more memory than any before them raise
+it.
+"""
+
+import json
+import sys
+import time
+import typing
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def _max_rss_kb() -> typing.Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # Bytes on macOS
+
+
+class Profile:
+    """Records the phases of a count, e.g. parsing, the tiebreaker statistics
+    and each STV round, in the order they started. Phases started within
+    another phase have a greater depth.
+    """
+
+    def __init__(self):
+        self.phases: typing.List[typing.Dict[str, typing.Any]] = []
+        self._depth = 0
+
+    @contextmanager
+    def phase(self, name, **data):
+        """Record the phase run within the with block. The dict it yields can
+        be updated with further data, e.g. counts only known at its end.
+        """
+
+        record = dict(phase=name, depth=self._depth, **data)
+        self.phases.append(record)
+        self._depth += 1
+        wall, cpu = time.perf_counter(), time.process_time()
+        max_rss = _max_rss_kb()
+        try:
+            yield record
+        finally:
+            record["wall"] = time.perf_counter() - wall
+            record["cpu"] = time.process_time() - cpu
+            record["max_rss_so_far_kb"] = _max_rss_kb()
+            record["max_rss_growth_kb"] = (
+                None if max_rss is None else record["max_rss_so_far_kb"] - max_rss
+            )
+            self._depth -= 1
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        return {"peak_rss_kb": _max_rss_kb(), "phases": self.phases}
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict(), indent=2)
+
+
+def phase(profile: typing.Optional[Profile], name, **data):
+    """profile.phase(name, **data), or a context doing nothing without a
+    profile.
+    """
+
+    if profile is None:
+        return nullcontext({})
+    return profile.phase(name, **data)
@@ -0,0 +1,48 @@
+import typing
+
+from . import Ballots, Candidate, Vote, as_ballots
+from .pairwise import pairwise_matrix, ranked_pairs_scores
+from .profiling import Profile, phase
+from .shared import SharedData, derive
+from .trace import Trace, get_trace
+
+
+class RankedPairsCandidate(Candidate):
+    def __init__(self, id):
+        self.id = id
+        self.ranked_pairs_score = 0
+
+    def __str__(self):
+        return f"{self.id}\tranked_pairs={self.ranked_pairs_score}"
+
+
+def ranked_pairs(
+    num_seats,
+    candidates: typing.List[Candidate],
+    votes: typing.Union[Ballots, typing.List[Vote]],
+    do_explain=False,
+    trace: typing.Optional[Trace] = None,
+    jobs=1,
+    shared: typing.Optional[SharedData] = None,
+    profile: typing.Optional[Profile] = None,
+    **kwargs,
+) -> typing.List[Candidate]:
+    """Ranked Pairs (Tideman)"""
+
+    candidates = [RankedPairsCandidate(c.id) for c in candidates]
+    trace = get_trace(do_explain, trace)
+
+    with phase(profile, "ballots"):
+        votes = derive(shared, "ballots", lambda: as_ballots(votes))
+    with phase(profile, "pairwise", candidates=len(candidates)):
+        matrix = derive(
+            shared,
+            "pairwise_matrix",
+            lambda: pairwise_matrix(candidates, votes, jobs),
+        )
+    with phase(profile, "locking", candidates=len(candidates)):
+        scores = ranked_pairs_scores(candidates, matrix, trace)
+    for candidate in candidates:
+        candidate.ranked_pairs_score = scores[candidate.id]
+
+    return list(sorted(candidates, key=lambda c: c.ranked_pairs_score, reverse=True))
@@ -0,0 +1,127 @@
+"""Counting as a pure function, returning an immutable result.
+
+count never changes the candidates or votes it is given, its results are
+immutable, and it keeps no state between calls. The only thing it adds to is
+the shared data, in which data derived from the votes, such as the pairwise
+matrix, is memoised under a lock. So any number of counts can run at once, e.g.
+in a thread pool, over the same ballots and shared data.
+"""
+
+import typing
+from types import MappingProxyType
+
+from . import Ballots, Candidate, Vote
+from .shared import SharedData
+from .systems import SYSTEMS
+from .trace import Event, Trace
+
+# Systems that count in rounds, recorded in Result.rounds
+_ROUND_SYSTEMS = {"stv", "stv_repeat"}
+
+
+class Standing(typing.NamedTuple):
+    candidate: str
+    # Proportion of the continuing votes
+    votes: float
+    condorcet_score: int
+    avg_index: float
+
+
+class Round(typing.NamedTuple):
+    # Meta round of stv_repeat, or None
+    meta_round: typing.Optional[int]
+    number: int
+    # Before anyone is elected or eliminated in the round, highest first
+    standings: typing.Tuple[Standing, ...]
+    elected: typing.Tuple[str, ...]
+    eliminated: typing.Tuple[str, ...]
+
+
+class Result(typing.NamedTuple):
+    system: str
+    num_seats: int
+    # IDs of the candidates the system returned, in its order: the winners for
+    # STV, every candidate by descending score for the other systems
+    winners: typing.Tuple[str, ...]
+    # Scores and tiebreakers of each of those, e.g. points or condorcet_score
+    scores: typing.Mapping[str, typing.Mapping[str, typing.Any]]
+    rounds: typing.Tuple[Round, ...]
+
+
+class _RoundTrace(Trace):
+    """Keeps only the events that make up Result.rounds."""
+
+    kinds = {
+        "meta_round",
+        "round",
+        "winners",
+        "remaining_winners",
+        "elimination",
+        "bulk_exclusion",
+    }
+
+    def _add(self, event: Event):
+        if event.kind in self.kinds:
+            super()._add(event)
+
+    def sample(self, vote_nr_before, vote_nr) -> bool:
+        return False
+
+
+def _rounds(events: typing.List[Event]) -> typing.Tuple[Round, ...]:
+    rounds: typing.List[Round] = []
+    meta_round = None
+    for event in events:
+        if event.kind == "meta_round":
+            meta_round = event.data["meta_round"]
+            continue
+        if event.kind == "round":
+            standings = tuple(
+                Standing(c.id, c.proportion_of_votes, c.condorcet_score, c.avg_index)
+                for c in event.data["standings"]
+            )
+            rounds.append(Round(meta_round, event.data["round_"], standings, (), ()))
+            continue
+        if not rounds or rounds[-1].meta_round != meta_round:
+            # Winners declared before any round, when no votes are left
+            rounds.append(Round(meta_round, event.data["round_"], (), (), ()))
+        if event.kind in ("winners", "remaining_winners"):
+            elected = tuple(c.id for c in event.data["candidates"])
+            rounds[-1] = rounds[-1]._replace(elected=rounds[-1].elected + elected)
+        elif event.kind == "elimination":
+            eliminated = (event.data["candidate"].id,)
+            rounds[-1] = rounds[-1]._replace(eliminated=eliminated)
+        else:
+            eliminated = tuple(c.id for c in event.data["candidates"])
+            rounds[-1] = rounds[-1]._replace(eliminated=eliminated)
+    return tuple(rounds)
+
+
+def count(
+    system,
+    num_seats,
+    candidates: typing.Sequence[Candidate],
+    votes: typing.Union[Ballots, typing.Sequence[Vote]],
+    shared: typing.Optional[SharedData] = None,
+    **kwargs,
+) -> Result:
+    """Count the election with the given system, by name, and return the result.
+    Other keyword arguments, such as weight or tiebreaker, are passed to the
+    system.
+    """
+
+    trace = _RoundTrace() if system in _ROUND_SYSTEMS else None
+    returned = SYSTEMS[system](
+        num_seats, list(candidates), votes, trace=trace, shared=shared, **kwargs
+    )
+    scores = {
+        c.id: MappingProxyType({k: v for k, v in vars(c).items() if k != "id"})
+        for c in returned
+    }
+    return Result(
+        system,
+        num_seats,
+        tuple(c.id for c in returned),
+        MappingProxyType(scores),
+        _rounds(trace.events) if trace else (),
+    )
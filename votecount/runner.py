@@ -0,0 +1,146 @@
+"""Counting many elections, each with its own system and options, in a pool of
+worker processes, e.g. the committee elections of a night.
+
+Elections are given as directories, glob patterns or manifests. A manifest is a
+JSON Lines file with one election per line, e.g.
+
+    {"path": "board.txt", "system": "stv", "num_seats": 3}
+    {"path": "chapter.txt", "system": "borda_exp", "num_seats": 1, "weight": 0.7}
+
+with paths relative to the manifest. Any of system, num_seats, max_per_vote and
+weight a line leaves out are taken from the defaults, and the seats of BLT files
+from their header if there is no default.
+"""
+
+import glob
+import json
+import os
+import typing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .blt import is_blt_file, read_blt_header
+from .cache import SUFFIX, load_election
+from .result import count
+from .systems import invalid_options
+
+MANIFEST_SUFFIX = ".jsonl"
+
+
+class Job(typing.NamedTuple):
+    path: str
+    system: typing.Optional[str] = None
+    num_seats: typing.Optional[int] = None
+    max_per_vote: typing.Optional[int] = None
+    weight: typing.Optional[float] = None
+
+
+def _directory_paths(directory) -> typing.List[str]:
+    names = {name for name in os.listdir(directory) if not name.startswith(".")}
+    return [
+        os.path.join(directory, name)
+        for name in sorted(names)
+        # Skip manifests, and the ballot files caching the others
+        if not name.endswith(MANIFEST_SUFFIX)
+        and not (name.endswith(SUFFIX) and name[: -len(SUFFIX)] in names)
+        and os.path.isfile(os.path.join(directory, name))
+    ]
+
+
+def _manifest_jobs(path, defaults: Job) -> typing.List[Job]:
+    jobs = []
+    with open(path, encoding="utf-8") as f:
+        for line_nr, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                fields = {k: entry[k] for k in Job._fields if k in entry}
+                fields["path"] = os.path.join(os.path.dirname(path), entry["path"])
+            except (ValueError, TypeError, KeyError) as e:
+                raise ValueError(f"{path}, line {line_nr}: invalid entry: {e}")
+            jobs.append(defaults._replace(**fields))
+    return jobs
+
+
+def find_jobs(
+    sources: typing.Iterable[str],
+    system=None,
+    num_seats=None,
+    max_per_vote=None,
+    weight=None,
+) -> typing.List[Job]:
+    """The elections to count in the given directories, manifests or glob
+    patterns, in that order, with the given defaults.
+    """
+
+    defaults = Job("", system, num_seats, max_per_vote, weight)
+    jobs = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths = _directory_paths(source)
+        elif os.path.isfile(source) and source.endswith(MANIFEST_SUFFIX):
+            jobs.extend(_manifest_jobs(source, defaults))
+            continue
+        else:
+            paths = sorted(glob.glob(source)) or [source]
+        jobs.extend(defaults._replace(path=path) for path in paths)
+    return jobs
+
+
+def run_job(job: Job, use_cache=True, cache_dir=None) -> typing.Dict[str, typing.Any]:
+    """Count one election, returning the job with the IDs of the winners, or
+    with the error that kept it from being counted. The seats of a BLT file
+    are read from its header unless the job gives them.
+    """
+
+    if job.num_seats is None and is_blt_file(job.path):
+        try:
+            job = job._replace(num_seats=read_blt_header(job.path)[1])
+        except Exception as e:
+            return dict(job._asdict(), error=f"{type(e).__name__}: {e}")
+    record: typing.Dict[str, typing.Any] = job._asdict()
+    error = invalid_options([job.system], job.num_seats, job.weight)
+    if error:
+        record["error"] = error
+        return record
+    try:
+        candidates, votes = load_election(
+            job.path, use_cache=use_cache, cache_dir=cache_dir
+        )
+        result = count(
+            job.system,
+            job.num_seats,
+            candidates,
+            votes,
+            max_per_vote=job.max_per_vote,
+            weight=job.weight,
+        )
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    else:
+        record["winners"] = list(result.winners[: job.num_seats])
+    return record
+
+
+def run_jobs(
+    jobs: typing.Iterable[Job], workers=None, use_cache=True, cache_dir=None
+) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    """Count the elections in up to workers processes, by default one per CPU,
+    yielding the result of each as soon as it is counted. An election that
+    fails gives a result with its error, without affecting the others.
+    """
+
+    if workers == 1:
+        for job in jobs:
+            yield run_job(job, use_cache, cache_dir)
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        futures = {
+            executor.submit(run_job, job, use_cache, cache_dir): job for job in jobs
+        }
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:  # E.g. a worker process died
+                yield dict(futures[future]._asdict(), error=f"{type(e).__name__}: {e}")
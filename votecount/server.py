@@ -0,0 +1,178 @@
+"""A long-running local server counting elections it keeps loaded.
+
+Clients connect over a Unix socket or a TCP port on localhost and send one JSON
+request per line, e.g.
+
+    {"path": "election.txt", "system": "borda_exp", "num_seats": 3, "weight": 0.7}
+
+and get one JSON response per line, in order: {"winners": [...]} with the IDs
+of the winners, or {"error": "..."}. Elections are loaded on first use and kept
+along with their derived data, such as the pairwise matrix, until the file
+changes or they are evicted as the least recently used.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import typing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from . import Ballots, Candidate
+from .cache import load_election
+from .shared import SharedData
+from .systems import SYSTEMS, invalid_options
+
+
+class Election(typing.NamedTuple):
+    candidates: typing.List[Candidate]
+    ballots: Ballots
+    shared: SharedData
+    # Of the file when loaded, to tell when it changes
+    mtime_ns: int
+    size: int
+
+
+class Elections:
+    """Loaded elections by path, holding at most max_elections of them and at
+    most max_rankings distinct rankings between them, evicting the least
+    recently used beyond that. The most recently used election is always kept.
+
+    Safe to use from several threads: an election is loaded by one thread at a
+    time, while others get or load other elections.
+    """
+
+    def __init__(self, max_elections=8, max_rankings: typing.Optional[int] = None):
+        self.max_elections = max_elections
+        self.max_rankings = max_rankings
+        self.elections: "OrderedDict[str, Election]" = OrderedDict()
+        # Guards elections and load_locks, and is never held while loading
+        self.lock = threading.Lock()
+        # Lock of each path being got, with the number of threads getting it
+        self.load_locks: typing.Dict[str, typing.List[typing.Any]] = {}
+
+    def get(self, path) -> Election:
+        path = os.path.abspath(path)
+        with self.lock:
+            load_lock = self.load_locks.setdefault(path, [threading.Lock(), 0])
+            load_lock[1] += 1
+        try:
+            with load_lock[0]:
+                return self._get(path)
+        finally:
+            with self.lock:
+                load_lock[1] -= 1
+                if not load_lock[1]:
+                    del self.load_locks[path]
+
+    def _get(self, path) -> Election:
+        """Get the election at path, under its load lock."""
+
+        stat = os.stat(path)
+        with self.lock:
+            election = self.elections.get(path)
+        if election is None or (election.mtime_ns, election.size) != (
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            candidates, ballots = load_election(path)
+            election = Election(
+                candidates, ballots, SharedData(), stat.st_mtime_ns, stat.st_size
+            )
+        with self.lock:
+            self.elections[path] = election
+            self.elections.move_to_end(path)
+            self._evict()
+        return election
+
+    def _evict(self):
+        while len(self.elections) > 1 and (
+            len(self.elections) > self.max_elections
+            or (
+                self.max_rankings is not None
+                and sum(e.ballots.num_rankings for e in self.elections.values())
+                > self.max_rankings
+            )
+        ):
+            self.elections.popitem(last=False)
+
+
+def _invalid(request) -> typing.Optional[str]:
+    if not isinstance(request, dict):
+        return "invalid request: not an object"
+    if not isinstance(request.get("path"), str):
+        return "path is required"
+    return invalid_options(
+        [request.get("system")], request.get("num_seats"), request.get("weight")
+    )
+
+
+def count(election: Election, request: typing.Dict[str, typing.Any]) -> dict:
+    """Answer a valid request on its election."""
+
+    winners = SYSTEMS[request["system"]](
+        request["num_seats"],
+        election.candidates,
+        election.ballots,
+        shared=election.shared,
+        max_per_vote=request.get("max_per_vote"),
+        weight=request.get("weight"),
+    )
+    return {"winners": [winner.id for winner in winners]}
+
+
+class Server:
+    """Answers requests from each client in order, and those of different
+    clients concurrently, in a pool of threads. Loading an election only holds
+    up the requests on that election.
+    """
+
+    def __init__(self, elections: Elections, max_workers=None):
+        self.elections = elections
+        self.executor = ThreadPoolExecutor(max_workers)
+
+    async def _answer(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {"error": f"invalid request: {e}"}
+        error = _invalid(request)
+        if error:
+            return {"error": error}
+
+        loop = asyncio.get_running_loop()
+        try:
+            election = await loop.run_in_executor(
+                self.executor, self.elections.get, request["path"]
+            )
+            return await loop.run_in_executor(self.executor, count, election, request)
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}"}
+
+    async def serve_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                response = await self._answer(line)
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def start(self, socket_path=None, port=None):
+        if socket_path is not None:
+            return await asyncio.start_unix_server(self.serve_client, socket_path)
+        return await asyncio.start_server(self.serve_client, "127.0.0.1", port)
+
+
+async def serve(socket_path=None, port=None, max_elections=8, max_rankings=None):
+    """Serve on the Unix socket or localhost port until cancelled."""
+
+    server = Server(Elections(max_elections, max_rankings))
+    async with await server.start(socket_path, port) as listener:
+        await listener.serve_forever()
@@ -0,0 +1,38 @@
+"""Data derived from the votes of an election that several counting systems use,
+such as the pairwise matrix, so that counting one election with several systems
+derives it only once.
+"""
+
+import threading
+import typing
+
+
+class SharedData:
+    """Derived data of one election, by kind. Only pass it to counting systems
+    counting the same candidates and votes it was first passed with. Counts
+    running at once in several threads may share it: each kind of data is still
+    derived only once, while the others wait for it.
+    """
+
+    def __init__(self):
+        self.data: typing.Dict[str, typing.Any] = {}
+        self.locks: typing.Dict[str, threading.Lock] = {}
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<SharedData: {', '.join(self.data)}>"
+
+
+def derive(shared: typing.Optional[SharedData], kind, compute: typing.Callable):
+    """Return compute(), or, given shared data, the data of that kind it holds,
+    computing it first if it holds none yet.
+    """
+
+    if shared is None:
+        return compute()
+    with shared.lock:
+        lock = shared.locks.setdefault(kind, threading.Lock())
+    with lock:
+        if kind not in shared.data:
+            shared.data[kind] = compute()
+    return shared.data[kind]
@@ -1,8 +1,13 @@
+import heapq
 import typing
-from copy import deepcopy
-from statistics import mean
+from collections import Counter
+from fractions import Fraction
 
-from . import Candidate, Vote, explain
+from . import Ballots, Candidate, Vote, arrays, as_ballots, parallel
+from .pairwise import PAIRWISE_SCORES, condorcet_pairings, pairwise_matrix
+from .profiling import Profile, phase
+from .shared import SharedData, derive
+from .trace import Trace, get_trace, lines, snapshot
 
 
 class STVCandidate(Candidate):
@@ -28,83 +33,241 @@ class STVCandidate(Candidate):
         )
 
 
-def _condorcet_pair(
-    candidate1: STVCandidate,
-    candidate2: STVCandidate,
-    votes: typing.List[Vote],
-    do_explain,
-):
-    # Remove all candidates from votes for other candidates
-    candidates = {candidate1.id: candidate1, candidate2.id: candidate2}
-    for vote in votes:
-        vote.candidates = list(filter(lambda c: c in candidates, vote.candidates))
-
-    # Remove empty votes
-    votes = list(filter(lambda v: len(v.candidates) > 0, votes))
-
-    # Reset tallies
-    for candidate in candidates.values():
-        candidate.num_votes = 0
-        candidate.proportion_of_votes = 0
-
-    # Count votes
-    for vote in votes:
-        try:
-            candidate_id = vote.candidates[0]
-        except IndexError:
-            raise RuntimeError("should never happen; no empty votes should exist here")
-        candidates[candidate_id].num_votes += 1
-
-    if candidate1.num_votes > candidate2.num_votes:
-        explain(
-            f"\t{candidate1.id} ({candidate1.num_votes}, WIN)\tvs\t"
-            f"{candidate2.id} ({candidate2.num_votes})",
-            do_explain,
-        )
-        candidate1.condorcet_score += 1
-    elif candidate2.num_votes > candidate1.num_votes:
-        explain(
-            f"\t{candidate1.id} ({candidate1.num_votes})\tvs\t"
-            f"{candidate2.id} ({candidate2.num_votes}, WIN)",
-            do_explain,
-        )
-        candidate2.condorcet_score += 1
-    else:
-        explain(
-            f"\t{candidate1.id} ({candidate1.num_votes})\tvs\t"
-            f"{candidate2.id} ({candidate2.num_votes})\tTIED",
-            do_explain,
-        )
+def _by_standing(
+    candidates: typing.Iterable[STVCandidate],
+) -> typing.List[STVCandidate]:
+    return sorted(
+        candidates,
+        key=lambda c: (c.proportion_of_votes, c.condorcet_score, -c.avg_index),
+        reverse=True,
+    )
+
+
+def _render_avg_indexes(avg_indexes):
+    return "\n".join(
+        ["Average indexes (i.e. positions) in votes:"]
+        + [f"\t{candidate_id}\t{avg_index}" for candidate_id, avg_index in avg_indexes]
+    )
+
+
+def _render_round(round_, standings):
+    return lines(
+        f"                 \n======== ROUND {round_} ========\nStandings:", standings
+    )
+
+
+def _render_quota_met(quota, candidates):
+    return lines(
+        f"{len(candidates)} candidates meet the victory quota of {quota}:", candidates
+    )
+
+
+def _render_excess_winners(candidates):
+    return lines(
+        "There are more winners this round than there are seats left. "
+        "Eliminating those with the lowest proportions of votes, "
+        "lowest condorcet scores and highest average indexes:",
+        candidates,
+    )
+
+
+def _render_winners(round_, candidates):
+    return lines(
+        "The following candidates have been declared winners in this round:",
+        candidates,
+    )
+
+
+def _render_seats_filled(num_seats):
+    return f"All {num_seats} seats have been filled."
+
+
+def _render_elimination(quota, candidate):
+    return (
+        f"No candidates meet the victory quota of {quota}. "
+        "Eliminating the candidate with the lowest proportion of votes, "
+        f"lowest condorcet score and highest average index:\n"
+        f"\t{candidate}"
+    )
+
+
+def _render_bulk_exclusion(quota, candidates):
+    return lines(
+        f"No candidates meet the victory quota of {quota}. "
+        f"Eliminating the {len(candidates)} candidates with the lowest proportions "
+        "of votes, which even combined are fewer than those of any other candidate:",
+        candidates,
+    )
+
+
+def _render_transfer(candidate_ids, num_votes_before, num_votes):
+    return None  # Not part of the --explain text
+
+
+def _render_seats_left(num_seats_left, num_seats):
+    return f"{num_seats_left} of {num_seats} seats are still to be filled."
+
+
+def _render_remaining_winners(round_, candidates):
+    return lines(
+        "Remaining candidates cannot meet the quota, but since there are enough "
+        "seats left for them, they will be declared winners:",
+        candidates,
+    )
+
+
+def _render_meta_round(meta_round):
+    return f"                 \n======== STV META ROUND {meta_round} ========"
+
+
+def _render_meta_round_winner(meta_round, winner_id):
+    return f"STV META ROUND WINNER: {winner_id}"
 
 
 def _condorcet(
-    candidates: typing.List[STVCandidate], votes: typing.List[Vote], do_explain
+    candidates: typing.List[STVCandidate],
+    votes: Ballots,
+    trace: typing.Optional[Trace],
+    jobs=1,
+    shared: typing.Optional[SharedData] = None,
+    tiebreaker="condorcet",
 ):
-    explain("Condorcet pairings:", do_explain)
-    for i, candidate1 in enumerate(candidates):
-        for j in range(i + 1, len(candidates)):
-            candidate2 = candidates[j]
-            # print(candidate1, candidate2)
-            _condorcet_pair(candidate1, candidate2, deepcopy(votes), do_explain)
+    matrix = derive(
+        shared, "pairwise_matrix", lambda: pairwise_matrix(candidates, votes, jobs)
+    )
+    _set_condorcet_scores(candidates, matrix, trace, tiebreaker)
+
+
+def _set_condorcet_scores(
+    candidates: typing.List[STVCandidate],
+    matrix: typing.Dict[typing.Tuple[str, str], int],
+    trace: typing.Optional[Trace],
+    tiebreaker="condorcet",
+):
+    """Set the primary tiebreaker of the candidates, their condorcet_score, to
+    their number of head-to-head wins, or to the number of candidates they beat
+    by the Schulze or Ranked Pairs method, which resolve cycles.
+    """
+
+    if tiebreaker == "condorcet":
+        condorcet_pairings(candidates, matrix, trace)
+        return
+    if tiebreaker not in PAIRWISE_SCORES:
+        raise ValueError(f"Unknown tiebreaker: {tiebreaker}")
+    scores = PAIRWISE_SCORES[tiebreaker](candidates, matrix, trace)
+    for candidate in candidates:
+        candidate.condorcet_score = scores[candidate.id]
+
+
+def _index_sums(
+    candidates: typing.List[STVCandidate], votes: Ballots
+) -> typing.Tuple[typing.Dict[str, int], typing.Dict[str, int]]:
+    """For each candidate, sum twice its index in every vote, so that the
+    midpoints below stay integers, and count the votes listing it. Done in one
+    pass over the votes.
+    """
+
+    if isinstance(votes, arrays.RankMatrix):
+        return arrays.index_sums(candidates, votes)
+
+    idx_of_last_not_listed = len(candidates) - 1
+    unlisted_sum = 0
+    listed_sums = Counter()
+    num_listed = Counter()
+    for ranking, count in votes:
+        # Where a candidate is not listed, its index is the midpoint of the
+        # unlisted positions. Add that for every candidate, then correct below
+        # for the candidates that are listed.
+        idx_of_first_not_listed = len(ranking)
+        double_unlisted_idx = idx_of_first_not_listed + idx_of_last_not_listed
+        unlisted_sum += double_unlisted_idx * count
+        for idx, candidate_id in enumerate(ranking):
+            listed_sums[candidate_id] += (2 * idx - double_unlisted_idx) * count
+            num_listed[candidate_id] += count
+
+    double_index_sums = {c.id: unlisted_sum + listed_sums[c.id] for c in candidates}
+    return double_index_sums, {c.id: num_listed[c.id] for c in candidates}
 
 
 def _avg_index(
-    candidates: typing.List[STVCandidate], votes: typing.List[Vote], do_explain
+    candidates: typing.List[STVCandidate],
+    votes: Ballots,
+    trace: typing.Optional[Trace] = None,
+    jobs=1,
+    shared: typing.Optional[SharedData] = None,
+):
+    double_index_sums, num_listed = derive(
+        shared,
+        "index_sums",
+        lambda: parallel.sum_over_shards(_index_sums, candidates, votes, jobs),
+    )
+    _set_avg_index(candidates, double_index_sums, num_listed, len(votes), trace)
+
+
+def _set_avg_index(
+    candidates: typing.List[STVCandidate],
+    double_index_sums: typing.Dict[str, int],
+    num_listed: typing.Dict[str, int],
+    num_votes,
+    trace: typing.Optional[Trace] = None,
 ):
-    explain("Average indexes (i.e. positions) in votes:", do_explain)
     for candidate in candidates:
-        candidate_indexes = []
-        for vote in votes:
-            try:
-                idx = vote.candidates.index(candidate.id)
-            except ValueError:
-                # Candidate not listed in vote
-                idx_of_first_not_listed = len(vote.candidates)
-                idx_of_last_not_listed = len(candidates) - 1
-                idx = (idx_of_first_not_listed + idx_of_last_not_listed) / 2
-            candidate_indexes.append(idx)
-        candidate.avg_index = mean(candidate_indexes)
-        explain(f"\t{candidate.id}\t{candidate.avg_index}", do_explain)
+        candidate.avg_index = _mean(
+            double_index_sums[candidate.id],
+            2 * num_votes,
+            num_listed[candidate.id] == num_votes,
+        )
+    if trace:
+        trace.record(
+            "avg_indexes",
+            _render_avg_indexes,
+            avg_indexes=[(c.id, c.avg_index) for c in candidates],
+        )
+
+
+def _index_sums_without(
+    double_index_sums: typing.Dict[str, int],
+    num_listed: typing.Dict[str, int],
+    matrix: typing.Dict[typing.Tuple[str, str], int],
+    removed_id,
+    num_votes,
+    num_dropped,
+) -> typing.Tuple[typing.Dict[str, int], typing.Dict[str, int]]:
+    """Update the result of _index_sums for removing a candidate from every
+    vote, without another pass over the votes. num_dropped of the num_votes
+    votes listed only the removed candidate, and are dropped.
+
+    Removing w moves each other candidate c up one position in the votes
+    listing w before c. Where c is unlisted, its midpoint index drops by one,
+    and by one more where w was listed, since the vote then lists one fewer
+    candidate. Both are counted by the pairwise matrix: the votes listing w but
+    not after c are those preferring w over c, and those listing neither are
+    the rest of the ones preferring neither.
+    """
+
+    num_candidates = len(double_index_sums)
+    double_index_sums = {
+        c: double_index_sum
+        - 2 * matrix[(removed_id, c)]
+        - (num_votes - matrix[(removed_id, c)] - matrix[(c, removed_id)])
+        # Dropped votes were counted with 2 less than their whole
+        # contribution, the midpoint of all num_candidates positions
+        - (num_candidates - 2) * num_dropped
+        for c, double_index_sum in double_index_sums.items()
+        if c != removed_id
+    }
+    return double_index_sums, {c: n for c, n in num_listed.items() if c != removed_id}
+
+
+def _mean(numerator, denominator, integral):
+    """Exact mean matching statistics.mean: an int if all averaged values were
+    ints and the result is whole, a correctly rounded float otherwise.
+    """
+
+    value = Fraction(numerator, denominator)
+    if integral and value.denominator == 1:
+        return int(value)
+    return float(value)
 
 
 def _find_candidate_to_eliminate(candidates: typing.List[STVCandidate]) -> STVCandidate:
@@ -114,142 +277,360 @@ def _find_candidate_to_eliminate(candidates: typing.List[STVCandidate]) -> STVCa
     )[0]
 
 
+class _Standings:
+    """Continuing candidates in a heap, in the order they are eliminated in:
+    fewest votes, then lowest condorcet score, then highest average index, then
+    first given. Candidates whose votes changed are pushed again and outdated
+    entries skipped, so that finding the next to eliminate doesn't sort every
+    candidate every round.
+    """
+
+    def __init__(self, candidates: typing.Dict[str, STVCandidate]):
+        self.candidates = candidates
+        self.order = {candidate_id: i for i, candidate_id in enumerate(candidates)}
+        self.heap = [self._entry(c) for c in candidates.values()]
+        heapq.heapify(self.heap)
+
+    def _entry(self, candidate: STVCandidate):
+        return (
+            candidate.num_votes,
+            candidate.condorcet_score,
+            -candidate.avg_index,
+            self.order[candidate.id],
+            candidate.id,
+        )
+
+    def push(self, candidates: typing.Iterable[STVCandidate]):
+        for candidate in candidates:
+            heapq.heappush(self.heap, self._entry(candidate))
+
+    def update(self, candidate_ids: typing.Iterable[str]):
+        """Push again the continuing candidates among those whose votes changed."""
+        self.push(self.candidates[c] for c in candidate_ids if c in self.candidates)
+
+    def pop_lowest(self) -> typing.Optional[STVCandidate]:
+        """Remove the continuing candidate to eliminate next and return it, or
+        None if there are none.
+        """
+
+        while self.heap:
+            num_votes, *_, candidate_id = heapq.heappop(self.heap)
+            candidate = self.candidates.get(candidate_id)
+            # Continuing candidates only gain votes, so an entry with the
+            # current number of votes is current
+            if candidate is not None and candidate.num_votes == num_votes:
+                return candidate
+        return None
+
+
+def _hopeless(
+    standings: _Standings, num_votes, victory_quota
+) -> typing.List[STVCandidate]:
+    """Remove from standings and return the largest group of lowest candidates
+    that eliminating one candidate per round would eliminate in the next rounds,
+    in some order, or else just the lowest candidate.
+
+    Those are the lowest candidates whose combined votes are fewer than those of
+    the next candidate up: as they are eliminated, none of them can gain more
+    than their combined votes, while every other candidate keeps at least its
+    own. Also, no candidate may meet the quota in between, even if gaining all
+    their votes while all of them are exhausted. Since a vote goes to its first
+    preference that is not eliminated, whatever the order of eliminations,
+    eliminating them at once then leaves the count where it would have been.
+    """
+
+    most_votes = max(c.num_votes for c in standings.candidates.values())
+    lowest = []
+    num_excluded = 1
+    combined_votes = 0
+    while True:
+        candidate = standings.pop_lowest()
+        if candidate is None:
+            break
+        if len(lowest) > 1 and combined_votes < candidate.num_votes:
+            num_excluded = len(lowest)
+        lowest.append(candidate)
+        combined_votes += candidate.num_votes
+        if (
+            combined_votes >= num_votes
+            or (most_votes + combined_votes) / (num_votes - combined_votes)
+            >= victory_quota
+        ):
+            break
+    standings.push(lowest[num_excluded:])
+    return lowest[:num_excluded]
+
+
+class _Piles:
+    """Each continuing candidate's pile of (ranking, position, count) entries,
+    where ranking[position] is the candidate. Keeps the candidates' num_votes and
+    the total number of continuing votes up to date as piles are transferred.
+
+    The ballots are never changed: candidates that are elected, eliminated or
+    excluded from the start are kept in a set of removed candidates, which
+    positions skip.
+    """
+
+    def __init__(
+        self,
+        ballots: Ballots,
+        candidates: typing.Dict[str, STVCandidate],
+        excluded: typing.Iterable[str] = (),
+    ):
+        self.candidates = candidates
+        self.piles = {candidate_id: [] for candidate_id in candidates}
+        self.removed = set(excluded)
+        self.num_votes = 0
+        # Candidates given votes since last taken with pop_changed
+        self.changed = set()
+        for ranking, count in ballots:
+            self._place_from(ranking, 0, count)
+
+    def _place(self, ranking, position, count):
+        self.piles[ranking[position]].append((ranking, position, count))
+        self.candidates[ranking[position]].num_votes += count
+        self.num_votes += count
+        self.changed.add(ranking[position])
+
+    def pop_changed(self) -> typing.Set[str]:
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def transfer(self, candidate_ids: typing.Iterable[str]) -> typing.Tuple[int, int]:
+        """Move the piles of the given candidates to the next preference of each
+        ranking that has not been transferred away from. Exhausted votes are
+        dropped. Return the number of rankings and of votes moved.
+        """
+
+        candidate_ids = list(candidate_ids)
+        self.removed.update(candidate_ids)
+        num_rankings = num_votes = 0
+        for candidate_id in candidate_ids:
+            for ranking, position, count in self.piles.pop(candidate_id):
+                num_rankings += 1
+                num_votes += count
+                self.num_votes -= count
+                self._place_from(ranking, position + 1, count)
+        return num_rankings, num_votes
+
+    def _place_from(self, ranking, position, count):
+        # Place on the first preference from position on that is not removed,
+        # if any
+        while position < len(ranking) and ranking[position] in self.removed:
+            position += 1
+        if position < len(ranking):
+            self._place(ranking, position, count)
+
+
+def _transfer(
+    piles, candidate_ids: typing.List[str], trace: typing.Optional[Trace]
+) -> typing.Tuple[int, int]:
+    num_votes_before = piles.num_votes
+    moved = piles.transfer(candidate_ids)
+    if trace:
+        trace.record(
+            "transfer",
+            _render_transfer,
+            candidate_ids=candidate_ids,
+            num_votes_before=num_votes_before,
+            num_votes=piles.num_votes,
+        )
+    return moved
+
+
 def stv(
     num_seats,
     candidates: typing.List[Candidate],
-    votes: typing.List[Vote],
+    votes: typing.Union[Ballots, typing.List[Vote]],
     do_explain=False,
+    trace: typing.Optional[Trace] = None,
+    jobs=1,
+    shared: typing.Optional[SharedData] = None,
+    profile: typing.Optional[Profile] = None,
+    bulk_exclusion=False,
+    tiebreaker="condorcet",
     **kwargs,
 ) -> typing.List[Candidate]:
     """Single Transferable Vote"""
 
     candidates = {c.id: STVCandidate(c.id) for c in candidates}
+    with phase(profile, "ballots"):
+        ballots = derive(shared, "ballots", lambda: as_ballots(votes))
+    trace = get_trace(do_explain, trace)
+
+    with phase(profile, "avg_index", candidates=len(candidates)):
+        _avg_index(list(candidates.values()), ballots, trace, jobs, shared)
+    with phase(profile, "condorcet", candidates=len(candidates)):
+        _condorcet(list(candidates.values()), ballots, trace, jobs, shared, tiebreaker)
+
+    piles = _piles(ballots, candidates, profile=profile)
+    return _count(num_seats, candidates, piles, trace, profile, bulk_exclusion)
+
+
+def _piles(
+    ballots: Ballots,
+    candidates: typing.Dict[str, STVCandidate],
+    excluded: typing.Iterable[str] = (),
+    profile: typing.Optional[Profile] = None,
+):
+    """Pile every vote on its first preference among the candidates, skipping
+    the excluded ones. From here on, only the piles of elected or eliminated
+    candidates are recounted.
+    """
+
+    with phase(profile, "piles", rankings=ballots.num_rankings, votes=len(ballots)):
+        if isinstance(ballots, arrays.RankMatrix):
+            return arrays.ArrayPiles(ballots, candidates, excluded)
+        return _Piles(ballots, candidates, excluded)
+
+
+def _count(
+    num_seats,
+    candidates: typing.Dict[str, STVCandidate],
+    piles: _Piles,
+    trace: typing.Optional[Trace],
+    profile: typing.Optional[Profile] = None,
+    bulk_exclusion=False,
+) -> typing.List[STVCandidate]:
+    """Count the piled votes for candidates whose tiebreakers are already set.
+    With bulk_exclusion, candidates who cannot catch up with the next one up are
+    eliminated together, in a single round (see _hopeless).
+    """
 
     victory_quota = 1 / num_seats
     winners = []
-
-    _avg_index(list(candidates.values()), votes, do_explain)
-    _condorcet(list(candidates.values()), deepcopy(votes), do_explain)
+    piles.pop_changed()
+    standings = _Standings(candidates)
 
     round_ = 0
-    while votes:
+    while piles.num_votes:
         round_ += 1
+        with phase(
+            profile,
+            "round",
+            round=round_,
+            candidates=len(candidates),
+            votes=piles.num_votes,
+            rankings_moved=0,
+            votes_moved=0,
+            eliminated=0,
+        ) as record:
+
+            # Calculate proportions
+            for candidate in candidates.values():
+                candidate.proportion_of_votes = candidate.num_votes / piles.num_votes
+
+            if trace:
+                trace.record(
+                    "round",
+                    _render_round,
+                    round_=round_,
+                    standings=snapshot(_by_standing(candidates.values())),
+                )
 
-        # Reset tallies
-        for candidate in candidates.values():
-            candidate.num_votes = 0
-            candidate.proportion_of_votes = 0
-
-        # Count votes and calculate proportions
-        for vote in votes:
-            try:
-                candidate_id = vote.candidates[0]
-            except IndexError:
-                raise RuntimeError(
-                    "should never happen; no empty votes should exist here"
+            # Find new winners
+            new_winners = []
+            for candidate in candidates.values():
+                if candidate.proportion_of_votes >= victory_quota:
+                    new_winners.append(candidate)
+
+            # Is there a winner?
+            if new_winners:
+                # Yes
+                if trace:
+                    trace.record(
+                        "quota_met",
+                        _render_quota_met,
+                        quota=victory_quota,
+                        candidates=snapshot(new_winners),
+                    )
+                # Remove excess winners based on condorcet score
+                num_tied_for_last = len(winners) + len(new_winners) - num_seats
+                if num_tied_for_last > 0:
+                    excess_winners = []
+                    for i in range(num_tied_for_last):
+                        eliminate = _find_candidate_to_eliminate(new_winners)
+                        excess_winners.append(eliminate)
+                        new_winners.remove(eliminate)
+                    if trace:
+                        trace.record(
+                            "excess_winners",
+                            _render_excess_winners,
+                            candidates=snapshot(excess_winners),
+                        )
+                new_winners = _by_standing(new_winners)
+                if trace:
+                    trace.record(
+                        "winners",
+                        _render_winners,
+                        round_=round_,
+                        candidates=snapshot(new_winners),
+                    )
+                for winner in new_winners:
+                    winners.append(candidates.pop(winner.id))
+                    winner.won_in_round = round_
+
+                if len(winners) >= num_seats:
+                    # All seats filled
+                    if trace:
+                        trace.record(
+                            "seats_filled", _render_seats_filled, num_seats=num_seats
+                        )
+                    break
+                # Transfer votes of new winners
+                record["rankings_moved"], record["votes_moved"] = _transfer(
+                    piles, [winner.id for winner in new_winners], trace
                 )
-            candidates[candidate_id].num_votes += 1
-        for candidate in candidates.values():
-            candidate.proportion_of_votes = candidate.num_votes / len(votes)
-
-        explain(f"                 \n======== ROUND {round_} ========", do_explain)
-        explain("Standings:", do_explain)
-        # explain("\tCandidate\tProportion of votes\tCondorcet score\tAverage index")
-        for candidate in sorted(
-            candidates.values(),
-            key=lambda c: (c.proportion_of_votes, c.condorcet_score, -c.avg_index),
-            reverse=True,
-        ):
-            explain(f"\t{candidate}", do_explain)
-
-        # Find new winners
-        new_winners = []
-        for candidate in candidates.values():
-            if candidate.proportion_of_votes >= victory_quota:
-                new_winners.append(candidate)
-
-        # Is there a winner?
-        if new_winners:
-            # Yes
-            explain(
-                f"{len(new_winners)} candidates meet the victory quota of "
-                f"{victory_quota}:",
-                do_explain,
-            )
-            for winner in new_winners:
-                explain(f"\t{winner}", do_explain)
-            # Remove excess winners based on condorcet score
-            num_tied_for_last = len(winners) + len(new_winners) - num_seats
-            if num_tied_for_last > 0:
-                explain(
-                    "There are more winners this round than there are seats left. "
-                    "Eliminating those with the lowest proportions of votes, "
-                    "lowest condorcet scores and highest average indexes:",
-                    do_explain,
+                standings.update(piles.pop_changed())
+            else:
+                # No, eliminate candidate with lowest condorcet score
+                if bulk_exclusion:
+                    eliminated = _hopeless(standings, piles.num_votes, victory_quota)
+                else:
+                    eliminated = [standings.pop_lowest()]
+                if trace and len(eliminated) > 1:
+                    trace.record(
+                        "bulk_exclusion",
+                        _render_bulk_exclusion,
+                        quota=victory_quota,
+                        candidates=snapshot(eliminated),
+                    )
+                elif trace:
+                    trace.record(
+                        "elimination",
+                        _render_elimination,
+                        quota=victory_quota,
+                        candidate=snapshot(eliminated)[0],
+                    )
+                for eliminate in eliminated:
+                    candidates.pop(eliminate.id)
+                record["eliminated"] = len(eliminated)
+                # Transfer votes of eliminated
+                record["rankings_moved"], record["votes_moved"] = _transfer(
+                    piles, [eliminate.id for eliminate in eliminated], trace
+                )
+                standings.update(piles.pop_changed())
+
+            if trace:
+                trace.record(
+                    "seats_left",
+                    _render_seats_left,
+                    num_seats_left=num_seats - len(winners),
+                    num_seats=num_seats,
                 )
-                for i in range(num_tied_for_last):
-                    eliminate = _find_candidate_to_eliminate(new_winners)
-                    explain(f"\t{eliminate}", do_explain)
-                    new_winners.remove(eliminate)
-            explain(
-                "The following candidates have been declared winners in this round:",
-                do_explain,
-            )
-            for winner in sorted(
-                new_winners,
-                key=lambda c: (c.proportion_of_votes, c.condorcet_score, -c.avg_index),
-                reverse=True,
-            ):
-                winners.append(candidates.pop(winner.id))
-                explain(f"\t{winner}", do_explain)
-                winner.won_in_round = round_
-
-            if len(winners) >= num_seats:
-                # All seats filled
-                explain(f"All {num_seats} seats have been filled.", do_explain)
-                break
-            # Remove new winners from votes
-            for vote in votes:
-                for winner in new_winners:
-                    if winner.id in vote.candidates:
-                        vote.candidates.remove(winner.id)
-        else:
-            # No, eliminate candidate with lowest condorcet score
-            eliminate = _find_candidate_to_eliminate(candidates.values())
-            explain(
-                f"No candidates meet the victory quota of {victory_quota}. "
-                "Eliminating the candidate with the lowest proportion of votes, "
-                f"lowest condorcet score and highest average index:\n"
-                f"\t{eliminate}",
-                do_explain,
-            )
-            candidates.pop(eliminate.id)
-            # Remove eliminated from votes
-            for vote in votes:
-                if eliminate.id in vote.candidates:
-                    vote.candidates.remove(eliminate.id)
-
-        # Remove empty votes
-        votes = list(filter(lambda v: len(v.candidates) > 0, votes))
-        explain(
-            f"{num_seats - len(winners)} of {num_seats} seats are still to be filled.",
-            do_explain,
-        )
 
     seats_left = num_seats - len(winners)
     if seats_left > 0 and len(candidates) <= seats_left:
-        explain(
-            "Remaining candidates cannot meet the quota, but since there are enough "
-            "seats left for them, they will be declared winners:",
-            do_explain,
-        )
-        for candidate in sorted(
-            candidates.values(),
-            key=lambda c: (c.proportion_of_votes, c.condorcet_score, -c.avg_index),
-            reverse=True,
-        ):
+        remaining = _by_standing(candidates.values())
+        if trace:
+            trace.record(
+                "remaining_winners",
+                _render_remaining_winners,
+                round_=round_,
+                candidates=snapshot(remaining),
+            )
+        for candidate in remaining:
             winners.append(candidates.pop(candidate.id))
-            explain(f"\t{candidate}", do_explain)
             candidate.won_in_round = round_
 
     return winners
@@ -258,8 +639,14 @@ def stv(
 def stv_repeat(
     num_seats,
     candidates: typing.List[Candidate],
-    votes: typing.List[Vote],
+    votes: typing.Union[Ballots, typing.List[Vote]],
     do_explain=False,
+    trace: typing.Optional[Trace] = None,
+    jobs=1,
+    shared: typing.Optional[SharedData] = None,
+    profile: typing.Optional[Profile] = None,
+    bulk_exclusion=False,
+    tiebreaker="condorcet",
     **kwargs,
 ) -> typing.List[Candidate]:
     """Single Transferable Vote count, but repeated num_seats times with
@@ -268,26 +655,77 @@ def stv_repeat(
 
     winners = []
     candidates = {c.id: c for c in candidates}
+    with phase(profile, "ballots"):
+        votes = derive(shared, "ballots", lambda: as_ballots(votes))
+    trace = get_trace(do_explain, trace)
+
+    # Removing a winner changes no head-to-head result between the remaining
+    # candidates, and the index sums can be updated from the pairwise matrix,
+    # so both are only counted once
+    with phase(profile, "pairwise", candidates=len(candidates)):
+        matrix = derive(
+            shared,
+            "pairwise_matrix",
+            lambda: pairwise_matrix(list(candidates.values()), votes, jobs),
+        )
+    with phase(profile, "index_sums", candidates=len(candidates)):
+        double_index_sums, num_listed = derive(
+            shared,
+            "index_sums",
+            lambda: parallel.sum_over_shards(
+                _index_sums, list(candidates.values()), votes, jobs
+            ),
+        )
 
+    # Winners are excluded from later meta rounds by skipping them in the
+    # votes, which are never changed or copied
+    excluded = set()
+    removed_id = num_votes = None
     for i in range(num_seats):
-        explain(
-            f"                 \n======== STV META ROUND {i+1} ========", do_explain
-        )
-        winner = stv(
-            num_seats=1,
-            candidates=list(deepcopy(candidates).values()),
-            votes=deepcopy(votes),
-            do_explain=do_explain,
-        )[0]
-        winners.append(winner)
-        explain(f"STV META ROUND WINNER: {winner.id}", do_explain)
-        # Remove winner from candidates and votes
-        if winner.id in candidates:
-            candidates.pop(winner.id)
-            for vote in votes:
-                if winner.id in vote.candidates:
-                    vote.candidates.remove(winner.id)
-            # Remove empty votes
-            votes = list(filter(lambda v: len(v.candidates) > 0, votes))
+        with phase(profile, "meta_round", meta_round=i + 1, candidates=len(candidates)):
+            if trace:
+                trace.record("meta_round", _render_meta_round, meta_round=i + 1)
+            round_candidates = {c.id: STVCandidate(c.id) for c in candidates.values()}
+            piles = _piles(votes, round_candidates, excluded, profile)
+            if removed_id is not None:
+                # Votes listing only the last winner of the remaining
+                # candidates are no longer piled
+                double_index_sums, num_listed = _index_sums_without(
+                    double_index_sums,
+                    num_listed,
+                    matrix,
+                    removed_id,
+                    num_votes,
+                    num_votes - piles.num_votes,
+                )
+                removed_id = None
+            num_votes = piles.num_votes
+            _set_avg_index(
+                list(round_candidates.values()),
+                double_index_sums,
+                num_listed,
+                num_votes,
+                trace,
+            )
+            _set_condorcet_scores(
+                list(round_candidates.values()), matrix, trace, tiebreaker
+            )
+            round_winners = _count(
+                1, round_candidates, piles, trace, profile, bulk_exclusion
+            )
+            winner = round_winners[0]
+            winners.append(winner)
+            if trace:
+                trace.record(
+                    "meta_round_winner",
+                    _render_meta_round_winner,
+                    meta_round=i + 1,
+                    winner_id=winner.id,
+                )
+            # Remove winner from candidates and votes
+            if winner.id in candidates:
+                candidates.pop(winner.id)
+                excluded.add(winner.id)
+                removed_id = winner.id
 
     return winners
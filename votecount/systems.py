@@ -0,0 +1,135 @@
+"""Registry of the counting systems, by name.
+
+Systems are declared by the module and function that implement them, and the
+module is only imported once a system is used, so that starting the program
+doesn't import every system, with whatever it depends on.
+
+Other packages can add systems without changes here, by declaring an entry
+point in the votecount.systems group, e.g. in their pyproject.toml:
+
+    [project.entry-points."votecount.systems"]
+    approval = "my_package.approval:approval"
+
+A system is a function taking num_seats, candidates and votes, and the keyword
+arguments of the built-in systems, such as do_explain, trace and shared, and
+returning the winners, or all candidates by descending score.
+"""
+
+import importlib
+import threading
+import typing
+
+from . import Candidate
+
+System = typing.Callable[..., typing.List[Candidate]]
+
+ENTRY_POINT_GROUP = "votecount.systems"
+
+# Built-in systems, as "module:function"
+_BUILTIN = {
+    "stv": "votecount.stv:stv",
+    "stv_repeat": "votecount.stv:stv_repeat",
+    "borda": "votecount.borda:borda",
+    "dowdall": "votecount.dowdall:dowdall",
+    "borda_exp": "votecount.borda_exp:borda_exp",
+    "borda_even": "votecount.borda_even:borda_even",
+    "condorcet": "votecount.condorcet:condorcet",
+    "schulze": "votecount.schulze:schulze",
+    "ranked_pairs": "votecount.ranked_pairs:ranked_pairs",
+}
+
+
+def _entry_points() -> typing.Dict[str, str]:
+    from importlib.metadata import entry_points
+
+    found = entry_points()
+    if hasattr(found, "select"):
+        found = found.select(group=ENTRY_POINT_GROUP)
+    else:  # Python < 3.10
+        found = found.get(ENTRY_POINT_GROUP, [])
+    return {entry_point.name: entry_point.value for entry_point in found}
+
+
+class Registry(typing.Mapping[str, System]):
+    """Mapping of system names to systems, importing each on first use.
+
+    Names are looked up among the built-in and registered systems first, and
+    only then among the entry points of installed packages, which are found
+    once, without importing them.
+    """
+
+    def __init__(self, declared: typing.Dict[str, str]):
+        self._declared = dict(declared)
+        self._loaded: typing.Dict[str, System] = {}
+        self._discovered = False
+        self._discover_lock = threading.Lock()
+
+    def register(self, name, system: typing.Union[str, System]):
+        """Add or replace a system, given as a function or as "module:function"."""
+
+        self._loaded.pop(name, None)
+        if isinstance(system, str):
+            self._declared[name] = system
+        else:
+            self._declared[name] = f"{system.__module__}:{system.__qualname__}"
+            self._loaded[name] = system
+
+    def _discover(self):
+        # Other threads wait until every entry point is declared, rather than
+        # seeing a system missing while one thread is still discovering them
+        with self._discover_lock:
+            if not self._discovered:
+                for name, value in _entry_points().items():
+                    self._declared.setdefault(name, value)
+                self._discovered = True
+
+    def __getitem__(self, name) -> System:
+        if name not in self._loaded:
+            if name not in self._declared:
+                self._discover()
+            module, _, function = self._declared[name].partition(":")
+            system = importlib.import_module(module)
+            for attribute in function.split("."):
+                system = getattr(system, attribute)
+            self._loaded[name] = system
+        return self._loaded[name]
+
+    def __contains__(self, name) -> bool:
+        if name not in self._declared:
+            self._discover()
+        return name in self._declared
+
+    def __iter__(self) -> typing.Iterator[str]:
+        self._discover()
+        return iter(self._declared)
+
+    def __len__(self):
+        self._discover()
+        return len(self._declared)
+
+    def declared(self, name) -> str:
+        """Where a system is implemented, as "module:function"."""
+
+        if name not in self._declared:
+            self._discover()
+        return self._declared[name]
+
+
+SYSTEMS = Registry(_BUILTIN)
+
+
+def invalid_options(
+    systems: typing.Sequence[str], num_seats, weight=None
+) -> typing.Optional[str]:
+    """Why the given systems can't count with these options, or None if they
+    can. Shared by the command line, the server and the batch runner.
+    """
+
+    for system in systems:
+        if not isinstance(system, str) or system not in SYSTEMS:
+            return f"unknown system: {system}"
+    if not isinstance(num_seats, int) or num_seats < 1:
+        return "num_seats must be a positive integer"
+    if "borda_exp" in systems and weight is None:
+        return "borda_exp requires weight"
+    return None
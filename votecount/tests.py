@@ -1,8 +1,72 @@
+import asyncio
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
+from unittest import mock
 from copy import deepcopy
+from statistics import mean
 
-from . import Candidate, Vote
-from .stv import stv
+from . import Ballots, Candidate, Vote
+from .__main__ import main
+from .arrays import RankMatrix
+from .batch import SYSTEMS, count_systems, results_table
+from .benchmark import generate, run
+from .blt import BLTError, read_blt, write_blt
+from .bootstrap import bootstrap, resample
+from .borda import borda
+from .borda_even import borda_even
+from .borda_exp import borda_exp
+from .cache import (
+    BallotFileError,
+    file_hash,
+    load_election,
+    merge_elections,
+    read_ballot_file,
+    write_ballot_file,
+)
+from .condorcet import condorcet
+from .dowdall import dowdall
+from .live import LiveCount, follow, live_count
+from .pairwise import pairwise_matrix
+from .parse import read_election
+from .ranked_pairs import ranked_pairs
+from .result import Round, count
+from .runner import Job, find_jobs, run_jobs
+from .schulze import schulze
+from .systems import Registry, invalid_options
+from .profiling import Profile
+from .server import Elections, Server
+from .shared import SharedData, derive
+from .stv import (
+    STVCandidate,
+    _avg_index,
+    _index_sums,
+    _index_sums_without,
+    stv,
+    stv_repeat,
+)
+from .trace import Trace
+
+
+def _without(ballots: Ballots, candidate_ids) -> Ballots:
+    """A copy of ballots with the given candidates removed from every ranking and
+    any rankings left empty dropped, as counting them without those candidates
+    would see them.
+    """
+
+    without = Ballots()
+    for ranking, num_votes in ballots:
+        ranking = tuple(c for c in ranking if c not in candidate_ids)
+        if ranking:
+            without.add(ranking, num_votes)
+    return without
 
 
 class STVTest(unittest.TestCase):
@@ -186,6 +250,36 @@ class STVTest(unittest.TestCase):
         for winner in winners:
             self.assertTrue(winner.id in ["0", "1", "2"])
 
+    def test_votes_left_untouched(self):
+        votes = [Vote(["0", "1"]), Vote(["1", "2"]), Vote(["2", "0", "1"])]
+        stv(
+            num_seats=2,
+            candidates=[Candidate("0"), Candidate("1"), Candidate("2")],
+            votes=votes,
+        )
+        self.assertEqual(
+            [v.candidates for v in votes], [["0", "1"], ["1", "2"], ["2", "0", "1"]]
+        )
+
+    def test_votes_from_generator(self):
+        candidates = [Candidate("a"), Candidate("b")]
+        rankings = [["a"], ["b", "a"], ["a", "b"]]
+        for system in [stv, stv_repeat, borda, dowdall, condorcet, schulze]:
+            with self.subTest(system=system.__name__):
+                self.assertEqual(
+                    [w.id for w in system(1, candidates, (Vote(r) for r in rankings))],
+                    [w.id for w in system(1, candidates, [Vote(r) for r in rankings])],
+                )
+
+    def test_ballots_not_copied(self):
+        ballots = Ballots([Vote(["0", "1"]), Vote(["1", "2"]), Vote(["2", "0", "1"])])
+        counts = dict(ballots.counts)
+        candidates = [Candidate("0"), Candidate("1"), Candidate("2")]
+        with mock.patch.object(Ballots, "add", side_effect=AssertionError):
+            winners = stv_repeat(3, candidates, ballots)
+        self.assertEqual([w.id for w in winners], ["1", "2", "0"])
+        self.assertEqual(ballots.counts, counts)
+
     def test_complex_with_tiebreaking(self):
         """The purpose of this test is not to validate behavior per-se, but to detect
         changed behavior. The scenario is known to make use of both the primary and
@@ -252,6 +346,1387 @@ class STVTest(unittest.TestCase):
                 self.assertEqual(len(winners), num_seats)
                 self.assertEqual([w.id for w in winners], expected_winners)
 
+    def test_bulk_exclusion(self):
+        candidates = [Candidate(c) for c in "abcde"]
+        votes = [Vote(["a"])] * 5 + [Vote(["b"])] * 4 + [Vote(["c", "b"])]
+        trace = Trace()
+        winners = stv(1, candidates, votes, trace=trace, bulk_exclusion=True)
+        self.assertEqual([w.id for w in winners], ["a"])
+        # d and e without votes, then c with fewer votes than b, are eliminated
+        # together, while eliminating a as well could let b meet the quota
+        eliminations = [
+            e for e in trace.events if e.kind in ("elimination", "bulk_exclusion")
+        ]
+        self.assertEqual(
+            [(e.kind, [c.id for c in e.data["candidates"]]) for e in eliminations[:1]],
+            [("bulk_exclusion", ["d", "e", "c"])],
+        )
+        self.assertEqual(
+            [w.id for w in winners], [w.id for w in stv(1, candidates, votes)]
+        )
+
+    def test_bulk_exclusion_same_winners(self):
+        for seed in range(30):
+            candidates, ballots = generate(50, 12, "spatial", "uniform", seed=seed)
+            for num_seats in (1, 3):
+                with self.subTest(seed=seed, num_seats=num_seats):
+                    for system in (stv, stv_repeat):
+                        self.assertEqual(
+                            [w.id for w in system(num_seats, candidates, ballots)],
+                            [
+                                w.id
+                                for w in system(
+                                    num_seats, candidates, ballots, bulk_exclusion=True
+                                )
+                            ],
+                        )
+
+
+class PairwiseTest(unittest.TestCase):
+    def test_unlisted_rank_below_listed(self):
+        candidates = [Candidate("0"), Candidate("1"), Candidate("2")]
+        votes = [
+            Vote(["0", "1"]),
+            Vote(["1"]),
+            Vote(["2", "0", "1"]),
+            Vote([]),
+        ]
+        matrix = pairwise_matrix(candidates, votes)
+        self.assertEqual(
+            matrix,
+            {
+                ("0", "1"): 2,
+                ("1", "0"): 1,
+                ("0", "2"): 1,
+                ("2", "0"): 1,
+                ("1", "2"): 2,
+                ("2", "1"): 1,
+            },
+        )
+
+    def test_condorcet(self):
+        winners = condorcet(
+            num_seats=1,
+            candidates=[Candidate("0"), Candidate("1"), Candidate("2")],
+            votes=[
+                Vote(["0", "1"]),
+                Vote(["1"]),
+                Vote(["2", "0", "1"]),
+            ],
+        )
+        self.assertEqual(
+            [(w.id, w.condorcet_score) for w in winners],
+            [("0", 1), ("1", 1), ("2", 0)],
+        )
+
+    @mock.patch("votecount.parallel._MIN_SHARD_SIZE", 1)
+    def test_jobs(self):
+        candidates = [Candidate(str(i)) for i in range(5)]
+        ballots = Ballots(AvgIndexTest.votes)
+        self.assertEqual(
+            pairwise_matrix(candidates, ballots, jobs=3),
+            pairwise_matrix(candidates, ballots),
+        )
+
+    # a beats b, b beats c and c beats a, each by a different number of votes
+    cycle = [Vote(["a", "b", "c"])] * 4 + [Vote(["b", "c", "a"])] * 3
+    cycle += [Vote(["c", "a", "b"])] * 2
+
+    def test_schulze(self):
+        candidates = [Candidate(c) for c in "abcde"]
+        votes = (
+            [Vote(list("acbed"))] * 5
+            + [Vote(list("adecb"))] * 5
+            + [Vote(list("bedac"))] * 8
+            + [Vote(list("cabed"))] * 3
+            + [Vote(list("caebd"))] * 7
+            + [Vote(list("cbade"))] * 2
+            + [Vote(list("dceba"))] * 7
+            + [Vote(list("ebadc"))] * 8
+        )
+        winners = schulze(1, candidates, votes)
+        self.assertEqual(
+            [(w.id, w.schulze_score) for w in winners],
+            [("e", 4), ("a", 3), ("c", 2), ("b", 1), ("d", 0)],
+        )
+
+    def test_cycle(self):
+        candidates = [Candidate(c) for c in "abc"]
+        self.assertEqual(
+            [w.condorcet_score for w in condorcet(1, candidates, self.cycle)],
+            [1, 1, 1],
+        )
+        # The weakest win, of c over a, is the one dropped
+        for system in (schulze, ranked_pairs):
+            with self.subTest(system=system.__name__):
+                self.assertEqual(
+                    [w.id for w in system(1, candidates, self.cycle)], ["a", "b", "c"]
+                )
+
+    def test_ranked_pairs(self):
+        candidates = [Candidate(c) for c in ["memphis", "nashville", "chatt", "knox"]]
+        votes = (
+            [Vote(["memphis", "nashville", "chatt", "knox"])] * 42
+            + [Vote(["nashville", "chatt", "knox", "memphis"])] * 26
+            + [Vote(["chatt", "knox", "nashville", "memphis"])] * 15
+            + [Vote(["knox", "chatt", "nashville", "memphis"])] * 17
+        )
+        trace = Trace()
+        winners = ranked_pairs(1, candidates, votes, trace=trace)
+        self.assertEqual(
+            [w.id for w in winners], ["nashville", "chatt", "knox", "memphis"]
+        )
+        self.assertTrue(all(pair[-1] for pair in trace.events[0].data["pairs"]))
+
+    def test_stv_tiebreaker(self):
+        candidates = [Candidate(c) for c in "abc"]
+        # First preferences tie between a and c, while head-to-head a beats b,
+        # b beats c, and c beats a by fewer votes than either
+        votes = [
+            Vote(["b"]),
+            Vote(["b", "c", "a"]),
+            Vote(["c", "a"]),
+            Vote(["a"]),
+            Vote(["c", "a", "b"]),
+            Vote(["a"]),
+            Vote(["b"]),
+        ]
+        self.assertEqual([w.id for w in stv(1, candidates, votes)], ["b"])
+        for tiebreaker in ("schulze", "ranked_pairs"):
+            with self.subTest(tiebreaker=tiebreaker):
+                trace = Trace()
+                winners = stv(1, candidates, votes, trace=trace, tiebreaker=tiebreaker)
+                self.assertEqual([w.id for w in winners], ["a"])
+                eliminations = [e for e in trace.events if e.kind == "elimination"]
+                self.assertEqual(
+                    [e.data["candidate"].id for e in eliminations], ["c", "b"]
+                )
+        with self.assertRaises(ValueError):
+            stv(1, candidates, votes, tiebreaker="unknown")
+
+
+class AvgIndexTest(unittest.TestCase):
+    votes = [
+        Vote(["0", "2", "1"]),
+        Vote(["3", "2"]),
+        Vote(["0", "2", "1"]),
+        Vote(["4", "1", "0", "2"]),
+        Vote(["2", "0"]),
+        Vote(["0", "1", "2", "3", "4"]),
+    ]
+
+    def expected(self, candidate_id, votes, num_candidates):
+        return mean(
+            v.candidates.index(candidate_id)
+            if candidate_id in v.candidates
+            else (len(v.candidates) + num_candidates - 1) / 2
+            for v in votes
+        )
+
+    def test_matches_mean_of_indexes(self):
+        for votes in [self.votes, self.votes[:2], self.votes[-1:]]:
+            candidates = [STVCandidate(str(i)) for i in range(5)]
+            _avg_index(candidates, Ballots(votes))
+            for candidate in candidates:
+                expected = self.expected(candidate.id, votes, len(candidates))
+                self.assertEqual(candidate.avg_index, expected)
+                self.assertIs(type(candidate.avg_index), type(expected))
+
+    @unittest.skipUnless(importlib.util.find_spec("numpy"), "requires NumPy")
+    def test_rank_matrix(self):
+        candidates = [STVCandidate(str(i)) for i in range(5)]
+        _avg_index(candidates, RankMatrix(Ballots(self.votes), candidates))
+        for candidate in candidates:
+            expected = self.expected(candidate.id, self.votes, len(candidates))
+            self.assertEqual(candidate.avg_index, expected)
+
+    @mock.patch("votecount.parallel._MIN_SHARD_SIZE", 1)
+    def test_jobs(self):
+        candidates = [STVCandidate(str(i)) for i in range(5)]
+        _avg_index(candidates, Ballots(self.votes), jobs=3)
+        for candidate in candidates:
+            expected = self.expected(candidate.id, self.votes, len(candidates))
+            self.assertEqual(candidate.avg_index, expected)
+            self.assertIs(type(candidate.avg_index), type(expected))
+
+    def test_index_sums_without(self):
+        candidates = [STVCandidate(str(i)) for i in range(5)]
+        ballots = Ballots(self.votes + [Vote(["1"]), Vote(["1"]), Vote(["4"])])
+        matrix = pairwise_matrix(candidates, ballots)
+        for removed_id in ["0", "1", "4"]:
+            with self.subTest(removed_id=removed_id):
+                remaining = [c for c in candidates if c.id != removed_id]
+                without = _without(ballots, [removed_id])
+                self.assertEqual(
+                    _index_sums_without(
+                        *_index_sums(candidates, ballots),
+                        matrix,
+                        removed_id,
+                        len(ballots),
+                        len(ballots) - len(without),
+                    ),
+                    _index_sums(remaining, without),
+                )
+
+
+class PositionalTest(unittest.TestCase):
+    candidates = [Candidate("0"), Candidate("1"), Candidate("2"), Candidate("3")]
+    votes = [Vote(["0", "1"]), Vote(["2"])]
+
+    def test_exact_ties(self):
+        candidates = [Candidate(c) for c in "abcd"]
+        votes = [
+            Vote(["c", "b", "d", "a"]),
+            Vote(["c", "d", "b", "a"]),
+            Vote(["b", "d"]),
+            Vote(["a", "b", "c", "d"]),
+        ]
+        # b and c both get 7/3 points, which adding up the points vote by vote
+        # rounds differently, ranking c above b
+        winners = dowdall(1, candidates, votes)
+        self.assertEqual([w.id for w in winners], ["b", "c", "d", "a"])
+        self.assertEqual(winners[0].points, winners[1].points)
+        self.assertEqual(
+            [(w.id, w.points) for w in dowdall(1, candidates, votes[::-1])],
+            [(w.id, w.points) for w in winners],
+        )
+
+        # The explained standings end with the same points
+        trace = Trace()
+        dowdall(1, candidates, votes, trace=trace)
+        self.assertEqual(
+            [(c.id, c.points) for c in trace.events[-1].data["candidates"]],
+            [(w.id, w.points) for w in winners],
+        )
+
+    def test_borda_even(self):
+        winners = borda_even(1, self.candidates, self.votes)
+        self.assertEqual(
+            [(w.id, w.points) for w in winners],
+            [("0", 6), ("2", 5.5), ("1", 5), ("3", 3.5)],
+        )
+
+    def test_borda_even_max_per_vote(self):
+        winners = borda_even(1, self.candidates, self.votes, max_per_vote=1)
+        self.assertEqual(
+            [(w.id, w.points) for w in winners],
+            [("3", 3.5), ("0", 3), ("2", 2.5), ("1", 2)],
+        )
+
+    def test_explain_gives_same_result(self):
+        votes = self.votes + [Vote(["2"])]
+        output = io.StringIO()
+        with redirect_stdout(output):
+            explained = borda_exp(1, self.candidates, votes, True, weight=0.5)
+        winners = borda_exp(1, self.candidates, votes, weight=0.5)
+        self.assertEqual(
+            [(w.id, w.points) for w in explained], [(w.id, w.points) for w in winners]
+        )
+        # Standings follow each distinct ranking, with the points of all its votes
+        lines = output.getvalue().split("\n")
+        self.assertEqual(
+            [line for line in lines if line.startswith("====")],
+            [
+                "======== Standings after ranking 1 (1 vote) ========",
+                "======== Standings after ranking 2 (3 votes) ========",
+            ],
+        )
+        self.assertIn("Votes casting the ranking: 2", lines)
+        self.assertIn("2\tpoints=2.0\tlast_add=2.0", lines)
+
+
+class TraceTest(unittest.TestCase):
+    candidates = [Candidate("0"), Candidate("1"), Candidate("2")]
+    votes = [Vote(["0", "1"]), Vote(["1", "2"]), Vote(["2", "0", "1"]), Vote(["1"])]
+
+    def test_render_matches_explain(self):
+        for system in [stv_repeat, borda_even, condorcet]:
+            with self.subTest(system=system.__name__):
+                output = io.StringIO()
+                with redirect_stdout(output):
+                    system(2, self.candidates, self.votes, do_explain=True)
+                trace = Trace()
+                system(2, self.candidates, self.votes, trace=trace)
+                self.assertEqual(trace.render() + "\n", output.getvalue())
+
+    def test_events(self):
+        trace = Trace()
+        stv(1, self.candidates, self.votes, trace=trace)
+        self.assertEqual(
+            [e.kind for e in trace.events],
+            [
+                "avg_indexes",
+                "pairings",
+                "round",
+                "elimination",
+                "transfer",
+                "seats_left",
+                "round",
+                "elimination",
+                "transfer",
+                "seats_left",
+                "round",
+                "quota_met",
+                "winners",
+                "seats_filled",
+            ],
+        )
+        transfer = trace.events[4].data
+        self.assertEqual(transfer["candidate_ids"], ["0"])
+        self.assertEqual((transfer["num_votes_before"], transfer["num_votes"]), (4, 4))
+
+    def test_sample_standings(self):
+        trace = Trace(sample_every=3)
+        votes = Ballots([Vote([str(i % 3)]) for i in range(10)])
+        borda(1, self.candidates, votes, trace=trace)
+        self.assertEqual([e.data["vote_nr"] for e in trace.events], [4, 7, 10])
+
+
+class LiveCountTest(unittest.TestCase):
+    candidates = [Candidate(str(i)) for i in range(5)]
+    votes = [
+        Vote(["0", "2", "1"]),
+        Vote(["3", "2"]),
+        Vote(["0", "2", "1"]),
+        Vote(["4", "1", "0", "2"]),
+        Vote(["2", "0"]),
+        Vote(["3", "2"]),
+        Vote([]),
+        Vote(["1", "4"]),
+    ]
+
+    def test_same_results_as_counting_all_votes(self):
+        count = LiveCount(self.candidates, SYSTEMS, 2, weight=0.5)
+        for i in range(0, len(self.votes), 3):
+            count.add(self.votes[i:i + 3])
+            expected = count_systems(
+                SYSTEMS, 2, self.candidates, self.votes[: i + 3], weight=0.5
+            )
+            self.assertEqual(len(count), len(self.votes[: i + 3]))
+            for system, winners in count.results().items():
+                with self.subTest(system=system, num_votes=len(count)):
+                    self.assertEqual(
+                        [str(c) for c in winners],
+                        [str(c) for c in expected[system]],
+                    )
+
+    def test_follow(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "election.txt")
+            with open(path, "w") as f:
+                f.write("a b\na b\nb")
+            lines = follow(path, interval=0)
+            self.assertEqual(next(lines), ["a b", "a b"])
+            with open(path, "a") as f:
+                f.write(" a\nb\n")
+            self.assertEqual(next(lines), ["b a", "b"])
+
+    def test_invalid_batch(self):
+        count = LiveCount(self.candidates, ["borda"])
+        count.add(self.votes[:2])
+        for batch in [[Vote(["0", "zz"])], [Vote(["1"]), Vote(["5", "1"])]]:
+            with self.assertRaises(ValueError):
+                count.add(batch)
+        # Nothing of the invalid batches was counted
+        self.assertEqual(len(count), 2)
+        self.assertEqual(list(count.ballots), [(("0", "2", "1"), 1), (("3", "2"), 1)])
+        self.assertEqual(sum(count.positional_tally.num_votes_by_length.values()), 2)
+        self.assertNotIn(("0", "zz"), count.pairwise_matrix)
+
+    def test_live_count(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "election.txt")
+            with open(path, "w") as f:
+                f.write("a b c\na b\na zz\nb b\nc")
+            errors = []
+            results = live_count(
+                path,
+                ["borda"],
+                1,
+                interval=0,
+                on_error=lambda line_nr, line, e: errors.append((line_nr, line)),
+            )
+            num_votes, _ = next(results)
+            self.assertEqual(num_votes, 1)
+            self.assertEqual(errors, [(3, "a zz"), (4, "b b")])
+            with open(path, "a") as f:
+                f.write(" b\nc\n")
+            num_votes, winners = next(results)
+            self.assertEqual(num_votes, 3)
+            self.assertEqual([c.id for c in winners["borda"]], ["c", "b", "a"])
+
+
+class ServerTest(unittest.TestCase):
+    def write(self, name, text):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+        self.path = self.write("election.txt", "a b c\na b\nb c\nb\nc a\n")
+
+    def test_elections(self):
+        elections = Elections(max_elections=2)
+        election = elections.get(self.path)
+        self.assertIs(elections.get(self.path), election)
+        self.assertEqual([c.id for c in election.candidates], ["a", "b", "c"])
+
+        # Reloaded once the file changes
+        self.write("election.txt", "a b c\na\n")
+        self.assertEqual(len(elections.get(self.path).ballots), 1)
+
+        paths = [self.write(f"{i}.txt", "a b\na\n") for i in range(2)]
+        for path in paths:
+            elections.get(path)
+        self.assertEqual(list(elections.elections), paths)
+
+    def test_max_rankings(self):
+        elections = Elections(max_rankings=3)
+        other_path = self.write("other.txt", "a b\na\n")
+        elections.get(other_path)
+        elections.get(self.path)
+        # The most recent election is kept even if over the limit alone
+        self.assertEqual(list(elections.elections), [self.path])
+
+    def test_concurrent_loads(self):
+        elections = Elections()
+        other_path = self.write("other.txt", "a b\na\n")
+        release = threading.Event()
+
+        def slow_load(path):
+            if path == os.path.abspath(self.path):
+                release.wait(5)
+            return load_election(path)
+
+        with mock.patch("votecount.server.load_election", slow_load):
+            with ThreadPoolExecutor(2) as executor:
+                slow = executor.submit(elections.get, self.path)
+                # Loading another election isn't held up by the slow one
+                other = executor.submit(elections.get, other_path).result(5)
+                self.assertFalse(slow.done())
+                release.set()
+                self.assertEqual(len(slow.result(5).ballots), 4)
+        self.assertEqual(len(other.ballots), 1)
+        self.assertEqual(list(elections.elections), [other_path, self.path])
+
+    def test_evicted_while_loading(self):
+        elections = Elections(max_elections=1)
+        other_path = self.write("other.txt", "a b\na\n")
+        elections.get(self.path)
+        self.write("election.txt", "a b c\na\n")
+        started, release = threading.Event(), threading.Event()
+        loaded = []
+
+        def slow_load(path):
+            loaded.append(path)
+            if path == os.path.abspath(self.path):
+                started.set()
+                release.wait(5)
+            return load_election(path, use_cache=False)
+
+        with mock.patch("votecount.server.load_election", slow_load):
+            with ThreadPoolExecutor(2) as executor:
+                reload = executor.submit(elections.get, self.path)
+                started.wait(5)
+                # Evicts the stale election while it is being reloaded
+                elections.get(other_path)
+                waiting = executor.submit(elections.get, self.path)
+                time.sleep(0.1)
+                release.set()
+                self.assertIs(waiting.result(5), reload.result(5))
+        # The file was reloaded once, however many threads asked for it
+        self.assertEqual(loaded, [os.path.abspath(self.path), other_path])
+        self.assertEqual(elections.load_locks, {})
+
+    def test_server(self):
+        requests = [
+            {"path": self.path, "system": "stv", "num_seats": 1},
+            {"path": self.path, "system": "borda_exp", "num_seats": 2, "weight": 0.5},
+            {"path": self.path, "system": "borda_exp", "num_seats": 2},
+            {"path": self.path, "system": "unknown", "num_seats": 1},
+            {"path": "missing.txt", "system": "stv", "num_seats": 1},
+        ]
+
+        async def query():
+            server = Server(Elections())
+            async with await server.start(port=0) as listener:
+                port = listener.sockets[0].getsockname()[1]
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                for request in requests:
+                    writer.write(json.dumps(request).encode("utf-8") + b"\n")
+                writer.write(b"not json\n")
+                await writer.drain()
+                responses = [json.loads(await reader.readline()) for _ in range(6)]
+                # The server closes the connection once it has read to the end
+                writer.write_eof()
+                self.assertEqual(await reader.read(), b"")
+                writer.close()
+            server.executor.shutdown()
+            return responses
+
+        responses = asyncio.run(query())
+        self.assertEqual(responses[0], {"winners": ["b"]})
+        self.assertEqual(responses[1], {"winners": ["b", "a", "c"]})
+        self.assertEqual(responses[2], {"error": "borda_exp requires weight"})
+        self.assertEqual(responses[3], {"error": "unknown system: unknown"})
+        self.assertIn("FileNotFoundError", responses[4]["error"])
+        self.assertIn("invalid request", responses[5]["error"])
+
+
+class ResultTest(unittest.TestCase):
+    candidates = [Candidate(c) for c in "abcde"]
+    votes = [Vote(["a"])] * 5 + [Vote(["b"])] * 4 + [Vote(["c", "b"])]
+
+    def test_stv(self):
+        result = count("stv", 2, self.candidates, self.votes)
+        self.assertEqual(result.winners, ("a", "b"))
+        self.assertEqual(result.scores["a"]["condorcet_score"], 3)
+        self.assertEqual(
+            [(r.number, r.elected, r.eliminated) for r in result.rounds],
+            [(1, ("a",), ()), (2, ("b",), ())],
+        )
+        self.assertEqual(
+            [(s.candidate, s.votes) for s in result.rounds[1].standings[:2]],
+            [("b", 0.8), ("c", 0.2)],
+        )
+        with self.assertRaises(AttributeError):
+            result.winners = ()
+        with self.assertRaises(TypeError):
+            result.scores["a"]["condorcet_score"] = 0
+
+    def test_stv_repeat(self):
+        result = count("stv_repeat", 2, self.candidates, self.votes)
+        for meta_round, winner in enumerate(result.winners, 1):
+            rounds = [r for r in result.rounds if r.meta_round == meta_round]
+            self.assertIsInstance(rounds[0], Round)
+            self.assertEqual(rounds[-1].elected, (winner,))
+
+    def test_other_systems(self):
+        result = count("borda", 1, self.candidates, self.votes)
+        self.assertEqual(result.winners[:2], ("a", "b"))
+        self.assertEqual(result.scores["a"]["points"], 25)
+        self.assertEqual(result.rounds, ())
+
+    def test_concurrent_counts(self):
+        ballots = Ballots(self.votes)
+        counts = dict(ballots.counts)
+        shared = SharedData()
+        requests = [(system, num_seats) for system in SYSTEMS for num_seats in (1, 2)]
+        expected = [
+            count(system, num_seats, self.candidates, self.votes, weight=0.5)
+            for system, num_seats in requests
+        ]
+        with ThreadPoolExecutor(8) as executor:
+            results = list(
+                executor.map(
+                    lambda request: count(
+                        *request, self.candidates, ballots, shared, weight=0.5
+                    ),
+                    requests * 4,
+                )
+            )
+        self.assertEqual(results, expected * 4)
+        self.assertEqual(ballots.counts, counts)
+
+    def test_derive_once(self):
+        shared = SharedData()
+        computed = []
+
+        def compute():
+            computed.append(None)
+            return len(computed)
+
+        with ThreadPoolExecutor(8) as executor:
+            values = list(
+                executor.map(lambda _: derive(shared, "x", compute), range(32))
+            )
+        self.assertEqual((values, computed), ([1] * 32, [None]))
+
+
+class ProfileTest(unittest.TestCase):
+    candidates = [Candidate(str(i)) for i in range(5)]
+    votes = [
+        Vote(["0", "2", "1"]),
+        Vote(["3", "2"]),
+        Vote(["0", "2", "1"]),
+        Vote(["4", "1", "0", "2"]),
+        Vote(["2", "0"]),
+        Vote(["3", "2"]),
+    ]
+
+    def test_stv_phases(self):
+        profile = Profile()
+        winners = stv(2, self.candidates, self.votes, profile=profile)
+        self.assertEqual(
+            [c.id for c in winners],
+            [c.id for c in stv(2, self.candidates, self.votes)],
+        )
+        phases = [p["phase"] for p in profile.phases]
+        self.assertEqual(phases[:4], ["ballots", "avg_index", "condorcet", "piles"])
+        rounds = [p for p in profile.phases if p["phase"] == "round"]
+        self.assertEqual([p["round"] for p in rounds], list(range(1, len(rounds) + 1)))
+        self.assertEqual(rounds[0]["votes"], 6)
+        # Eliminating 1, which has no votes, moves nothing, while electing 0 in
+        # round 3 moves its 3 votes in 2 distinct rankings
+        self.assertEqual(
+            [(p["rankings_moved"], p["votes_moved"]) for p in rounds],
+            [(0, 0), (1, 1), (2, 3), (0, 0)],
+        )
+        for p in profile.phases:
+            self.assertGreaterEqual(p["wall"], 0)
+            self.assertGreaterEqual(p["cpu"], 0)
+
+    def test_nested_phases(self):
+        profile = Profile()
+        stv_repeat(2, self.candidates, self.votes, profile=profile)
+        meta_round = profile.phases.index(
+            next(p for p in profile.phases if p["phase"] == "meta_round")
+        )
+        self.assertEqual(profile.phases[meta_round]["depth"], 0)
+        self.assertEqual(profile.phases[meta_round + 1]["phase"], "piles")
+        self.assertEqual(profile.phases[meta_round + 1]["depth"], 1)
+        self.assertIn('"phase": "meta_round"', profile.to_json())
+
+    @unittest.skipUnless(importlib.util.find_spec("resource"), "requires resource")
+    def test_memory(self):
+        profile = Profile()
+        with profile.phase("before") as before:
+            pass
+        with profile.phase("large"):
+            # Goes past any earlier peak, whatever the process holds now
+            data = bytearray((before["max_rss_so_far_kb"] << 10) + (32 << 20))
+            data[::4096] = b"x" * len(data[::4096])  # Touch every page
+        del data
+        with profile.phase("after"):
+            pass
+        _, large, after = profile.phases
+        # A phase is only charged the growth of the peak during it
+        self.assertGreater(large["max_rss_growth_kb"], 16 << 10)
+        self.assertLess(after["max_rss_growth_kb"], 1 << 10)
+        self.assertGreaterEqual(after["max_rss_so_far_kb"], large["max_rss_so_far_kb"])
+
+
+class ReadElectionTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"a b c\r\n")
+            for i in range(200):
+                f.write(b"a b\n" if i % 3 else b"voter x: c a\r\n")
+                f.write(b"\n" if i % 50 == 0 else b"b\n")
+            f.write(b"voter: 1: c")
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_read(self):
+        candidates, ballots = read_election(self.path)
+        self.assertEqual([c.id for c in candidates], ["a", "b", "c"])
+        self.assertEqual(
+            list(ballots),
+            [(("c", "a"), 67), ((), 4), (("a", "b"), 133), (("b",), 196), (("c",), 1)],
+        )
+
+    def test_chunks_in_worker_processes(self):
+        with mock.patch("votecount.parse._MIN_CHUNK_SIZE", 64):
+            candidates, ballots = read_election(self.path, jobs=3)
+        self.assertEqual([c.id for c in candidates], ["a", "b", "c"])
+        self.assertEqual(list(ballots), list(read_election(self.path)[1]))
+
+    def test_duplicate_candidate(self):
+        with open(self.path, "a") as f:
+            f.write("\nb a b\n")
+        for jobs in [1, 3]:
+            with mock.patch("votecount.parse._MIN_CHUNK_SIZE", 64):
+                with self.assertRaises(RuntimeError):
+                    read_election(self.path, jobs=jobs)
+
+
+class BallotFileTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "election.txt")
+        with open(self.path, "w") as f:
+            f.write("a b c d\nb a\nc\n\nb a\nvoter: d c b a\n")
+        self.candidates, self.ballots = read_election(self.path)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_round_trip(self):
+        path = os.path.join(self.dir.name, "ballots")
+        write_ballot_file(path, self.candidates, self.ballots)
+        candidates, ballots = read_ballot_file(path)
+        self.assertEqual([c.id for c in candidates], ["a", "b", "c", "d"])
+        self.assertEqual(list(ballots), list(self.ballots))
+
+    def test_read_without_revalidating(self):
+        path = os.path.join(self.dir.name, "ballots")
+        write_ballot_file(path, self.candidates, self.ballots)
+        # The rankings were validated when the file was written
+        with mock.patch("votecount.Vote", side_effect=AssertionError):
+            _, ballots = read_ballot_file(path)
+        self.assertEqual(list(ballots), list(self.ballots))
+        self.assertEqual(len(ballots), len(self.ballots))
+
+    @unittest.skipUnless(importlib.util.find_spec("numpy"), "requires NumPy")
+    def test_round_trip_rank_matrix(self):
+        path = os.path.join(self.dir.name, "ballots")
+        write_ballot_file(path, self.candidates, self.ballots)
+        _, matrix = read_ballot_file(path, use_numpy=True)
+        self.assertIsInstance(matrix, RankMatrix)
+        self.assertEqual(list(matrix), list(self.ballots))
+
+    def test_source_hash_mismatch(self):
+        path = os.path.join(self.dir.name, "ballots")
+        write_ballot_file(path, self.candidates, self.ballots, b"1" * 32)
+        with self.assertRaises(BallotFileError):
+            read_ballot_file(path, file_hash(self.path))
+
+    def test_merge_elections(self):
+        precinct = os.path.join(self.dir.name, "precinct.txt")
+        with open(precinct, "w") as f:
+            f.write("e a\ne b\nb a\n")
+        merged = os.path.join(self.dir.name, "merged")
+        write_ballot_file(merged, *merge_elections([self.path, precinct]))
+        candidates, ballots = read_ballot_file(merged)
+        self.assertEqual([c.id for c in candidates], ["a", "b", "c", "d", "e"])
+        self.assertEqual(len(ballots), len(self.ballots) + 2)
+        self.assertEqual(ballots.counts[("b", "a")], 3)
+
+        # Counts the same as one file of all votes
+        combined = os.path.join(self.dir.name, "combined.txt")
+        with open(combined, "w") as f:
+            f.write("a b c d e\nb a\nc\n\nb a\nd c b a\ne b\nb a\n")
+        self.assertEqual(
+            [str(c) for c in stv(2, candidates, ballots)],
+            [str(c) for c in stv(2, *read_election(combined))],
+        )
+
+    def test_cache(self):
+        cache_dir = os.path.join(self.dir.name, "cache")
+        load_election(self.path, cache_dir=cache_dir)
+        (cached,) = os.listdir(cache_dir)
+        self.assertEqual(cached, file_hash(self.path).hex() + ".votecount")
+
+        with mock.patch("votecount.cache.read_election") as read:
+            candidates, ballots = load_election(self.path, cache_dir=cache_dir)
+        read.assert_not_called()
+        self.assertEqual(list(ballots), list(self.ballots))
+
+        # Changing the file invalidates the cache
+        with open(self.path, "a") as f:
+            f.write("a\n")
+        _, ballots = load_election(self.path, cache_dir=cache_dir)
+        self.assertEqual(len(ballots), len(self.ballots) + 1)
+
+    def test_corrupt_cache(self):
+        cache_dir = os.path.join(self.dir.name, "cache")
+        load_election(self.path, cache_dir=cache_dir)
+        cached = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+        with open(cached, "rb") as f:
+            data = f.read()
+        for size in [0, 10, len(data) // 2, len(data) - 1]:
+            with self.subTest(size=size):
+                with open(cached, "wb") as f:
+                    f.write(data[:size])
+                with self.assertRaises(BallotFileError):
+                    read_ballot_file(cached)
+
+                # A corrupt cache is stale, so the input file is parsed again
+                _, ballots = load_election(self.path, cache_dir=cache_dir)
+                self.assertEqual(list(ballots), list(self.ballots))
+                with open(cached, "rb") as f:
+                    self.assertEqual(f.read(), data)
+
+
+class BLTTest(unittest.TestCase):
+    text = (
+        "4 2\n-3\n12 1 2 4 0\n3 4 1 0\n2 3 2 0\n0 2 0\n1 3 0\n0\n"
+        '"Adams"\n"Baker"\n"Clark"\n"Davis"\n"Committee election"\n'
+    )
+
+    def write(self, text):
+        with open(self.path, "w") as f:
+            f.write(text)
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path = os.path.join(temp_dir.name, "election.blt")
+        self.write(self.text)
+
+    def test_read(self):
+        election = read_blt(self.path)
+        self.assertEqual(
+            [c.id for c in election.candidates], ["Adams", "Baker", "Davis"]
+        )
+        # Weighted lines are held once, without the withdrawn candidate
+        self.assertEqual(
+            list(election.ballots),
+            [
+                (("Adams", "Baker", "Davis"), 12),
+                (("Davis", "Adams"), 3),
+                (("Baker",), 2),
+            ],
+        )
+        self.assertEqual(election.num_seats, 2)
+        self.assertEqual(election.title, "Committee election")
+        self.assertEqual(election.withdrawn, ["Clark"])
+
+    def test_round_trip(self):
+        election = read_blt(self.path)
+        path = os.path.join(os.path.dirname(self.path), "copy.blt")
+        write_blt(path, *election)
+        self.assertEqual(read_blt(path)[2:], election[2:])
+        self.assertEqual(list(read_blt(path).ballots), list(election.ballots))
+
+    def test_count_seats_from_header(self):
+        for command, args in [
+            (["stv"], []),
+            (["--systems", "stv,borda"], []),
+            (["resample", "stv"], ["--samples", "2"]),
+        ]:
+            with self.subTest(command=command):
+                outputs = []
+                for seats in [[], ["2"]]:
+                    output = io.StringIO()
+                    with redirect_stdout(output):
+                        main(command + seats + [self.path, "--no-cache"] + args)
+                    outputs.append(output.getvalue())
+                self.assertEqual(outputs[0], outputs[1])
+
+    def test_convert_to_blt(self):
+        path = os.path.join(os.path.dirname(self.path), "copy.blt")
+        main(["convert", self.path, path])
+        self.assertEqual(read_blt(path)[2:], read_blt(self.path)[2:])
+
+        main(["convert", self.path, path, "--num-seats", "1", "--title", "Board"])
+        election = read_blt(path)
+        self.assertEqual((election.num_seats, election.title), (1, "Board"))
+        self.assertEqual(election.withdrawn, ["Clark"])
+
+    def test_hash_in_names(self):
+        candidates = [Candidate("Ann #1"), Candidate("Bob")]
+        ballots = Ballots([Vote(["Ann #1", "Bob"]), Vote(["Bob"])])
+        write_blt(self.path, candidates, ballots, 1, "Board #2")
+        election = read_blt(self.path)
+        self.assertEqual([c.id for c in election.candidates], ["Ann #1", "Bob"])
+        self.assertEqual(list(election.ballots), list(ballots))
+        self.assertEqual(election.title, "Board #2")
+
+        # A # outside quotes still starts a comment
+        self.write('2 1 # seats\n1 1 2 0\n0\n"Ann #1" # first\n"Bob"\n# "Carl"\n')
+        election = read_blt(self.path)
+        self.assertEqual([c.id for c in election.candidates], ["Ann #1", "Bob"])
+        self.assertEqual(election.title, "")
+
+    def test_count(self):
+        candidates, ballots = load_election(self.path, use_cache=False)
+        votes = [Vote(ranking) for ranking, count in ballots for _ in range(count)]
+        self.assertEqual(
+            [c.id for c in stv(2, candidates, ballots)],
+            [c.id for c in stv(2, candidates, votes)],
+        )
+
+    def test_invalid(self):
+        lines = self.text.split("\n")
+        for line_nr, line in [
+            (2, "1 2 = 3 0"),  # Equal rankings
+            (2, "1.5 2 0"),  # Fractional weight
+            (2, "1 5 0"),  # No such candidate
+            (2, "1 2"),  # No terminating 0
+            (7, ""),  # No end of ballots
+        ]:
+            with self.subTest(line=line):
+                broken = list(lines)
+                broken[line_nr] = line
+                self.write("\n".join(broken))
+                with self.assertRaises(BLTError):
+                    read_blt(self.path)
+
+
+class BatchTest(unittest.TestCase):
+    candidates = [Candidate(str(i)) for i in range(5)]
+    votes = [
+        Vote(["0", "2", "1"]),
+        Vote(["3", "2"]),
+        Vote(["0", "2", "1"]),
+        Vote(["4", "1", "0", "2"]),
+        Vote(["2", "0"]),
+        Vote(["3", "2"]),
+    ]
+
+    def test_same_results_as_single_systems(self):
+        results = count_systems(SYSTEMS, 2, self.candidates, self.votes, weight=0.5)
+        self.assertEqual(list(results), list(SYSTEMS))
+        for name, system in SYSTEMS.items():
+            with self.subTest(system=name):
+                self.assertEqual(
+                    [str(c) for c in results[name]],
+                    [
+                        str(c)
+                        for c in system(2, self.candidates, self.votes, weight=0.5)
+                    ],
+                )
+
+    def test_derived_once(self):
+        with mock.patch(
+            "votecount.stv.pairwise_matrix", wraps=pairwise_matrix
+        ) as stv_matrix, mock.patch(
+            "votecount.condorcet.pairwise_matrix", wraps=pairwise_matrix
+        ) as condorcet_matrix:
+            count_systems(
+                ["stv", "stv_repeat", "condorcet"], 2, self.candidates, self.votes
+            )
+        self.assertEqual(stv_matrix.call_count + condorcet_matrix.call_count, 1)
+
+    def test_results_table(self):
+        results = count_systems(["stv", "borda"], 1, self.candidates, self.votes)
+        self.assertEqual(
+            results_table(results).splitlines(),
+            [
+                "place\tstv\tborda",
+                "1\t0\t2",
+                "2\t\t0",
+                "3\t\t1",
+                "4\t\t3",
+                "5\t\t4",
+            ],
+        )
+
+
+class SystemsTest(unittest.TestCase):
+    def test_lazy(self):
+        systems = Registry({"borda": "votecount.borda:borda", "x": "votecount.x:x"})
+        with mock.patch("votecount.systems._entry_points", return_value={}):
+            self.assertEqual(list(systems), ["borda", "x"])
+        self.assertIn("x", systems)
+        self.assertIs(systems["borda"], borda)
+        # Only imported when used
+        with self.assertRaises(ImportError):
+            systems["x"]
+
+    def test_entry_points(self):
+        systems = Registry({"borda": "votecount.borda:borda"})
+        with mock.patch(
+            "votecount.systems._entry_points",
+            return_value={"plugin": "votecount.dowdall:dowdall", "borda": "x:x"},
+        ) as entry_points:
+            self.assertIs(systems["borda"], borda)
+            entry_points.assert_not_called()
+            self.assertIs(systems["plugin"], dowdall)
+            self.assertNotIn("missing", systems)
+            self.assertEqual(list(systems), ["borda", "plugin"])
+        entry_points.assert_called_once()
+
+    def test_concurrent_discovery(self):
+        systems = Registry({})
+        discovering, release = threading.Event(), threading.Event()
+
+        def slow_entry_points():
+            discovering.set()
+            release.wait(5)
+            return {"plugin": "votecount.dowdall:dowdall"}
+
+        with mock.patch("votecount.systems._entry_points", slow_entry_points):
+            with ThreadPoolExecutor(2) as executor:
+                first = executor.submit(systems.__contains__, "plugin")
+                discovering.wait(5)
+                # Waits for the discovery under way instead of missing the plugin
+                second = executor.submit(systems.__contains__, "plugin")
+                time.sleep(0.1)
+                release.set()
+                self.assertTrue(first.result(5))
+                self.assertTrue(second.result(5))
+
+    def test_register(self):
+        systems = Registry({})
+        with mock.patch("votecount.systems._entry_points", return_value={}):
+            systems.register("positional", borda_even)
+            systems.register("condorcet", "votecount.condorcet:condorcet")
+            self.assertEqual(
+                dict(systems), {"positional": borda_even, "condorcet": condorcet}
+            )
+        self.assertEqual(
+            systems.declared("positional"), "votecount.borda_even:borda_even"
+        )
+
+    def test_list_systems(self):
+        output = io.StringIO()
+        with redirect_stdout(output), self.assertRaises(SystemExit):
+            main(["--list-systems"])
+        self.assertIn("schulze\tvotecount.schulze:schulze\n", output.getvalue())
+
+    def test_invalid_options(self):
+        self.assertIsNone(invalid_options(["stv", "borda_exp"], 2, 0.5))
+        for systems, num_seats, weight, error in [
+            (["stv", "nope"], 1, None, "unknown system: nope"),
+            ([None], 1, None, "unknown system: None"),
+            (["stv"], 0, None, "num_seats must be a positive integer"),
+            (["stv"], "1", None, "num_seats must be a positive integer"),
+            (["borda_exp"], 1, None, "borda_exp requires weight"),
+        ]:
+            with self.subTest(error=error):
+                self.assertEqual(invalid_options(systems, num_seats, weight), error)
+
+        # Each subcommand counting elections checks its options the same way
+        for argv in [
+            ["borda_exp", "1", "election.txt"],
+            ["--systems", "borda,borda_exp", "1", "election.txt"],
+            ["resample", "borda_exp", "1", "election.txt"],
+            ["live", "borda,borda_exp", "1", "election.txt"],
+        ]:
+            with self.subTest(argv=argv):
+                error = io.StringIO()
+                with redirect_stderr(error), self.assertRaises(SystemExit):
+                    main(argv)
+                self.assertIn("borda_exp requires weight", error.getvalue())
+
+
+class BenchmarkTest(unittest.TestCase):
+    def test_reproducible(self):
+        for model in ["impartial", "mallows", "spatial"]:
+            with self.subTest(model=model):
+                candidates, ballots = generate(50, 6, model, length="uniform")
+                self.assertEqual([c.id for c in candidates][:2], ["c0", "c1"])
+                self.assertEqual(len(ballots), 50)
+                self.assertTrue(all(1 <= len(r) <= 6 for r, _ in ballots))
+                self.assertEqual(
+                    list(ballots), list(generate(50, 6, model, length="uniform")[1])
+                )
+                self.assertNotEqual(
+                    list(ballots), list(generate(50, 6, model, "uniform", seed=1)[1])
+                )
+
+    def test_mallows_without_dispersion(self):
+        _, ballots = generate(10, 4, "mallows", length=3, dispersion=0)
+        self.assertEqual(list(ballots), [(("c0", "c1", "c2"), 10)])
+
+    def test_spatial_single_peaked(self):
+        # Ranked by distance on a line, the last ranked candidate is always one
+        # of the two outermost
+        candidates, ballots = generate(100, 5, "spatial")
+        self.assertEqual(len({r[-1] for r, _ in ballots}), 2)
+
+    @unittest.skipUnless(importlib.util.find_spec("numpy"), "requires NumPy")
+    def test_numpy(self):
+        for model in ["impartial", "mallows", "spatial"]:
+            with self.subTest(model=model):
+                candidates, ballots = generate(
+                    500, 6, model, length="uniform", use_numpy=True
+                )
+                self.assertEqual(len(ballots), 500)
+                self.assertTrue(all(1 <= len(r) <= 6 for r, _ in ballots))
+                self.assertEqual(
+                    list(ballots),
+                    list(generate(500, 6, model, "uniform", use_numpy=True)[1]),
+                )
+        _, ballots = generate(10, 4, "mallows", 3, dispersion=0, use_numpy=True)
+        self.assertEqual(list(ballots), [(("c0", "c1", "c2"), 10)])
+
+    def test_mallows_many_candidates(self):
+        # Most voters rank the candidates close to the reference ranking
+        _, ballots = generate(20, 500, "mallows", dispersion=0.5)
+        for ranking, _ in ballots:
+            self.assertEqual(sorted(ranking), sorted(f"c{i}" for i in range(500)))
+            self.assertLess(abs(ranking.index("c250") - 250), 20)
+
+    def test_run(self):
+        records = list(run([10, 20], [3], ["stv", "borda"], budget=0))
+        steps = ["generate", "write", "parse", "stv", "borda"]
+        self.assertEqual(
+            [(r["voters"], r["step"], r["skipped"]) for r in records],
+            [(10, step, False) for step in steps]
+            + [(20, step, True) for step in steps],
+        )
+        self.assertIsInstance(records[0]["rankings"], int)
+        self.assertIsNone(records[-1]["rankings"])
+
+
+class BootstrapTest(unittest.TestCase):
+    candidates = [Candidate(c) for c in "abc"]
+    ballots = Ballots(
+        [Vote(["a", "b"])] * 6 + [Vote(["b", "a"])] * 5 + [Vote(["c"])] * 4
+    )
+
+    def test_resample(self):
+        sample = resample(self.ballots, 1)
+        self.assertEqual(len(sample), len(self.ballots))
+        self.assertEqual(sum(count for _, count in sample), len(self.ballots))
+        self.assertLessEqual(set(sample.counts), set(self.ballots.counts))
+        self.assertEqual(resample(self.ballots, 1).counts, sample.counts)
+
+    @unittest.skipUnless(importlib.util.find_spec("numpy"), "requires NumPy")
+    def test_resample_matrix(self):
+        sample = resample(RankMatrix(self.ballots, self.candidates), 1)
+        self.assertEqual(len(sample), len(self.ballots))
+        self.assertEqual(sum(count for _, count in sample), len(self.ballots))
+        self.assertLessEqual(
+            {ranking for ranking, _ in sample}, set(self.ballots.counts)
+        )
+
+    def test_bootstrap(self):
+        frequencies = bootstrap("stv", 1, self.candidates, self.ballots, 50)
+        self.assertEqual(sum(f.wins for f in frequencies), 50)
+        self.assertEqual(
+            [f.wins for f in frequencies], sorted(f.wins for f in frequencies)[::-1]
+        )
+        for f in frequencies:
+            self.assertEqual(f.frequency, f.wins / 50)
+            self.assertLessEqual(f.low, f.frequency)
+            self.assertGreaterEqual(f.high, f.frequency)
+
+        # A unanimous winner wins every sample
+        votes = [Vote(["a", "b"])] * 3
+        a, b, c = bootstrap("borda", 1, self.candidates, votes, 10)
+        self.assertEqual((a.candidate, a.wins, a.high), ("a", 10, 1.0))
+        self.assertEqual(b.wins, 0)
+
+    def test_invalid_confidence(self):
+        for confidence in [0, 1, -0.5, 1.5]:
+            with self.subTest(confidence=confidence):
+                with self.assertRaises(ValueError):
+                    bootstrap(
+                        "stv", 1, self.candidates, self.ballots, confidence=confidence
+                    )
+                error = io.StringIO()
+                with redirect_stderr(error), self.assertRaises(SystemExit):
+                    main(
+                        ["resample", "stv", "1", "election.txt"]
+                        + [f"--confidence={confidence}"]
+                    )
+                self.assertIn("--confidence must be between 0 and 1", error.getvalue())
+
+    def test_jobs(self):
+        self.assertEqual(
+            bootstrap("condorcet", 1, self.candidates, self.ballots, 20, seed=3),
+            bootstrap(
+                "condorcet", 1, self.candidates, self.ballots, 20, seed=3, jobs=2
+            ),
+        )
+
+
+class RunnerTest(unittest.TestCase):
+    def write(self, name, text):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+        self.good = self.write("good.txt", "a b c\na b\nb c\nc a b\na\n")
+        # Duplicate candidate in a vote
+        self.bad = self.write("bad.txt", "a b c\na b a\n")
+
+    def test_invalid_jobs(self):
+        for argv in [
+            ["batch", self.temp_dir],
+            ["convert", "election.txt"],
+            ["resample", "stv", "1", "election.txt"],
+            ["stv", "1", "election.txt"],
+        ]:
+            for jobs in ["0", "-2"]:
+                with self.subTest(command=argv[0], jobs=jobs):
+                    error = io.StringIO()
+                    with redirect_stderr(error), self.assertRaises(SystemExit):
+                        main(argv + ["--jobs", jobs])
+                    self.assertIn("--jobs: must be at least 1", error.getvalue())
+
+    def test_find_jobs(self):
+        self.write("good.txt.votecount", "")
+        manifest = self.write(
+            "elections.jsonl",
+            '{"path": "good.txt", "system": "borda_exp", "weight": 0.5}\n\n'
+            '{"path": "bad.txt", "num_seats": 2}\n',
+        )
+        self.assertEqual(
+            find_jobs([self.temp_dir], "stv", 1),
+            [Job(self.bad, "stv", 1), Job(self.good, "stv", 1)],
+        )
+        self.assertEqual(
+            find_jobs([manifest, os.path.join(self.temp_dir, "g*.txt")], "stv", 1),
+            [
+                Job(self.good, "borda_exp", 1, weight=0.5),
+                Job(self.bad, "stv", 2),
+                Job(self.good, "stv", 1),
+            ],
+        )
+
+        self.write("broken.jsonl", '{"system": "stv"}\n')
+        with self.assertRaisesRegex(ValueError, "line 1"):
+            find_jobs([os.path.join(self.temp_dir, "broken.jsonl")])
+
+    def test_run_jobs(self):
+        jobs = [
+            Job(self.good, "stv", 2),
+            Job(self.bad, "stv", 2),
+            Job(self.good, "borda_exp", 1),
+            Job(self.good, "nope", 1),
+            Job(os.path.join(self.temp_dir, "missing.txt"), "borda", 1),
+            Job(self.good, "borda_exp", 1, max_per_vote=1, weight=0.5),
+        ]
+        for workers in (1, 2):
+            records = list(run_jobs(jobs, workers, use_cache=False))
+            self.assertEqual(len(records), len(jobs))
+            records.sort(key=lambda r: jobs.index(Job(*map(r.get, Job._fields))))
+            self.assertEqual(records[0]["winners"], ["a", "b"])
+            self.assertRegex(records[1]["error"], "^RuntimeError: .*appears more")
+            self.assertEqual(records[2]["error"], "borda_exp requires weight")
+            self.assertEqual(records[3]["error"], "unknown system: nope")
+            self.assertRegex(records[4]["error"], "^FileNotFoundError")
+            self.assertEqual(records[5]["winners"], ["a"])
+            self.assertEqual(json.loads(json.dumps(records[5]))["weight"], 0.5)
+
+    def test_blt_seats(self):
+        path = self.write(
+            "election.blt", '4 2\n3 1 2 0\n2 2 3 0\n0\n"a"\n"b"\n"c"\n"d"\n'
+        )
+        (record,) = run_jobs([Job(path, "stv")], 1, use_cache=False)
+        self.assertEqual(record["num_seats"], 2)
+        self.assertEqual(record["winners"], ["a", "b"])
+
+
+class BallotsTest(unittest.TestCase):
+    def test_collapse_identical_rankings(self):
+        ballots = Ballots([Vote(["0", "1"]), Vote(["1"]), Vote(["0", "1"])])
+        self.assertEqual(list(ballots), [(("0", "1"), 2), (("1",), 1)])
+        self.assertEqual(len(ballots), 3)
+
+    def test_duplicate_candidate_in_ranking(self):
+        with self.assertRaises(RuntimeError):
+            Ballots().add(["0", "1", "0"])
+
+    def test_update(self):
+        ballots = Ballots([Vote(["0", "1"]), Vote(["1"])])
+        ballots.update(Ballots([Vote(["2"]), Vote(["1"])]))
+        self.assertEqual(list(ballots), [(("0", "1"), 1), (("1",), 2), (("2",), 1)])
+        self.assertEqual(len(ballots), 4)
+
+    def test_shards(self):
+        ballots = Ballots([Vote(["0"]), Vote(["1"]), Vote(["2"]), Vote(["0"])])
+        shards = ballots.shards(2)
+        self.assertEqual(
+            [list(s) for s in shards], [[(("0",), 2)], [(("1",), 1), (("2",), 1)]]
+        )
+        self.assertEqual([len(s) for s in shards], [2, 2])
+        self.assertEqual(ballots.shards(2, min_size=2), [ballots])
+
+    def test_same_results_as_votes(self):
+        candidates = [Candidate(str(i)) for i in range(5)]
+        votes = [
+            Vote(["0", "2", "1"]),
+            Vote(["3", "2"]),
+            Vote(["0", "2", "1"]),
+            Vote(["4", "1", "0", "2"]),
+            Vote(["2", "0"]),
+            Vote(["3", "2"]),
+        ]
+        for system in [
+            stv,
+            stv_repeat,
+            borda,
+            borda_even,
+            borda_exp,
+            condorcet,
+            dowdall,
+        ]:
+            with self.subTest(system=system.__name__):
+                from_votes = system(2, candidates, deepcopy(votes), weight=0.5)
+                from_ballots = system(2, candidates, Ballots(votes), weight=0.5)
+                self.assertEqual(
+                    [c.id for c in from_votes], [c.id for c in from_ballots]
+                )
+
+
+@unittest.skipUnless(importlib.util.find_spec("numpy"), "requires NumPy")
+class RankMatrixTest(unittest.TestCase):
+    candidates = [Candidate(str(i)) for i in range(5)]
+    ballots = Ballots(
+        [
+            Vote(["0", "2", "1"]),
+            Vote(["3", "2"]),
+            Vote(["0", "2", "1"]),
+            Vote(["4", "1", "0", "2"]),
+            Vote(["2", "0"]),
+            Vote(["3", "2"]),
+            Vote(["1"]),
+        ]
+    )
+
+    def test_round_trip(self):
+        matrix = RankMatrix(self.ballots, self.candidates)
+        self.assertEqual(list(matrix), list(self.ballots))
+        self.assertEqual(len(matrix), len(self.ballots))
+        self.assertEqual(matrix.ranks.shape, (5, 4))
+
+    def test_shards(self):
+        matrix = RankMatrix(self.ballots, self.candidates)
+        shards = matrix.shards(2)
+        self.assertEqual(len(shards), 2)
+        self.assertEqual([r for s in shards for r in s], list(matrix))
+        self.assertEqual(sum(len(s) for s in shards), len(matrix))
+
+    @mock.patch("votecount.parallel._MIN_SHARD_SIZE", 1)
+    def test_jobs(self):
+        matrix = RankMatrix(self.ballots, self.candidates)
+        for system in [stv, stv_repeat, condorcet]:
+            with self.subTest(system=system.__name__):
+                self.assertEqual(
+                    [str(c) for c in system(2, self.candidates, matrix, jobs=2)],
+                    [str(c) for c in system(2, self.candidates, matrix)],
+                )
+
+    def test_same_results_as_ballots(self):
+        matrix = RankMatrix(self.ballots, self.candidates)
+        for system in [
+            stv,
+            stv_repeat,
+            borda,
+            borda_even,
+            borda_exp,
+            condorcet,
+            dowdall,
+        ]:
+            for num_seats in [1, 2, 3]:
+                with self.subTest(system=system.__name__, num_seats=num_seats):
+                    from_ballots = system(
+                        num_seats, self.candidates, self.ballots, weight=0.5
+                    )
+                    from_matrix = system(num_seats, self.candidates, matrix, weight=0.5)
+                    self.assertEqual(
+                        [(c.id, getattr(c, "points", None)) for c in from_ballots],
+                        [(c.id, getattr(c, "points", None)) for c in from_matrix],
+                    )
+
+    def test_candidates_missing_from_matrix(self):
+        matrix = RankMatrix(self.ballots, self.candidates)
+        # Ranked by no vote, and so not interned by the matrix
+        candidates = self.candidates + [Candidate("5"), Candidate("6")]
+        for system in [borda, dowdall, borda_even]:
+            with self.subTest(system=system.__name__):
+                self.assertEqual(
+                    [(c.id, c.points) for c in system(2, candidates, matrix)],
+                    [(c.id, c.points) for c in system(2, candidates, self.ballots)],
+                )
+
+    def test_stv_candidates_missing_from_matrix(self):
+        matrix = RankMatrix(self.ballots, self.candidates)
+        candidates = self.candidates + [Candidate("5")]
+        for system in [stv, stv_repeat]:
+            with self.subTest(system=system.__name__):
+                self.assertEqual(
+                    [c.id for c in system(3, candidates, matrix)],
+                    [c.id for c in system(3, candidates, self.ballots)],
+                )
+
 
 if __name__ == "__main__":
     unittest.main()
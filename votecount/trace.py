@@ -0,0 +1,79 @@
+"""Structured record of how a count arrived at its result.
+
+Counting functions take an optional trace and only build events when one is
+given, so counting without a trace costs nothing. Each event keeps its data
+along with a function rendering it as the --explain text.
+"""
+
+import typing
+from copy import copy
+
+
+class Event(typing.NamedTuple):
+    kind: str
+    data: typing.Dict[str, typing.Any]
+    render: typing.Callable[..., typing.Optional[str]]
+
+    def text(self) -> typing.Optional[str]:
+        """The event as --explain text, or None if it isn't shown there."""
+        return self.render(**self.data)
+
+
+class Trace:
+    """Records the events of a count, e.g. round standings, transfers,
+    eliminations and condorcet pairings, to be inspected or rendered later.
+
+    Standings reported per vote, which would otherwise make up almost all of the
+    events of a large count, are only recorded every sample_every votes.
+    """
+
+    def __init__(self, sample_every=1):
+        self.sample_every = sample_every
+        self.events: typing.List[Event] = []
+
+    def record(self, kind, render, **data):
+        self._add(Event(kind, data, render))
+
+    def _add(self, event: Event):
+        self.events.append(event)
+
+    def sample(self, vote_nr_before, vote_nr) -> bool:
+        """Whether counting the votes after vote_nr_before up to vote_nr reaches
+        the next vote at which to record standings.
+        """
+
+        return vote_nr // self.sample_every > vote_nr_before // self.sample_every
+
+    def render(self) -> str:
+        return "\n".join(
+            text for text in (event.text() for event in self.events) if text is not None
+        )
+
+
+class PrintTrace(Trace):
+    """Prints each event as it is recorded instead of keeping it."""
+
+    def _add(self, event: Event):
+        text = event.text()
+        if text is not None:
+            print(text)
+
+
+def get_trace(do_explain, trace: typing.Optional[Trace]) -> typing.Optional[Trace]:
+    """The trace to record to: the given one, or one printing right away if only
+    do_explain is set.
+    """
+
+    if trace is None and do_explain:
+        return PrintTrace()
+    return trace
+
+
+def snapshot(candidates: typing.Iterable[typing.Any]) -> list:
+    """Copies of candidates as they are now, since counting keeps changing them."""
+    return [copy(c) for c in candidates]
+
+
+def lines(header: str, candidates: typing.Iterable[typing.Any]) -> str:
+    """Render a header followed by one indented line per candidate."""
+    return "\n".join([header] + [f"\t{c}" for c in candidates])